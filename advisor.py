@@ -0,0 +1,517 @@
+import argparse
+import configparser
+import logging
+import re
+import time
+import zlib
+from collections import Counter
+
+import psycopg2
+
+import dialect
+from loader import table_columns
+from splitter import node_slices, skew, slice_count
+from sql_queries import analytical_queries, create_table_queries
+
+# column types encoded with AZ64, the others with ZSTD
+# (More: https://docs.aws.amazon.com/redshift/latest/dg/c_Compression_encodings.html)
+_az64_types = {
+    "SMALLINT",
+    "INTEGER",
+    "BIGINT",
+    "NUMERIC",
+    "DECIMAL",
+    "DATE",
+    "TIMESTAMP",
+    "TIMESTAMPTZ",
+}
+
+_table_name = re.compile(r"CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)", re.I)
+# the alias is looked ahead, not to take the JOIN keyword of the next table
+_table_alias = re.compile(
+    r"\b(?:FROM|JOIN)\s+(\w+)(?=(?:\s+(?:AS\s+)?(\w+))?)", re.I
+)
+_join_pair = re.compile(r"\b(\w+)\.(\w+)\s*=\s*(\w+)\.(\w+)")
+_range_filter = re.compile(r"\b(\w+)\.(\w+)\s*(?:>=|<=|>|<|BETWEEN\b)", re.I)
+_keywords = {"ON", "WHERE", "JOIN", "GROUP", "ORDER", "LIMIT", "INNER", "LEFT"}
+
+# Redshift table attributes and column attributes replaced by the advice
+_column_attributes = re.compile(r"\s+(?:DISTKEY|SORTKEY|ENCODE\s+\w+)\b", re.I)
+_column_line = re.compile(r"^(\s+)(\w+)(\s+.*?)(,?)$")
+
+design_schema = "advisor_design"
+
+
+def insert_columns(create_query):
+    """
+    Description: This function is responsible for listing the columns
+    of a table definition that can be set by an insert, as identity
+    columns can not be set on Redshift.
+
+    Arguments:
+        create_query (str, required): CREATE TABLE statement.
+
+    Returns:
+        list: Column names, in the table order.
+    """
+    lines = create_query.strip("\n").split("\n")[1:-1]
+    return [
+        match.group(2)
+        for match in map(_column_line.match, lines)
+        if match is not None and "IDENTITY" not in match.group(3).upper()
+    ]
+
+
+def table_name(create_query):
+    """
+    Description: This function is responsible for reading the
+    table name of a table definition.
+
+    Arguments:
+        create_query (str, required): CREATE TABLE statement.
+
+    Returns:
+        str: The table name.
+    """
+    return _table_name.search(create_query).group(1)
+
+
+def workload_usage(queries):
+    """
+    Description: This function is responsible for finding how the
+    workload uses the table columns: the columns joined (and to which
+    column of which table) and the columns filtered by ranges.
+
+    Arguments:
+        queries (list, required): (name, query) tuples.
+
+    Returns:
+        dict: 'joins' Counter of (table, column, table, column) and
+        'ranges' Counter of (table, column).
+    """
+    joins, ranges = Counter(), Counter()
+
+    for _, query in queries:
+        aliases = {}
+        for table, alias in _table_alias.findall(query):
+            aliases[table] = table
+            if alias and alias.upper() not in _keywords:
+                aliases[alias] = table
+
+        for alias, column, other_alias, other_column in _join_pair.findall(query):
+            if alias in aliases and other_alias in aliases:
+                left = (aliases[alias], column)
+                right = (aliases[other_alias], other_column)
+                joins[left + right] += 1
+                joins[right + left] += 1
+
+        for alias, column in _range_filter.findall(query):
+            if alias in aliases:
+                ranges[(aliases[alias], column)] += 1
+
+    return {"joins": joins, "ranges": ranges}
+
+
+def slice_skew(values, slices):
+    """
+    Description: This function is responsible for estimating the skew of
+    a table distributed by a column: rows are hashed to slices by their
+    value (nulls all land on the same slice) and the largest slice is
+    compared with the average one.
+
+    Arguments:
+        values (list, required): Sampled column values.
+        slices (int, required): Number of slices of the cluster.
+
+    Returns:
+        float: The estimated skew (1.0 for an even distribution).
+    """
+    rows = [0] * slices
+    for value in values:
+        rows[zlib.crc32(str(value).encode("UTF-8")) % slices] += 1
+
+    return skew(rows)
+
+
+def compression_ratio(values):
+    """
+    Description: This function is responsible for estimating how much
+    a column compresses, compressing its sampled values with zlib as a
+    stand-in for the Redshift encodings.
+
+    Arguments:
+        values (list, required): Sampled column values.
+
+    Returns:
+        float: Raw bytes over compressed bytes.
+    """
+    raw = "\n".join("" if value is None else str(value) for value in values)
+    raw = raw.encode("UTF-8")
+    if not raw:
+        return 1.0
+
+    return len(raw) / len(zlib.compress(raw, 6))
+
+
+def sample_table(cur, create_query, slices, sample_rows):
+    """
+    Description: This function is responsible for sampling a table and
+    computing the statistics of its columns.
+
+    Arguments:
+        cur: the cursor object.
+        create_query (str, required): CREATE TABLE statement of the table.
+        slices (int, required): Number of slices of the cluster.
+        sample_rows (int, required): Maximum number of sampled rows.
+
+    Returns:
+        dict: The table rows count, column types and column statistics
+        (distinct values, null fraction, skew and compression ratio).
+    """
+    table = table_name(create_query)
+    columns = [
+        (name.lower(), sql_type)
+        for name, sql_type, _, _ in table_columns(create_query)
+    ]
+
+    cur.execute("SELECT COUNT(*) FROM %s" % table)
+    rows = cur.fetchone()[0]
+
+    cur.execute(
+        "SELECT %s FROM %s ORDER BY RANDOM() LIMIT %d"
+        % (", ".join(name for name, _ in columns), table, sample_rows)
+    )
+    sample = cur.fetchall()
+
+    stats = {}
+    for index, (name, _) in enumerate(columns):
+        values = [row[index] for row in sample]
+        stats[name] = {
+            "distinct": len(set(values)),
+            "null_fraction": (
+                sum(value is None for value in values) / len(values) if values else 0.0
+            ),
+            "skew": slice_skew(values, slices) if values else 1.0,
+            "compression": compression_ratio(values),
+        }
+
+    return {"rows": rows, "types": dict(columns), "columns": stats}
+
+
+def advise(tables, usage, all_max_rows=1000000, max_skew=1.2):
+    """
+    Description: This function is responsible for choosing the physical
+    design of each table from its statistics and the workload usage:
+        * tables joined to most others are facts, the others dimensions;
+        * dimensions up to all_max_rows are copied to every node (ALL);
+        * a fact is distributed by its join column to the largest dimension
+          not copied to every node, co-locating both, when neither side is
+          skewed above max_skew. Otherwise it is distributed EVEN;
+        * columns filtered by ranges lead the sort key, else the
+          distribution or join column;
+        * the leading sort key column is not compressed, AZ64 is used for
+          numbers and times and ZSTD for text that compresses.
+
+    Arguments:
+        tables (dict, required): Samples of each table, by table name.
+        usage (dict, required): Workload usage, as returned by workload_usage.
+        all_max_rows (int, optional): Largest dimension copied to every node.
+        max_skew (float, optional): Largest skew accepted for a distribution key.
+
+    Returns:
+        dict: The design of each table ('diststyle', 'distkey', 'sortkey',
+        'encodings' and the 'reasons' of each choice), by table name.
+    """
+    joins = [
+        join for join in usage["joins"] if join[0] in tables and join[2] in tables
+    ]
+    partners = {
+        table: {join[2] for join in joins if join[0] == table} for table in tables
+    }
+
+    most_partners = max(len(partners[table]) for table in tables)
+    facts = [
+        table
+        for table in tables
+        if most_partners > 1 and len(partners[table]) == most_partners
+    ]
+
+    designs = {
+        table: {
+            "diststyle": "EVEN",
+            "distkey": None,
+            "sortkey": [],
+            "encodings": {},
+            "reasons": [],
+        }
+        for table in tables
+    }
+
+    # dimensions small enough to be copied to every node
+    for table in tables:
+        if table not in facts and tables[table]["rows"] <= all_max_rows:
+            designs[table]["diststyle"] = "ALL"
+            designs[table]["reasons"].append(
+                "ALL: %d rows <= %d." % (tables[table]["rows"], all_max_rows)
+            )
+
+    # facts co-located with their largest distributed dimension
+    for fact in facts:
+        candidates = sorted(
+            (
+                (tables[dimension]["rows"], column, dimension, dimension_column)
+                for table, column, dimension, dimension_column in joins
+                if table == fact and designs[dimension]["diststyle"] != "ALL"
+            ),
+            reverse=True,
+        )
+        for rows, column, dimension, dimension_column in candidates:
+            fact_skew = tables[fact]["columns"][column]["skew"]
+            dimension_skew = tables[dimension]["columns"][dimension_column]["skew"]
+            if max(fact_skew, dimension_skew) > max_skew:
+                designs[fact]["reasons"].append(
+                    "not KEY (%s): skew %.2f / %.2f."
+                    % (column, fact_skew, dimension_skew)
+                )
+                continue
+
+            designs[fact].update(diststyle="KEY", distkey=column)
+            designs[dimension].update(diststyle="KEY", distkey=dimension_column)
+            designs[fact]["reasons"].append(
+                "KEY (%s): co-located with %s (%d rows), skew %.2f."
+                % (column, dimension, rows, fact_skew)
+            )
+            designs[dimension]["reasons"].append(
+                "KEY (%s): co-located with %s." % (dimension_column, fact)
+            )
+            break
+
+        else:
+            designs[fact]["reasons"].append("EVEN: no dimension to co-locate with.")
+
+    for table, design in designs.items():
+        # range filters first, then the column rows are looked up by
+        ranges = [
+            column
+            for (range_table, column), _ in usage["ranges"].most_common()
+            if range_table == table
+        ]
+        joined = [
+            column
+            for (join_table, column, _, _), _ in usage["joins"].most_common()
+            if join_table == table
+        ]
+        if ranges:
+            design["sortkey"] = ranges[:2]
+            design["reasons"].append(
+                "SORTKEY (%s): range filters." % ", ".join(ranges[:2])
+            )
+        elif design["distkey"] or joined:
+            design["sortkey"] = [design["distkey"] or joined[0]]
+            design["reasons"].append("SORTKEY (%s): joins." % design["sortkey"][0])
+
+        for column, sql_type in tables[table]["types"].items():
+            if design["sortkey"] and column == design["sortkey"][0]:
+                encoding = "RAW"
+            elif sql_type in _az64_types:
+                encoding = "AZ64"
+            elif tables[table]["columns"][column]["compression"] < 1.1:
+                encoding = "RAW"
+            else:
+                encoding = "ZSTD"
+            design["encodings"][column] = encoding
+
+    return designs
+
+
+def advised_ddl(create_query, design):
+    """
+    Description: This function is responsible for rewriting a table
+    definition with the advised distribution, sort key and encodings.
+
+    Arguments:
+        create_query (str, required): CREATE TABLE statement.
+        design (dict, required): The table design, as returned by advise.
+
+    Returns:
+        str: The advised CREATE TABLE statement.
+    """
+    lines = create_query.strip("\n").split("\n")
+
+    for index, line in enumerate(lines[1:-1], 1):
+        match = _column_line.match(line)
+        if match is None:
+            continue
+
+        indent, column, definition, comma = match.groups()
+        definition = _column_attributes.sub("", definition)
+        encoding = design["encodings"].get(column.lower())
+        if encoding:
+            definition += " ENCODE %s" % encoding
+        lines[index] = "%s%s%s%s" % (indent, column, definition, comma)
+
+    attributes = "DISTSTYLE %s" % design["diststyle"]
+    if design["distkey"]:
+        attributes += " DISTKEY (%s)" % design["distkey"]
+    if design["sortkey"]:
+        attributes += " SORTKEY (%s)" % ", ".join(design["sortkey"])
+    lines[-1] = ") %s" % attributes
+
+    return "\n%s\n" % "\n".join(lines)
+
+
+def run_workload(cur, queries, repeats=3):
+    """
+    Description: This function is responsible for timing the queries of
+    the workload, keeping the best of some runs of each one.
+
+    Arguments:
+        cur: the cursor object.
+        queries (list, required): (name, query) tuples.
+        repeats (int, optional): Runs of each query.
+
+    Returns:
+        dict: Best wall time in seconds, by query name.
+    """
+    timings = {}
+    for name, query in queries:
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            cur.execute(query)
+            cur.fetchall()
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        timings[name] = best
+
+    return timings
+
+
+def benchmark(conn, cur, ddls, queries, target, repeats=3):
+    """
+    Description: This function is responsible for comparing the workload
+    on the current tables with the workload on copies of them built with
+    the advised design, in the 'advisor_design' schema dropped at the end.
+
+    Arguments:
+        conn: connection to the database.
+        cur: the cursor object.
+        ddls (list, required): (table, current DDL, advised DDL) tuples, in
+        the 'create_table_queries' order.
+        queries (list, required): (name, query) tuples.
+        target (str, required): Database kind ('redshift' or 'postgres').
+        repeats (int, optional): Runs of each query.
+
+    Returns:
+        dict: (before, after) wall times, by query name.
+    """
+    # cached results would hide the design
+    if target == "redshift":
+        cur.execute("SET enable_result_cache_for_session TO off")
+
+    before = run_workload(cur, queries, repeats)
+
+    try:
+        cur.execute("DROP SCHEMA IF EXISTS %s CASCADE" % design_schema)
+        cur.execute("CREATE SCHEMA %s" % design_schema)
+        cur.execute("SET search_path TO %s, public" % design_schema)
+
+        for table, current_ddl, ddl in ddls:
+            columns = ", ".join(insert_columns(current_ddl))
+            cur.execute(ddl)
+            cur.execute(
+                "INSERT INTO %s (%s) SELECT %s FROM public.%s"
+                % (table, columns, columns, table)
+            )
+            cur.execute("ANALYZE %s" % table)
+        conn.commit()
+
+        after = run_workload(cur, queries, repeats)
+
+    finally:
+        conn.rollback()
+        cur.execute("SET search_path TO public")
+        cur.execute("DROP SCHEMA IF EXISTS %s CASCADE" % design_schema)
+        conn.commit()
+
+    return {name: (before[name], after[name]) for name in before}
+
+
+def main(
+    config_path="dwh.cfg", sample_rows=100000, all_max_rows=1000000, run_benchmark=False
+):
+    """
+    Description: This function is responsible for sampling the star schema
+    tables, advising their physical design for the analytical workload and
+    printing the advised DDL and, optionally, the workload before/after
+    benchmark.
+
+    Arguments:
+        config_path (str, optional): Configuration file path.
+        sample_rows (int, optional): Maximum number of sampled rows by table.
+        all_max_rows (int, optional): Largest dimension copied to every node.
+        run_benchmark (bool, optional): Benchmark the advised design.
+
+    Returns:
+        list: (table, current DDL, advised DDL) tuples.
+    """
+
+    # loading configurations
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    target = config["ETL"]["TARGET"]
+
+    # stv_slices is just available on redshift
+    slices = slice_count(config) if target == "redshift" else node_slices(config)
+
+    # connecting to the database
+    conn = psycopg2.connect(
+        "host={} dbname={} user={} password={} port={}".format(*config["DB"].values())
+    )
+    cur = dialect.cursor(conn, target)
+
+    usage = workload_usage(analytical_queries)
+    tables = {
+        table_name(query): sample_table(cur, query, slices, sample_rows)
+        for query in create_table_queries
+    }
+    designs = advise(tables, usage, all_max_rows)
+
+    ddls = []
+    for query in create_table_queries:
+        table = table_name(query)
+        for reason in designs[table]["reasons"]:
+            logging.info("Advisor: %s %s" % (table, reason))
+        ddls.append((table, query, advised_ddl(query, designs[table])))
+        print(ddls[-1][2])
+
+    if run_benchmark:
+        results = benchmark(conn, cur, ddls, analytical_queries, target)
+
+        print("%-20s %10s %10s %8s" % ("query", "before", "after", "speedup"))
+        for name, (before, after) in results.items():
+            speedup = before / after if after else 0.0
+            print("%-20s %10.3f %10.3f %7.2fx" % (name, before, after, speedup))
+
+    conn.close()
+
+    return ddls
+
+
+if __name__ == "__main__":
+    # set logging
+    logging.root.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Sparkify table design advisor.")
+    parser.add_argument("--config", default="dwh.cfg", help="configuration file")
+    parser.add_argument("--sample-rows", type=int, default=100000)
+    parser.add_argument("--all-max-rows", type=int, default=1000000)
+    parser.add_argument(
+        "--benchmark",
+        action="store_true",
+        help="time the analytical queries before and after the advice",
+    )
+    args = parser.parse_args()
+
+    main(args.config, args.sample_rows, args.all_max_rows, args.benchmark)
@@ -11,35 +11,37 @@ def aws_function(arg, *params):
         up: For setting the cluster up.
         down: For setting the cluster down.
         bucket_delete: For deleting a bucket.
+        wlm: For applying the WLM parameter group to the cluster.
+        resize: For resizing the cluster to a number of nodes.
+        pause: For pausing the cluster.
+        resume: For resuming the paused cluster.
+        snapshot: For taking a manual snapshot of the cluster.
+        restore: For creating the cluster from a snapshot (the latest
+        manual one when not given).
 
     Usage:
         python aws.py up
         python aws.py down
         python aws.py bucket_delete [bucket name]
+        python aws.py wlm
+        python aws.py resize [number of nodes]
+        python aws.py pause
+        python aws.py resume
+        python aws.py snapshot [snapshot name]
+        python aws.py restore [snapshot name]
 
     """
     filepath = os.path.join(os.path.abspath(os.getcwd()), "dwh.cfg")
     cl = MyCluster(filepath)
 
     if arg == "up":
-        cl.sparkifydwh_role_create()
-        cl.update_role_config()
-        cl.redshift_cluster_create()
-
-        bucket_jsonpaths = cl.bucket_jsonpaths_get_or_create()
-        cl.songs_jsonpaths_upload(bucket_jsonpaths)
-        cl.update_song_jsonpath_config(bucket_jsonpaths)
-
-        cluster_status, cluster_props = cl.redshift_cluster_wait()
-
-        if cluster_status == "available":
-            cl.authorize_ingress(cluster_props["VpcId"])
-            cl.update_db_config(cluster_props["Endpoint"]["Address"])
+        cl.provision()
 
     elif arg == "down":
         cl.redshift_cluster_delete()
         cl.redshift_cluster_wait()
         cl.sparkifydwh_role_delete()
+        cl.parameter_group_delete()
 
     elif arg == "bucket_delete":
         if len(params):
@@ -47,13 +49,44 @@ def aws_function(arg, *params):
         else:
             print(aws_function.__doc__)
 
+    elif arg == "wlm":
+        cl.parameter_group_apply()
+
+    elif arg == "resize":
+        if len(params):
+            cl.redshift_cluster_resize(int(params[0]))
+        else:
+            print(aws_function.__doc__)
+
+    elif arg == "pause":
+        cl.redshift_cluster_pause()
+
+    elif arg == "resume":
+        cl.redshift_cluster_resume()
+
+    elif arg == "snapshot":
+        cl.snapshot_create(*params[:1])
+
+    elif arg == "restore":
+        cl.redshift_cluster_restore(*params[:1])
+
 
 if __name__ == "__main__":
     if len(sys.argv) == 1:
         print(aws_function.__doc__)
         exit(0)
 
-    if sys.argv[1] not in ["up", "down", "bucket_delete"]:
+    if sys.argv[1] not in [
+        "up",
+        "down",
+        "bucket_delete",
+        "wlm",
+        "resize",
+        "pause",
+        "resume",
+        "snapshot",
+        "restore",
+    ]:
         print(aws_function.__doc__)
 
     else:
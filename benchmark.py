@@ -0,0 +1,340 @@
+import argparse
+import configparser
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import psycopg2
+
+import create_tables
+import dialect
+import etl
+from execution import TransactionRunner, runner_from_config
+from jsonstream import reader_throughput
+from loader import local_objects, numeric_columns, staging_sources
+from loader import stream_staging_tables
+from sql_queries import time_table_insert
+from synthetic import write_dataset
+from transform import load_times
+
+# the times derivation of the SQL path, from the staged events
+times_sql_insert = (
+    time_table_insert.replace("INSERT INTO times", "INSERT INTO times_sql")
+    .replace(
+        "FROM songplays",
+        "FROM (SELECT TIMESTAMP 'epoch' + ts / 1000 * interval '1 second' "
+        "AS start_time FROM staging_events WHERE ts IS NOT NULL) AS staged",
+    )
+    .replace("SELECT * FROM times", "SELECT * FROM times_sql")
+)
+
+
+def throughput_report(records):
+    """
+    Description: This function is responsible for summarizing the rows
+    per second of each insert statement of an ETL run.
+
+    Arguments:
+        records (list, required): Profiler records of the run.
+
+    Returns:
+        list: (statement, rows, seconds, rows per second) tuples.
+    """
+    report = []
+    for record in records:
+        if not record["step"].upper().startswith("INSERT INTO"):
+            continue
+
+        rows, seconds = max(record["rows"], 0), record["wall_time"]
+        rate = rows / seconds if seconds else 0.0
+        report.append((record["step"], rows, seconds, rate))
+
+    return report
+
+
+def run(config_path, parallel=False):
+    """
+    Description: This function is responsible for running the whole
+    pipeline (create_tables.main followed by etl.main) against the
+    database set in the configuration file, usually a local PostgreSQL
+    stand-in ('[ETL] target = postgres') loading the synthetic dataset
+    from '[ETL] local_data'. Serial runs send each statement on its own
+    round trip, whatever '[ETL] batch_statements', so each insert gets
+    a profiler record of its own.
+
+    Arguments:
+        config_path (str, required): Configuration file path.
+        parallel (bool, optional): Run the ETL in parallel mode.
+
+    Returns:
+        list: (statement, rows, seconds, rows per second) tuples.
+    """
+    runner = TransactionRunner()
+
+    start = time.perf_counter()
+    create_tables.main(config_path=config_path, runner=runner)
+    records = etl.main(parallel=parallel, config_path=config_path, runner=runner)
+    elapsed = time.perf_counter() - start
+
+    report = throughput_report(records)
+
+    print("%-30s %12s %10s %12s" % ("statement", "rows", "seconds", "rows/s"))
+    for step, rows, seconds, rate in report:
+        print("%-30s %12d %10.3f %12.0f" % (step, rows, seconds, rate))
+    print("pipeline done in %.2fs" % elapsed)
+
+    return report
+
+
+def compare_execution(config_path):
+    """
+    Description: This function is responsible for running the whole
+    serial pipeline twice, first committing each statement on its own
+    round trip and then with the transactional units and batches set in
+    the 'ETL' configurations, and reporting the commits, round trips and
+    wall time of each run.
+
+    Arguments:
+        config_path (str, required): Configuration file path.
+
+    Returns:
+        list: (mode, commits, round trips, seconds) tuples.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+
+    report = []
+    for mode, runner in [
+        ("per statement", TransactionRunner()),
+        ("configured", runner_from_config(config)),
+    ]:
+        start = time.perf_counter()
+        create_tables.main(config_path=config_path, runner=runner)
+        etl.main(config_path=config_path, runner=runner)
+        elapsed = time.perf_counter() - start
+
+        report.append((mode, runner.commits, runner.round_trips, elapsed))
+
+    print("%-15s %10s %12s %10s" % ("mode", "commits", "round trips", "seconds"))
+    for mode, commits, round_trips, seconds in report:
+        print("%-15s %10d %12d %10.3f" % (mode, commits, round_trips, seconds))
+
+    return report
+
+
+def compare_transform(config_path):
+    """
+    Description: This function is responsible for streaming the local
+    data into the staging tables and deriving the times dimension twice
+    from the staged events, first with the SQL statement and then with
+    the local vectorized transform, reporting the rows and wall time of
+    each derivation.
+
+    Arguments:
+        config_path (str, required): Configuration file path
+        ('[ETL] local_data' set).
+
+    Returns:
+        list: (mode, rows, seconds) tuples.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+
+    conn = psycopg2.connect(
+        "host={} dbname={} user={} password={} port={}".format(
+            *config["DB"].values()
+        )
+    )
+    cur = dialect.cursor(conn, config["ETL"]["TARGET"])
+
+    etl.create_staging_tables(cur, conn)
+    stream_staging_tables(conn, config)
+    for table in ["times_sql", "times_local_bench"]:
+        cur.execute("CREATE TEMPORARY TABLE %s (LIKE times)" % table)
+    conn.commit()
+
+    start = time.perf_counter()
+    cur.execute(times_sql_insert)
+    rows = cur.rowcount
+    conn.commit()
+    report = [("sql", rows, time.perf_counter() - start)]
+
+    start = time.perf_counter()
+    rows = load_times(cur, conn, target="times_local_bench")
+    report.append(("local", rows, time.perf_counter() - start))
+
+    conn.close()
+
+    print("%-10s %10s %10s" % ("mode", "rows", "seconds"))
+    for mode, rows, seconds in report:
+        print("%-10s %10d %10.3f" % (mode, rows, seconds))
+
+    return report
+
+
+def peak_rss_mb():
+    """
+    Description: This function is responsible for reading the peak
+    resident memory of the process. On Linux, it is the VmHWM of the
+    process memory, as ru_maxrss keeps the peak of the parent process
+    across fork and exec.
+
+    Arguments:
+        None
+
+    Returns:
+        float: The peak resident memory (MB).
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024
+
+
+def measure_source(source_dir, fields, numeric, batch_rows):
+    """
+    Description: This function is responsible for reading the JSON files
+    of a source with the streaming reader, in a process of its own, so the
+    peak resident memory reported is just the one of reading that source.
+
+    Arguments:
+        source_dir (str, required): Source folder (e.g. data/log_data).
+        fields (list, required): Staging table columns.
+        numeric (set, required): Numeric columns.
+        batch_rows (int, required): Maximum number of records in a batch.
+
+    Returns:
+        dict: The reader_throughput results and the peak RSS (MB).
+    """
+    result = reader_throughput(local_objects(source_dir), fields, numeric, batch_rows)
+    result["peak_rss_mb"] = peak_rss_mb()
+
+    return result
+
+
+def measure_reader(data_dir, batch_rows=50000):
+    """
+    Description: This function is responsible for reading the log_data and
+    song_data JSON files of a dataset with the streaming reader, reporting
+    the throughput and the peak resident memory of each source. Each source
+    is read by a new (spawned) process, as the peak resident memory is the
+    one of the whole process.
+
+    Arguments:
+        data_dir (str, required): Dataset folder, laid out as the
+        udacity-dend bucket.
+        batch_rows (int, optional): Maximum number of records in a batch.
+
+    Returns:
+        list: (source, MB, rows, MB/s, peak RSS MB) tuples.
+    """
+    # forked processes would start with the memory of this one
+    context = multiprocessing.get_context("spawn")
+
+    report = []
+    for table, folder, fields, create_query in staging_sources:
+        with context.Pool(1) as pool:
+            result = pool.apply(
+                measure_source,
+                (
+                    os.path.join(data_dir, folder),
+                    fields,
+                    numeric_columns(create_query),
+                    batch_rows,
+                ),
+            )
+        report.append(
+            (
+                folder,
+                result["bytes"] / (1 << 20),
+                result["rows"],
+                result["mb_per_second"],
+                result["peak_rss_mb"],
+            )
+        )
+
+    print("%-10s %10s %10s %10s %12s" % ("source", "MB", "rows", "MB/s", "peak RSS MB"))
+    for source, size, rows, speed, peak in report:
+        print("%-10s %10.1f %10d %10.1f %12.1f" % (source, size, rows, speed, peak))
+
+    return report
+
+
+if __name__ == "__main__":
+    # set logging
+    logging.root.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Sparkify ETL offline benchmark.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a synthetic dataset")
+    generate.add_argument("data_dir", help="output directory")
+    generate.add_argument("--events", type=int, default=10000)
+    generate.add_argument("--songs", type=int, default=None)
+    generate.add_argument("--artists", type=int, default=None)
+    generate.add_argument("--users", type=int, default=None)
+    generate.add_argument("--artist-skew", type=float, default=1.0)
+    generate.add_argument("--user-skew", type=float, default=1.0)
+    generate.add_argument("--days", type=int, default=30)
+    generate.add_argument("--songs-per-file", type=int, default=1)
+    generate.add_argument("--seed", type=int, default=0)
+
+    run_parser = commands.add_parser("run", help="run the pipeline and report rows/s")
+    run_parser.add_argument("--config", default="bench.cfg", help="configuration file")
+    run_parser.add_argument("--parallel", action="store_true", help="parallel ETL")
+
+    commits_parser = commands.add_parser(
+        "commits", help="compare per statement commits with transactional units"
+    )
+    commits_parser.add_argument(
+        "--config", default="bench.cfg", help="configuration file"
+    )
+
+    transform_parser = commands.add_parser(
+        "transform", help="compare the SQL and local times derivations"
+    )
+    transform_parser.add_argument(
+        "--config", default="bench.cfg", help="configuration file"
+    )
+
+    reader_parser = commands.add_parser(
+        "reader", help="measure the streaming JSON reader MB/s and peak memory"
+    )
+    reader_parser.add_argument("data_dir", help="dataset directory")
+    reader_parser.add_argument("--batch-rows", type=int, default=50000)
+
+    args = parser.parse_args()
+
+    if args.command == "generate":
+        print(
+            write_dataset(
+                args.data_dir,
+                num_events=args.events,
+                num_songs=args.songs,
+                num_artists=args.artists,
+                num_users=args.users,
+                artist_skew=args.artist_skew,
+                user_skew=args.user_skew,
+                days=args.days,
+                songs_per_file=args.songs_per_file,
+                seed=args.seed,
+            )
+        )
+    elif args.command == "commits":
+        compare_execution(args.config)
+    elif args.command == "transform":
+        compare_transform(args.config)
+    elif args.command == "reader":
+        measure_reader(args.data_dir, args.batch_rows)
+    else:
+        run(args.config, args.parallel)
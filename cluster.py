@@ -4,7 +4,12 @@ import boto3
 import json
 import uuid
 import logging
-from time import sleep
+import random
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from time import gmtime, monotonic, sleep, strftime
+
+from storage import with_retry
 
 
 class MyCluster:
@@ -14,6 +19,8 @@ class MyCluster:
     """
 
     _song_json_path = "song_json_path.json"
+    _manifest_prefix = "manifests"
+    _staging_prefix = "staging"
     _region_name = "us-west-2"
     _sparkifydwh_role_name = "sparkifydwh_role"
     _s3_read_only_arn = "arn:aws:iam::aws:policy/AmazonS3ReadOnlyAccess"
@@ -39,6 +46,10 @@ class MyCluster:
         config.read_file(open(filepath))
 
         self.config = config
+        self.cluster_identifier = config["DWH"]["CLUSTER_IDENTIFIER"].lower()
+
+        # provisioning steps running at the same time share the config file
+        self._config_lock = threading.Lock()
 
         # creating session
         session = boto3.session.Session(
@@ -87,6 +98,152 @@ class MyCluster:
         except Exception as error:
             logging.warning(error)
 
+    def wlm_configuration(self):
+        """
+        Description: This function is responsible for building the manual
+        WLM configuration declared in the 'WLM' section: a queue routed by
+        query group for the ETL, a queue for the analysts (by query group
+        or user group), the default queue with the memory left and, when
+        enabled, short query acceleration.
+
+        Arguments:
+            None
+
+        Returns:
+            list: The wlm_json_configuration queues.
+        """
+        wlm = self.config["WLM"]
+
+        etl_memory = int(wlm["ETL_MEMORY_PERCENT"])
+        analytics_memory = int(wlm["ANALYTICS_MEMORY_PERCENT"])
+        default_memory = 100 - etl_memory - analytics_memory
+        if default_memory <= 0:
+            raise ValueError(
+                "The ETL and analytics queues leave no memory to the default queue."
+            )
+
+        queues = [
+            {
+                "query_group": [wlm["ETL_QUERY_GROUP"]],
+                "user_group": [],
+                "query_concurrency": int(wlm["ETL_CONCURRENCY"]),
+                "memory_percent_to_use": etl_memory,
+                "concurrency_scaling": wlm["ETL_CONCURRENCY_SCALING"],
+            },
+            {
+                "query_group": [wlm["ANALYTICS_QUERY_GROUP"]],
+                "user_group": [
+                    group for group in [wlm["ANALYTICS_USER_GROUP"]] if group
+                ],
+                "query_concurrency": int(wlm["ANALYTICS_CONCURRENCY"]),
+                "memory_percent_to_use": analytics_memory,
+                "concurrency_scaling": wlm["ANALYTICS_CONCURRENCY_SCALING"],
+            },
+            # the default queue, the last one, runs everything else
+            {
+                "query_concurrency": int(wlm["DEFAULT_CONCURRENCY"]),
+                "memory_percent_to_use": default_memory,
+            },
+        ]
+
+        if wlm.getboolean("SHORT_QUERY_ACCELERATION"):
+            # 0 lets Redshift set the maximum runtime of short queries
+            queues.append(
+                {
+                    "short_query_queue": True,
+                    "max_execution_time": int(wlm["SHORT_QUERY_MAX_SECONDS"]) * 1000,
+                }
+            )
+
+        return queues
+
+    def parameter_group_create(self):
+        """
+        Description: This function is responsible for creating the cluster
+        parameter group set in the 'WLM' section, when it does not exist,
+        and setting its WLM configuration and concurrency scaling limit.
+        Failures other than an existing group are raised.
+
+        Arguments:
+            None
+
+        Returns:
+            list: The parameters set.
+        """
+        logging.info("AWS MyCluster: Creating parameter group.")
+
+        wlm, redshift_client = self.config["WLM"], self.redshift_client
+
+        try:
+            redshift_client.create_cluster_parameter_group(
+                ParameterGroupName=wlm["PARAMETER_GROUP"],
+                ParameterGroupFamily="redshift-1.0",
+                Description="Sparkify ETL and analytics workload management",
+            )
+        except redshift_client.exceptions.ClusterParameterGroupAlreadyExistsFault:
+            # as the group already exists, just its parameters are set
+            logging.info("AWS MyCluster: Parameter group already exists.")
+
+        parameters = [
+            {
+                "ParameterName": "wlm_json_configuration",
+                "ParameterValue": json.dumps(self.wlm_configuration()),
+                "ApplyType": "static",
+            },
+            {
+                "ParameterName": "max_concurrency_scaling_clusters",
+                "ParameterValue": wlm["MAX_CONCURRENCY_SCALING_CLUSTERS"],
+                "ApplyType": "dynamic",
+            },
+        ]
+
+        redshift_client.modify_cluster_parameter_group(
+            ParameterGroupName=wlm["PARAMETER_GROUP"], Parameters=parameters
+        )
+
+        return parameters
+
+    def parameter_group_apply(self):
+        """
+        Description: This function is responsible for setting the parameter
+        group up and attaching it to the existing cluster. The WLM queues
+        are static parameters, so they take effect after the next reboot.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+        """
+        self.parameter_group_create()
+
+        logging.info("AWS MyCluster: Attaching parameter group.")
+
+        self.redshift_client.modify_cluster(
+            ClusterIdentifier=self.cluster_identifier,
+            ClusterParameterGroupName=self.config["WLM"]["PARAMETER_GROUP"],
+        )
+
+    def parameter_group_delete(self):
+        """
+        Description: This function is responsible for deleting the cluster
+        parameter group, once no cluster uses it.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+        """
+        logging.info("AWS MyCluster: Deleting parameter group.")
+
+        try:
+            self.redshift_client.delete_cluster_parameter_group(
+                ParameterGroupName=self.config["WLM"]["PARAMETER_GROUP"]
+            )
+        except Exception as error:
+            logging.warning(error)
+
     def redshift_cluster_create(self):
         """
         Description: This function is responsible for creating
@@ -107,12 +264,13 @@ class MyCluster:
         # setting new cluster params
         params = {
             "NodeType": config["DWH"]["NODE_TYPE"],
-            "ClusterIdentifier": config["DWH"]["CLUSTER_IDENTIFIER"],
+            "ClusterIdentifier": self.cluster_identifier,
             "DBName": config["DB"]["DBNAME"],
             "Port": int(config["DB"]["PORT"]),
             "MasterUsername": config["DB"]["USER"],
             "MasterUserPassword": config["DB"]["PASSWORD"],
             "IamRoles": [config["IAM_ROLE"]["ARN"]],
+            "ClusterParameterGroupName": config["WLM"]["PARAMETER_GROUP"],
         }
 
         NUM_NODES = int(config["DWH"]["NUM_NODES"])
@@ -123,6 +281,7 @@ class MyCluster:
             params["ClusterType"] = "single-node"
 
         # creating cluster
+        resp = None
         try:
             resp = redshift_client.create_cluster(**params)
         except Exception as error:
@@ -202,6 +361,21 @@ class MyCluster:
         # deleting role
         iam_client.delete_role(RoleName=role_name)
 
+    def save_config(self):
+        """
+        Description: This function is responsible for saving the
+        configurations to the file, one writer at a time.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+        """
+        with self._config_lock:
+            with open(self.filepath, "w") as config_file:
+                self.config.write(config_file)
+
     def update_role_config(self):
         """
         Description: This function is responsible for updating
@@ -228,7 +402,7 @@ class MyCluster:
             self.config["IAM_ROLE"]["ARN"] = ""
 
         # saving new configurations to the file
-        self.config.write(open(self.filepath, "w"))
+        self.save_config()
 
     def update_db_config(self, host):
         """
@@ -244,12 +418,13 @@ class MyCluster:
         logging.info("AWS MyCluster: Updating config file (DB HOST).")
 
         self.config["DB"]["HOST"] = host
-        self.config.write(open(self.filepath, "w"))
+        self.save_config()
 
     def update_song_jsonpath_config(self, bucket):
         """
         Description: This function is responsible for updating
-        the song jsonpath information in the configuration file.
+        the song jsonpath and the load manifests information in the
+        configuration file.
 
         Arguments:
             bucket (str, required): Bucket name.
@@ -263,8 +438,16 @@ class MyCluster:
             bucket,
             self._song_json_path,
         )
+        self.config["S3"]["MANIFEST_PREFIX"] = "s3://%s/%s" % (
+            bucket,
+            self._manifest_prefix,
+        )
+        self.config["S3"]["STAGING_PREFIX"] = "s3://%s/%s" % (
+            bucket,
+            self._staging_prefix,
+        )
 
-        self.config.write(open(self.filepath, "w"))
+        self.save_config()
 
     def get_cluster_status(self):
         """
@@ -283,7 +466,7 @@ class MyCluster:
         try:
             # looking for the cluster on aws
             resp = self.redshift_client.describe_clusters(
-                ClusterIdentifier="dwhcluster"
+                ClusterIdentifier=self.cluster_identifier
             )
 
             return resp["Clusters"][0]["ClusterStatus"], resp["Clusters"][0]
@@ -291,13 +474,17 @@ class MyCluster:
         except self.redshift_client.exceptions.ClusterNotFoundFault as error:
             return "NotFound", None
 
-    def redshift_cluster_wait(self):
+    def redshift_cluster_wait(self, timeout=1800, delay=2.0, max_delay=30.0):
         """
         Description: This function is responsible for waiting for a redshift
-        cluster status change while the status is in transition.
+        cluster status change while the status is in transition. The status
+        is polled with exponential backoff and full jitter, so a cluster
+        ready early is noticed early, and never more than max_delay apart.
 
         Arguments:
-            None
+            timeout (float, optional): Maximum waiting time in seconds.
+            delay (float, optional): Base polling delay in seconds.
+            max_delay (float, optional): Maximum polling delay in seconds.
 
         Returns:
             (str, dict): Return the cluster status and the
@@ -305,18 +492,130 @@ class MyCluster:
         """
         logging.info("AWS MyCluster: Checking if cluster is in transition state.")
 
+        deadline = monotonic() + timeout
+
         # getting cluster status
         cluster_status, cluster_props = self.get_cluster_status()
         logging.info("AWS MyCluster: Status returned '%s'." % cluster_status)
 
         # check for transition states
-        while cluster_status in ["creating", "deleting"]:
-            sleep(30)
+        attempt = 0
+        while cluster_status in [
+            "creating",
+            "deleting",
+            "modifying",
+            "resizing",
+            "rebooting",
+            "pausing",
+            "resuming",
+        ]:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError(
+                    "Cluster %s still '%s' after %ds."
+                    % (self.cluster_identifier, cluster_status, timeout)
+                )
+
+            backoff = random.uniform(0, min(max_delay, delay * 2 ** attempt))
+            sleep(min(remaining, backoff))
+            attempt += 1
+
             cluster_status, cluster_props = self.get_cluster_status()
             logging.info("AWS MyCluster: Status returned '%s'." % cluster_status)
 
         return cluster_status, cluster_props
 
+    def redshift_cluster_wait_change(
+        self, status, timeout=600, delay=2.0, max_delay=30.0
+    ):
+        """
+        Description: This function is responsible for waiting for the
+        redshift cluster to leave a status after a request, as the status
+        it reports may not change right away (e.g. still 'available' just
+        after a resize was requested). The status is polled with
+        exponential backoff and full jitter.
+
+        Arguments:
+            status (str, required): Status before the request.
+            timeout (float, optional): Maximum waiting time in seconds.
+            delay (float, optional): Base polling delay in seconds.
+            max_delay (float, optional): Maximum polling delay in seconds.
+
+        Returns:
+            str: The new cluster status.
+        """
+        deadline = monotonic() + timeout
+
+        cluster_status, _ = self.get_cluster_status()
+
+        attempt = 0
+        while cluster_status == status:
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                raise TimeoutError(
+                    "Cluster %s still '%s' after %ds."
+                    % (self.cluster_identifier, cluster_status, timeout)
+                )
+
+            backoff = random.uniform(0, min(max_delay, delay * 2 ** attempt))
+            sleep(min(remaining, backoff))
+            attempt += 1
+
+            cluster_status, _ = self.get_cluster_status()
+
+        logging.info("AWS MyCluster: Status changed to '%s'." % cluster_status)
+
+        return cluster_status
+
+    def provision(self, timeout=1800):
+        """
+        Description: This function is responsible for setting the whole
+        environment up at the same time: the role, the WLM parameter group
+        and then the cluster, which needs both, in one thread, and the
+        jsonpaths bucket in another. The cluster ingress and host are set
+        as soon as it is available.
+
+        Arguments:
+            timeout (float, optional): Maximum waiting time for the cluster.
+
+        Returns:
+            (str, float): The cluster status and the seconds taken until
+            the cluster was ready to be queried.
+        """
+        start = monotonic()
+
+        def cluster_steps():
+            self.sparkifydwh_role_create()
+            self.update_role_config()
+            self.parameter_group_create()
+            self.redshift_cluster_create()
+
+            cluster_status, cluster_props = self.redshift_cluster_wait(timeout)
+            if cluster_status == "available":
+                self.authorize_ingress(cluster_props["VpcId"])
+                self.update_db_config(cluster_props["Endpoint"]["Address"])
+
+            return cluster_status
+
+        def bucket_steps():
+            bucket_jsonpaths = self.bucket_jsonpaths_get_or_create()
+            self.songs_jsonpaths_upload(bucket_jsonpaths)
+            self.update_song_jsonpath_config(bucket_jsonpaths)
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            cluster_future = executor.submit(cluster_steps)
+            bucket_future = executor.submit(bucket_steps)
+
+            bucket_future.result()
+            cluster_status = cluster_future.result()
+
+        elapsed = monotonic() - start
+        logging.info(
+            "AWS MyCluster: Cluster '%s' after %.1fs." % (cluster_status, elapsed)
+        )
+
+        return cluster_status, elapsed
+
     def redshift_cluster_delete(self):
         """
         Description: This function is responsible for waiting for deleting
@@ -332,11 +631,195 @@ class MyCluster:
 
         try:
             self.redshift_client.delete_cluster(
-                ClusterIdentifier="dwhcluster", SkipFinalClusterSnapshot=True
+                ClusterIdentifier=self.cluster_identifier,
+                SkipFinalClusterSnapshot=True,
             )
         except Exception as error:
             logging.warning(error)
 
+    def redshift_cluster_resize(self, num_nodes, timeout=3600):
+        """
+        Description: This function is responsible for resizing the
+        redshift cluster to a number of nodes, with an elastic resize
+        (minutes, the cluster stays mostly available) or, when the new
+        size can not be reached elastically, with a classic resize. Other
+        failures are raised. Once requested, the resize is waited for to
+        start and then to be done.
+
+        Arguments:
+            num_nodes (int, required): Number of nodes.
+            timeout (float, optional): Maximum waiting time for the cluster.
+
+        Returns:
+            (str, int): The cluster status and the number of nodes before.
+        """
+        cluster_status, cluster_props = self.redshift_cluster_wait(timeout)
+        if cluster_status != "available":
+            raise RuntimeError(
+                "Cluster %s is '%s', it can not be resized."
+                % (self.cluster_identifier, cluster_status)
+            )
+
+        current_nodes = cluster_props["NumberOfNodes"]
+        if current_nodes == num_nodes:
+            return cluster_status, current_nodes
+
+        logging.info(
+            "AWS MyCluster: Resizing cluster from %d to %d nodes."
+            % (current_nodes, num_nodes)
+        )
+
+        params = {
+            "ClusterIdentifier": self.cluster_identifier,
+            "ClusterType": "multi-node" if num_nodes > 1 else "single-node",
+            "NumberOfNodes": num_nodes,
+        }
+        redshift_client = self.redshift_client
+        try:
+            redshift_client.resize_cluster(Classic=False, **params)
+        except (
+            redshift_client.exceptions.UnsupportedOperationFault,
+            redshift_client.exceptions.UnsupportedOptionFault,
+        ) as error:
+            # the new size can not be reached elastically
+            logging.warning("%s Falling back to a classic resize." % error)
+            redshift_client.modify_cluster(**params)
+
+        self.redshift_cluster_wait_change("available")
+        cluster_status, _ = self.redshift_cluster_wait(timeout)
+
+        return cluster_status, current_nodes
+
+    def redshift_cluster_pause(self, timeout=1800):
+        """
+        Description: This function is responsible for pausing the redshift
+        cluster, so just its storage is billed while it is not used.
+
+        Arguments:
+            timeout (float, optional): Maximum waiting time for the cluster.
+
+        Returns:
+            str: The cluster status.
+        """
+        logging.info("AWS MyCluster: Pausing cluster.")
+
+        self.redshift_client.pause_cluster(ClusterIdentifier=self.cluster_identifier)
+        self.redshift_cluster_wait_change("available")
+        cluster_status, _ = self.redshift_cluster_wait(timeout)
+
+        return cluster_status
+
+    def redshift_cluster_resume(self, timeout=1800):
+        """
+        Description: This function is responsible for resuming the paused
+        redshift cluster.
+
+        Arguments:
+            timeout (float, optional): Maximum waiting time for the cluster.
+
+        Returns:
+            str: The cluster status.
+        """
+        logging.info("AWS MyCluster: Resuming cluster.")
+
+        self.redshift_client.resume_cluster(ClusterIdentifier=self.cluster_identifier)
+        self.redshift_cluster_wait_change("paused")
+        cluster_status, _ = self.redshift_cluster_wait(timeout)
+
+        return cluster_status
+
+    def snapshot_create(self, snapshot_identifier=None):
+        """
+        Description: This function is responsible for taking a manual
+        snapshot of the redshift cluster and waiting for it to be available.
+
+        Arguments:
+            snapshot_identifier (str, optional): Snapshot name, the cluster
+            identifier and the UTC time when not given.
+
+        Returns:
+            str: The snapshot identifier.
+        """
+        snapshot_identifier = snapshot_identifier or "%s-%s" % (
+            self.cluster_identifier,
+            strftime("%Y%m%d%H%M%S", gmtime()),
+        )
+        logging.info("AWS MyCluster: Creating snapshot %s." % snapshot_identifier)
+
+        self.redshift_client.create_cluster_snapshot(
+            SnapshotIdentifier=snapshot_identifier,
+            ClusterIdentifier=self.cluster_identifier,
+        )
+        self.redshift_client.get_waiter("snapshot_available").wait(
+            SnapshotIdentifier=snapshot_identifier,
+            ClusterIdentifier=self.cluster_identifier,
+        )
+
+        return snapshot_identifier
+
+    def latest_snapshot(self):
+        """
+        Description: This function is responsible for finding the latest
+        manual snapshot of the redshift cluster.
+
+        Arguments:
+            None
+
+        Returns:
+            str: The snapshot identifier, or None when there is no snapshot.
+        """
+        resp = self.redshift_client.describe_cluster_snapshots(
+            ClusterIdentifier=self.cluster_identifier, SnapshotType="manual"
+        )
+        snapshots = [
+            snapshot
+            for snapshot in resp["Snapshots"]
+            if snapshot["Status"] == "available"
+        ]
+        if not snapshots:
+            return None
+
+        latest = max(snapshots, key=lambda snapshot: snapshot["SnapshotCreateTime"])
+        return latest["SnapshotIdentifier"]
+
+    def redshift_cluster_restore(self, snapshot_identifier=None, timeout=1800):
+        """
+        Description: This function is responsible for creating the redshift
+        cluster from a snapshot, instead of from scratch, with the loaded
+        tables in place. The ingress and the 'DB' host are set as soon as
+        the cluster is available.
+
+        Arguments:
+            snapshot_identifier (str, optional): Snapshot name, the latest
+            manual snapshot of the cluster when not given.
+            timeout (float, optional): Maximum waiting time for the cluster.
+
+        Returns:
+            str: The cluster status.
+        """
+        snapshot_identifier = snapshot_identifier or self.latest_snapshot()
+        if snapshot_identifier is None:
+            raise ValueError(
+                "There is no snapshot of cluster %s." % self.cluster_identifier
+            )
+        logging.info(
+            "AWS MyCluster: Restoring cluster from snapshot %s." % snapshot_identifier
+        )
+
+        self.redshift_client.restore_from_cluster_snapshot(
+            ClusterIdentifier=self.cluster_identifier,
+            SnapshotIdentifier=snapshot_identifier,
+            ClusterParameterGroupName=self.config["WLM"]["PARAMETER_GROUP"],
+            IamRoles=[self.config["IAM_ROLE"]["ARN"]],
+        )
+
+        cluster_status, cluster_props = self.redshift_cluster_wait(timeout)
+        if cluster_status == "available":
+            self.authorize_ingress(cluster_props["VpcId"])
+            self.update_db_config(cluster_props["Endpoint"]["Address"])
+
+        return cluster_status
+
     def bucket_jsonpaths_get_or_create(self):
         """
         Description: This function is responsible for getting or creating
@@ -381,10 +864,120 @@ class MyCluster:
 
         return bucket
 
+    def _object_batches(self, bucket, batch_size=1000):
+        """
+        Description: This function is responsible for paging through
+        every object version and delete marker of a bucket (just the
+        objects, with a 'null' version, when versioning is disabled).
+
+        Arguments:
+            bucket (str): Bucket name.
+            batch_size (int, optional): Keys of each batch (at most 1000).
+
+        Returns:
+            generator: Lists of {'Key', 'VersionId'} dicts.
+        """
+        paginator = self.s3_client.get_paginator("list_object_versions")
+
+        batch = []
+        for page in paginator.paginate(Bucket=bucket):
+            for version in page.get("Versions", []) + page.get("DeleteMarkers", []):
+                batch.append({"Key": version["Key"], "VersionId": version["VersionId"]})
+                if len(batch) == batch_size:
+                    yield batch
+                    batch = []
+
+        if batch:
+            yield batch
+
+    def _delete_batch(self, bucket, objects, retries=5, backoff=0.2):
+        """
+        Description: This function is responsible for deleting a batch of
+        object versions, retrying the request on transient errors and the
+        keys S3 failed to delete (e.g. SlowDown) with exponential backoff.
+
+        Arguments:
+            bucket (str): Bucket name.
+            objects (list): {'Key', 'VersionId'} dicts.
+            retries (int, optional): Maximum number of retries.
+            backoff (float, optional): Base delay in seconds.
+
+        Returns:
+            int: Number of deleted objects.
+        """
+        pending = objects
+        for attempt in range(retries + 1):
+            resp = with_retry(
+                lambda: self.s3_client.delete_objects(
+                    Bucket=bucket, Delete={"Objects": pending, "Quiet": True}
+                ),
+                retries=retries,
+                backoff=backoff,
+            )
+            errors = resp.get("Errors", [])
+            if not errors:
+                return len(objects)
+
+            if attempt == retries:
+                raise RuntimeError(
+                    "Could not delete %d objects of %s (%s: %s)."
+                    % (len(errors), bucket, errors[0]["Code"], errors[0]["Message"])
+                )
+
+            failed = {(error["Key"], error.get("VersionId")) for error in errors}
+            pending = [
+                obj for obj in pending if (obj["Key"], obj["VersionId"]) in failed
+            ]
+            sleep(random.uniform(0, min(10.0, backoff * 2**attempt)))
+
+    def bucket_objects_delete(self, bucket, workers=16, report_every=10):
+        """
+        Description: This function is responsible for deleting every
+        object version of a bucket, listing them in 1000 keys batches
+        deleted over a pool of threads, while the next pages are listed.
+        The progress and the throughput are logged.
+
+        Arguments:
+            bucket (str): Bucket name.
+            workers (int, optional): Maximum number of concurrent deletes.
+            report_every (int, optional): Batches between progress logs.
+
+        Returns:
+            int: Number of deleted objects.
+        """
+        start, deleted, batches, reported = monotonic(), 0, 0, 0
+        with ThreadPoolExecutor(workers) as executor:
+            running = set()
+            for objects in self._object_batches(bucket):
+                # bounding the listed batches waiting to be deleted
+                if len(running) >= 2 * workers:
+                    done, running = wait(running, return_when=FIRST_COMPLETED)
+                    deleted += sum(future.result() for future in done)
+                    batches += len(done)
+
+                    if batches - reported >= report_every:
+                        reported = batches
+                        logging.info(
+                            "AWS MyCluster: %d objects of %s deleted (%.0f objects/s)."
+                            % (deleted, bucket, deleted / (monotonic() - start))
+                        )
+
+                running.add(executor.submit(self._delete_batch, bucket, objects))
+
+            deleted += sum(future.result() for future in running)
+
+        elapsed = monotonic() - start
+        logging.info(
+            "AWS MyCluster: %d objects of %s deleted in %.1fs (%.0f objects/s)."
+            % (deleted, bucket, elapsed, deleted / elapsed if elapsed else 0.0)
+        )
+
+        return deleted
+
     def bucket_delete(self, bucket):
         """
         Description: This function is responsible for deleting
-        a bucket.
+        a bucket, with all its objects.
 
         Arguments:
             bucket (str): Bucket name.
@@ -394,16 +987,15 @@ class MyCluster:
         """
         logging.info("AWS MyCluster: Deleting %s bucket." % bucket)
 
-        s3_client = self.s3_client
+        # a bucket must be empty before being deleted, so the objects written
+        # (or not listed) while the pages were deleted are deleted by new passes
+        workers = int(self.config["ETL"]["S3_WORKERS"])
+        while self.bucket_objects_delete(bucket, workers):
+            pass
 
-        # listing bucket files and deleting before delete the bucket
-        resp = s3_client.list_objects_v2(Bucket=bucket)
-        if "Contents" in resp:
-            objects = list(map(lambda object: {"Key": object["Key"]}, resp["Contents"]))
-            s3_client.delete_objects(Bucket=bucket, Delete={"Objects": objects})
+        self.s3_client.delete_bucket(Bucket=bucket)
 
-        # delete bucket
-        resp = s3_client.delete_bucket(Bucket=bucket)
+        return bucket
 
     def songs_jsonpaths_upload(self, bucket):
         """
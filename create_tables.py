@@ -1,9 +1,12 @@
 import configparser
 import psycopg2
+import dialect
+from execution import TransactionRunner, runner_from_config
+from profiler import profiler_from_config
 from sql_queries import create_table_queries, drop_table_queries
 
 
-def drop_tables(cur, conn):
+def drop_tables(cur, conn, runner=None):
     """
     Description: This function is responsible for deleting all
     tables by executing all queries in the 'drop_table_queries' list.
@@ -11,16 +14,16 @@ def drop_tables(cur, conn):
     Arguments:
         cur: the cursor object.
         conn: connection to the database.
+        runner (TransactionRunner, optional): Runner grouping the statements
+        into transactions (by default, one commit per statement).
 
     Returns:
         None
     """
-    for query in drop_table_queries:
-        cur.execute(query)
-        conn.commit()
+    (runner or TransactionRunner()).run(cur, conn, drop_table_queries)
 
 
-def create_tables(cur, conn):
+def create_tables(cur, conn, runner=None):
     """
     Description: This function is responsible for creating all
     by executing all queries in the 'create_table_queries' list.
@@ -28,44 +31,54 @@ def create_tables(cur, conn):
     Arguments:
         cur: the cursor object.
         conn: connection to the database.
+        runner (TransactionRunner, optional): Runner grouping the statements
+        into transactions (by default, one commit per statement).
 
     Returns:
         None
     """
-    for query in create_table_queries:
-        cur.execute(query)
-        conn.commit()
+    (runner or TransactionRunner()).run(cur, conn, create_table_queries)
 
 
-def main():
+def main(config_path="dwh.cfg", runner=None):
     """
     Description: This function is responsible for creating
     the data warehouse with all data definitions needed. If the DWH
     already exists, it is deleted before creating it.
 
     Arguments:
-        None
+        config_path (str, optional): Configuration file path.
+        runner (TransactionRunner, optional): Runner grouping the statements
+        into transactions, set by the 'ETL' configurations when not given.
 
     Returns:
-        None
+        dict: The counters of the runner.
     """
 
     # loading configurations
     config = configparser.ConfigParser()
-    config.read("dwh.cfg")
+    config.read(config_path)
 
     # connecting to redshift
     conn = psycopg2.connect(
         "host={} dbname={} user={} password={} port={}".format(*config["DB"].values())
     )
-    cur = conn.cursor()
+    # tracing every statement of the run
+    profiler = profiler_from_config("create_tables", config)
+    cur = profiler.wrap(dialect.cursor(conn, config["ETL"]["TARGET"]))
+    runner = runner or runner_from_config(config)
 
     # executing data definition queries
-    drop_tables(cur, conn)
-    create_tables(cur, conn)
+    try:
+        drop_tables(cur, conn, runner)
+        create_tables(cur, conn, runner)
+    finally:
+        profiler.write_report()
 
     conn.close()
 
+    return runner.summary()
+
 
 if __name__ == "__main__":
     main()
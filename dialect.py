@@ -0,0 +1,94 @@
+import re
+
+# Redshift only syntax and its PostgreSQL counterpart. Table constraints
+# are just informational on Redshift, so they are dropped to keep the
+# same (not enforced) behavior on PostgreSQL.
+_postgres_rules = [
+    (re.compile(r"\s+DISTSTYLE\s+(ALL|EVEN|KEY|AUTO)", re.I), ""),
+    (re.compile(r"\s+DISTKEY\s*\(\s*\w+\s*\)", re.I), ""),
+    (re.compile(r"\s+(COMPOUND\s+|INTERLEAVED\s+)?SORTKEY\s*\([\w\s,]+\)", re.I), ""),
+    (re.compile(r"\s+(DISTKEY|SORTKEY)\b", re.I), ""),
+    (re.compile(r"\s+ENCODE\s+\w+", re.I), ""),
+    (re.compile(r"\s+PRIMARY\s+KEY\b", re.I), ""),
+    (re.compile(r"\s+REFERENCES\s+\w+\s*\(\s*\w+\s*\)", re.I), ""),
+    (
+        re.compile(r"\bIDENTITY\s*\(\s*(\d+)\s*,\s*(\d+)\s*\)", re.I),
+        r"GENERATED BY DEFAULT AS IDENTITY (START WITH \1 MINVALUE \1 INCREMENT BY \2)",
+    ),
+    (re.compile(r"\bextract\s*\(\s*dayofweek\s+from\b", re.I), "extract(dow from"),
+    # there are no WLM queues, the query group just labels the session
+    (re.compile(r"^(\s*(?:SET|RESET))\s+query_group\b", re.I), r"\1 application_name"),
+]
+
+
+def to_postgres(query):
+    """
+    Description: This function is responsible for translating a
+    Redshift statement to PostgreSQL.
+
+    Arguments:
+        query (str, required): Redshift SQL statement.
+
+    Returns:
+        str: PostgreSQL SQL statement.
+    """
+    for pattern, replacement in _postgres_rules:
+        query = pattern.sub(replacement, query)
+
+    return query
+
+
+class PostgresCursor:
+    """
+    Description: This class is responsible for wrapping a database cursor,
+    translating Redshift statements to PostgreSQL before executing them.
+    Everything else is delegated to the wrapped cursor.
+    """
+
+    def __init__(self, cursor):
+        """
+        Description: This function is responsible for setting the
+        wrapped cursor.
+
+        Arguments:
+            cursor: the cursor object.
+
+        Returns:
+            None
+        """
+        self._cursor = cursor
+
+    def execute(self, query, vars=None):
+        """
+        Description: This function is responsible for executing
+        the translated statement.
+
+        Arguments:
+            query (str, required): Redshift SQL statement.
+            vars (tuple|dict, optional): Statement parameters.
+
+        Returns:
+            None
+        """
+        self._cursor.execute(to_postgres(query), vars)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+def cursor(conn, target):
+    """
+    Description: This function is responsible for creating a cursor
+    running the Redshift statements on the given target database.
+
+    Arguments:
+        conn: connection to the database.
+        target (str, required): 'redshift' or 'postgres'.
+
+    Returns:
+        The cursor object.
+    """
+    if target == "postgres":
+        return PostgresCursor(conn.cursor())
+
+    return conn.cursor()
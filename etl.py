@@ -1,14 +1,77 @@
+import argparse
 import configparser
 import psycopg2
 import logging
+import math
+import time
+from datetime import date, datetime
+import dialect
+from cluster import MyCluster
+from execution import TransactionRunner, runner_from_config
+from executor import (
+    Step,
+    connection_pool,
+    declared_steps,
+    run_dag,
+    statement_label,
+)
+from ledger import RunLedger
+from loader import stream_staging_tables
+from manifest import (
+    load_watermark,
+    new_objects,
+    prepare_incremental_load,
+    save_watermark,
+)
+from prestage import prestage_delete, prestage_tables
+from profiler import profiler_from_config
+from splitter import slice_count
+from storage import storage_from_config
+from transform import load_times
+from validation import validate_sources, validator_from_config
+from windows import split_windows, window_manifests, window_name
 from sql_queries import (
     copy_table_queries,
     insert_table_queries,
     create_staging_table_queries,
+    daily_song_plays_backfill_refresh,
+    manifest_copy_table_queries,
+    match_key_queries,
+    persistent,
+    query_group_set,
+    run_schema_create,
+    run_schema_drop,
+    run_search_path,
+    staging_schema_create,
+    staging_schema_drop,
+    staging_search_path,
+    insert_strategies,
+    load_generation_bump,
+    load_generation_create,
+    load_generation_select,
+    rollup_table_queries,
+    songplay_delta_clear,
+    songplay_backfill,
+    songplay_delta_count,
+    songplay_match_select,
+    songplay_unmatched_count,
+    step_tables,
+    staging_events_keys,
+    staging_events_manifest_copy,
+    staging_events_table_create,
+    staging_events_table_drop,
+    staging_songs_copy,
+    staging_songs_keys,
+    staging_songs_table_create,
+    window_events_create,
+    window_events_insert,
+    window_users_create,
+    window_users_insert,
+    windowed,
 )
 
 
-def load_staging_tables(cur, conn):
+def load_staging_tables(cur, conn, queries=copy_table_queries, runner=None):
     """
     Description: This function is responsible for loading JSON files
     to staging tables.
@@ -16,17 +79,45 @@ def load_staging_tables(cur, conn):
     Arguments:
         cur: the cursor object.
         conn: connection to the database.
+        queries (list, optional): COPY statements to be executed.
+        runner (TransactionRunner, optional): Runner grouping the statements
+        into transactions (by default, one commit per statement).
 
     Returns:
         None
     """
     logging.info("Loading data to staging tables.")
-    for query in copy_table_queries:
-        cur.execute(query)
-        conn.commit()
+    (runner or TransactionRunner()).run(cur, conn, queries)
+
+
+def incremental_copy_queries(storage, config):
+    """
+    Description: This function is responsible for preparing the load of
+    just the JSON files not ingested by previous runs. A manifest listing
+    the new files is uploaded for each source to be loaded with
+    COPY ... MANIFEST.
+
+    Arguments:
+        storage (S3Storage, required): S3 access layer.
+        config: the loaded configurations.
+
+    Returns:
+        (list, dict, dict): The COPY statements, the watermark to be saved
+        once the whole load succeeds and the objects to be loaded by source
+        uri.
+    """
+    logging.info("Looking for new files to be loaded.")
+
+    watermark = load_watermark(config["ETL"]["WATERMARK"])
+    return prepare_incremental_load(
+        storage,
+        manifest_copy_table_queries,
+        watermark,
+        config["S3"]["MANIFEST_PREFIX"],
+    )
 
 
-def create_staging_tables(cur, conn):
+def create_staging_tables(cur, conn, runner=None):
     """
     Description: This function is responsible for creating
     the temporary tables for loading files. It will be
@@ -35,17 +126,65 @@ def create_staging_tables(cur, conn):
     Arguments:
         cur: the cursor object.
         conn: connection to the database.
+        runner (TransactionRunner, optional): Runner grouping the statements
+        into transactions (by default, one commit per statement).
 
     Returns:
         None
     """
     logging.info("Creating staging tables.")
-    for query in create_staging_table_queries:
-        cur.execute(query)
-        conn.commit()
+    (runner or TransactionRunner()).run(cur, conn, create_staging_table_queries)
+
+
+def create_match_keys(cur, conn, runner=None):
+    """
+    Description: This function is responsible for keying the staged
+    events and songs by their match key, so songplays join them
+    co-located.
+
+    Arguments:
+        cur: the cursor object.
+        conn: connection to the database.
+        runner (TransactionRunner, optional): Runner grouping the statements
+        into transactions (by default, one commit per statement).
+
+    Returns:
+        None
+    """
+    logging.info("Keying staging tables.")
+    (runner or TransactionRunner()).run(cur, conn, match_key_queries)
+
+
+def report_match_rate(cur):
+    """
+    Description: This function is responsible for reporting how many
+    played songs were matched to a staged song, as the unmatched ones
+    are loaded with NULL song_id and artist_id.
 
+    Arguments:
+        cur: the cursor object.
+
+    Returns:
+        (int, int, int): Played songs, played songs with a match key
+        and matched played songs.
+    """
+    cur.execute(songplay_match_select)
+    plays, keyed, matched = cur.fetchone()
+
+    logging.info(
+        "Song match: %d of %d played songs matched (%.1f%%), %d without a key."
+        % (matched, plays, 100.0 * matched / plays if plays else 0.0, plays - keyed)
+    )
+    if plays and matched < plays:
+        logging.warning(
+            "Song match: %d songplays loaded without song_id and artist_id."
+            % (plays - matched)
+        )
+
+    return plays, keyed, matched
 
-def insert_tables(cur, conn):
+
+def insert_tables(cur, conn, queries=insert_table_queries, runner=None):
     """
     Description: This function is responsible for transforming the
     data in staging tables and loading it in the star schema tables.
@@ -53,50 +192,828 @@ def insert_tables(cur, conn):
     Arguments:
         cur: the cursor object.
         conn: connection to the database.
+        queries (list, optional): Insert statements to be executed, in
+        the 'insert_table_queries' order.
+        runner (TransactionRunner, optional): Runner grouping the statements
+        into transactions (by default, one commit per statement).
 
     Returns:
         None
     """
     logging.info("Inserting data to tables.")
-    for query in insert_table_queries:
+    (runner or TransactionRunner()).run(cur, conn, queries)
+
+
+def backfill_songplays(cur, conn, days):
+    """
+    Description: This function is responsible for resolving the song_id
+    and artist_id of the unmatched songplays of the last days whose song
+    was just staged, adding them to the song rollup in the same transaction.
+
+    Arguments:
+        cur: the cursor object.
+        conn: connection to the database.
+        days (int, required): Days of unmatched songplays scanned.
+
+    Returns:
+        (int, int): Resolved songplays and songplays of the last days
+        still unmatched.
+    """
+    logging.info("Backfilling unmatched songplays of the last %d days." % days)
+
+    cur.execute(songplay_backfill.format(int(days)))
+    resolved = cur.rowcount
+    cur.execute(daily_song_plays_backfill_refresh)
+    conn.commit()
+
+    cur.execute(songplay_unmatched_count.format(int(days)))
+    unmatched = cur.fetchone()[0]
+
+    logging.info(
+        "Backfill: %d songplays resolved, %d of the last %d days still unmatched."
+        % (resolved, unmatched, days)
+    )
+
+    return resolved, unmatched
+
+
+def refresh_rollups(cur, conn, queries=rollup_table_queries):
+    """
+    Description: This function is responsible for folding the songplays
+    inserted since the last refresh (songplays_delta) into the rollup
+    tables, and clearing them in the same transaction, so a failed refresh
+    is retried by the next run. The refresh cost of each rollup is logged.
+
+    Arguments:
+        cur: the cursor object.
+        conn: connection to the database.
+        queries (list, optional): (rollup table, refresh statement) tuples.
+
+    Returns:
+        list: (rollup table, folded songplays, replaced rows, rollup rows,
+        seconds) tuples.
+    """
+    logging.info("Refreshing rollup tables.")
+
+    cur.execute(songplay_delta_count)
+    delta_rows = cur.fetchone()[0]
+
+    report = []
+    for table, query in queries:
+        start = time.perf_counter()
         cur.execute(query)
+        elapsed = time.perf_counter() - start
+        replaced_rows = cur.rowcount
+
+        cur.execute("SELECT COUNT(*) FROM %s" % table)
+        rollup_rows = cur.fetchone()[0]
+
+        report.append((table, delta_rows, replaced_rows, rollup_rows, elapsed))
+        logging.info(
+            "Rollup %s: folded %d songplays in %.2fs (%d of %d rows replaced)."
+            % (table, delta_rows, elapsed, replaced_rows, rollup_rows)
+        )
+
+    cur.execute(songplay_delta_clear)
+    conn.commit()
+
+    return report
+
+
+def session_queries(config):
+    """
+    Description: This function is responsible for building the statements
+    setting an ETL session up, routing its queries to the WLM queue of the
+    '[WLM] etl_query_group' query group.
+
+    Arguments:
+        config: the loaded configurations.
+
+    Returns:
+        list: The session statements.
+    """
+    return [query_group_set.format(config["WLM"]["ETL_QUERY_GROUP"])]
+
+
+def parallel_steps(copy_queries, insert_queries):
+    """
+    Description: This function is responsible for naming the load
+    statements and deriving their dependencies from the tables each one
+    reads and writes ('step_tables'), so inserts wait just for the staging
+    tables they read from (e.g. songs and artists start while the events
+    are still being copied), songplays for the keyed ones.
+
+    Arguments:
+        copy_queries (list, required): COPY statements to be executed.
+        insert_queries (list, required): Insert statements to be executed,
+        in the 'insert_table_queries' order.
+
+    Returns:
+        list: Steps of the load DAG.
+    """
+    named_queries = [(statement_label(query), query) for query in copy_queries]
+
+    # keyed staging tables, seen by the other connections
+    keys = ["staging_events_keyed", "staging_songs_keyed"]
+    named_queries += zip(keys, map(persistent, match_key_queries))
+    inserts = ["songs", "songplays", "users", "artists", "times"]
+    named_queries += zip(inserts, insert_queries)
+
+    return declared_steps(named_queries, step_tables)
+
+
+def load_parallel(
+    config, copy_queries, insert_queries, workers, profiler=None, storage=None
+):
+    """
+    Description: This function is responsible for loading staging and
+    star schema tables running independent statements at the same time
+    over a pool of connections. As temporary tables are seen just by the
+    session that created them, staging tables are created in the
+    'etl_staging' schema, which is dropped at the end. With the 'stream'
+    loader, staging tables are loaded through COPY FROM STDIN. Unmatched
+    songplays are backfilled and rollup tables refreshed once every insert
+    is done.
+
+    Arguments:
+        config: the loaded configurations.
+        copy_queries (list, required): COPY statements to be executed.
+        insert_queries (list, required): Insert statements to be executed.
+        workers (int, required): Maximum number of concurrent statements.
+        profiler (QueryProfiler, optional): Profiler tracing the statements.
+        storage (S3Storage, optional): S3 access layer, used by the 'stream' loader.
+
+    Returns:
+        dict: The DAG run report.
+    """
+    logging.info("Loading data with %d concurrent statements." % workers)
+
+    pool = connection_pool(config, workers)
+    session = [staging_search_path] + session_queries(config)
+    target = config["ETL"]["TARGET"]
+    conn = pool.getconn()
+    cur = dialect.cursor(conn, target)
+    cur = cur if profiler is None else profiler.wrap(cur)
+
+    # creating persistent staging tables
+    cur.execute(staging_schema_drop)
+    cur.execute(staging_schema_create)
+    for query in session:
+        cur.execute(query)
+    for query in create_staging_table_queries:
+        cur.execute(persistent(query))
+    conn.commit()
+
+    if config["ETL"]["LOADER"] == "stream":
+        stream_staging_tables(conn, config, storage)
+    pool.putconn(conn)
+
+    try:
+        report = run_dag(
+            pool,
+            parallel_steps(copy_queries, insert_queries),
+            workers,
+            session,
+            profiler,
+            target,
+        )
+
+        # rollups are refreshed once every insert is done
+        conn = pool.getconn()
+        cur = dialect.cursor(conn, target)
+        cur = cur if profiler is None else profiler.wrap(cur)
+        for query in session:
+            cur.execute(query)
+        report_match_rate(cur)
+        backfill_songplays(cur, conn, int(config["ETL"]["BACKFILL_DAYS"]))
+        refresh_rollups(cur, conn)
+        pool.putconn(conn)
+
+        return report
+
+    finally:
+        conn = pool.getconn()
+        conn.cursor().execute(staging_schema_drop)
         conn.commit()
+        pool.putconn(conn)
+        pool.closeall()
 
 
-def main():
+def window_steps(manifests, insert_queries):
     """
-    Description: This function is responsible for executing the transformations and
-    the ingest process.
+    Description: This function is responsible for declaring the steps of a
+    windowed load. Songs are staged once and shared by every window. Each
+    window stages its events in temporary tables of its own session and
+    appends its keyed events and users to the window tables in a single
+    transaction, so a failed window leaves nothing behind and can be
+    retried on its own.
 
     Arguments:
-        None
+        manifests (list, required): (window, manifest uri, objects) tuples.
+        insert_queries (list, required): Insert statements to be executed,
+        in the 'insert_table_queries' order.
+
+    Returns:
+        list: Steps of the load DAG.
+    """
+    songs, _, _, artists, _ = insert_queries
+
+    steps = [
+        Step("COPY staging_songs", staging_songs_copy, []),
+        Step(
+            "staging_songs_keyed",
+            persistent(staging_songs_keys),
+            ["COPY staging_songs"],
+        ),
+        Step("songs", songs, ["COPY staging_songs"]),
+        Step("artists", artists, ["COPY staging_songs"]),
+    ]
+
+    for window, manifest_uri, _ in manifests:
+        queries = [
+            staging_events_table_drop,
+            staging_events_table_create,
+            staging_events_manifest_copy.format(manifest_uri),
+            staging_events_keys,
+            window_users_insert,
+            window_events_insert,
+        ]
+        query = ";\n".join(query.strip().rstrip(";") for query in queries)
+        steps.append(Step(window_name(window), query, ["staging_songs_keyed"]))
+
+    return steps
+
+
+def load_windows(
+    config,
+    storage,
+    start,
+    end,
+    insert_queries,
+    workers,
+    profiler=None,
+    days=1,
+    validator=None,
+):
+    """
+    Description: This function is responsible for loading the log_data
+    partitions of a date range split into windows, running as many windows
+    at the same time as workers. Failed windows are retried and, when they
+    still fail, the others go on. Songplays, users and times are merged
+    once every window is done, in a single session, so concurrent windows
+    never write to the same final table. Unmatched songplays are then
+    backfilled and rollup tables refreshed.
+
+    Arguments:
+        config: the loaded configurations.
+        storage (S3Storage, required): S3 access layer.
+        start (date, required): First day of the range.
+        end (date, required): Last day of the range (included).
+        insert_queries (list, required): Insert statements to be executed.
+        workers (int, required): Maximum number of concurrent statements.
+        profiler (QueryProfiler, optional): Profiler tracing the statements.
+        days (int, optional): Days of each window.
+        validator (RecordValidator, optional): Validator checking the
+        objects of the windows and the song_data files before they load.
+
+    Returns:
+        dict: The DAG run report.
+    """
+    windows = split_windows(start, end, days)
+    manifests = window_manifests(
+        storage, config["S3"]["LOG_DATA"], windows, config["S3"]["MANIFEST_PREFIX"]
+    )
+    if validator is not None:
+        validate_sources(
+            validator,
+            config,
+            storage,
+            {
+                config["S3"]["LOG_DATA"]: [
+                    obj for _, _, objects in manifests for obj in objects
+                ]
+            },
+        )
+    logging.info(
+        "Loading %d windows with %d concurrent statements."
+        % (len(manifests), workers)
+    )
+
+    pool = connection_pool(config, workers)
+    session = [staging_search_path] + session_queries(config)
+    target = config["ETL"]["TARGET"]
+    conn = pool.getconn()
+    cur = dialect.cursor(conn, target)
+    cur = cur if profiler is None else profiler.wrap(cur)
+
+    # tables shared by the windows
+    cur.execute(staging_schema_drop)
+    cur.execute(staging_schema_create)
+    for query in session:
+        cur.execute(query)
+    cur.execute(persistent(staging_songs_table_create))
+    cur.execute(window_users_create)
+    cur.execute(window_events_create)
+    conn.commit()
+    pool.putconn(conn)
+
+    try:
+        report = run_dag(
+            pool,
+            window_steps(manifests, insert_queries),
+            workers,
+            session,
+            profiler,
+            target,
+            retries=int(config["ETL"]["WINDOW_RETRIES"]),
+            keep_going=True,
+        )
+
+        # the windows are merged at once, so the last level of users is kept
+        _, songplays, users, _, times = insert_queries
+        conn = pool.getconn()
+        cur = dialect.cursor(conn, target)
+        cur = cur if profiler is None else profiler.wrap(cur)
+        for query in session:
+            cur.execute(query)
+        cur.execute(windowed(songplays))
+        cur.execute(windowed(users))
+        cur.execute(times)
+        conn.commit()
+        backfill_songplays(cur, conn, int(config["ETL"]["BACKFILL_DAYS"]))
+        refresh_rollups(cur, conn)
+        pool.putconn(conn)
+
+    finally:
+        conn = pool.getconn()
+        conn.cursor().execute(staging_schema_drop)
+        conn.commit()
+        pool.putconn(conn)
+        pool.closeall()
+
+    not_loaded = sorted(report["failed"]) + report["skipped"]
+    if not_loaded:
+        raise RuntimeError(
+            "Steps not loaded, run their windows again with --from and --to: %s."
+            % ", ".join(not_loaded)
+        )
+
+    return report
+
+
+def load_checkpointed(
+    cur, conn, config, copy_queries, insert_queries, ledger, storage=None
+):
+    """
+    Description: This function is responsible for running the load as
+    checkpointed steps. Staging tables are created in the run scoped
+    'etl_run_<run id>' schema instead of as temporary tables, so they
+    survive a failure, and each step is recorded in the run ledger once
+    committed. Resuming the run skips the steps already done. The schema
+    is dropped once the run is done.
+
+    Arguments:
+        cur: the cursor object.
+        conn: connection to the database.
+        config: the loaded configurations.
+        copy_queries (list, required): COPY statements to be executed.
+        insert_queries (list, required): Insert statements to be executed,
+        in the 'insert_table_queries' order.
+        ledger (RunLedger, required): Ledger of the started or resumed run.
+        storage (S3Storage, optional): S3 access layer, used by the 'stream'
+        loader.
 
     Returns:
         None
     """
 
-    # loading configurations
-    config = configparser.ConfigParser()
-    config.read("dwh.cfg")
+    def execute(query):
+        cur.execute(query)
+        conn.commit()
+        return cur.rowcount
+
+    cur.execute(run_schema_create.format(ledger.run_id))
+    cur.execute(run_search_path.format(ledger.run_id))
+    conn.commit()
+
+    steps = [
+        (statement_label(query), query)
+        for query in map(persistent, create_staging_table_queries)
+    ]
+    steps += [(statement_label(query), query) for query in copy_queries]
+    steps += zip(
+        ["staging_events_keyed", "staging_songs_keyed"],
+        [persistent(query) for query in match_key_queries],
+    )
+    steps += zip(["songs", "songplays", "users", "artists", "times"], insert_queries)
+
+    for step, query in steps:
+        if step == "staging_events_keyed" and config["ETL"]["LOADER"] == "stream":
+            # staging tables are streamed once created, before being keyed
+            ledger.checkpoint(
+                "stream staging tables",
+                lambda: sum(stream_staging_tables(conn, config, storage).values()),
+            )
+        if step == "times" and config["ETL"].getboolean("LOCAL_TRANSFORM"):
+            ledger.checkpoint(step, lambda: load_times(cur, conn))
+            continue
+        ledger.checkpoint(step, lambda query=query: execute(query))
+
+    report_match_rate(cur)
+    days = int(config["ETL"]["BACKFILL_DAYS"])
+    ledger.checkpoint("backfill", lambda: backfill_songplays(cur, conn, days)[0])
+    ledger.checkpoint("rollups", lambda: len(refresh_rollups(cur, conn)))
+
+    cur.execute(run_schema_drop.format(ledger.run_id))
+    conn.commit()
+    ledger.finish()
+
+
+def bump_load_generation(config):
+    """
+    Description: This function is responsible for bumping the load
+    generation of the warehouse once a run succeeds, so the results
+    cached by the query client (query_client.py) are invalidated.
+
+    Arguments:
+        config: the loaded configurations.
 
-    # connecting to redshift
+    Returns:
+        int: The new load generation.
+    """
     conn = psycopg2.connect(
         "host={} dbname={} user={} password={} port={}".format(*config["DB"].values())
     )
-    cur = conn.cursor()
-
-    # creating temporary tables
-    create_staging_tables(cur, conn)
+    cur = dialect.cursor(conn, config["ETL"]["TARGET"])
 
-    # loading data
-    load_staging_tables(cur, conn)
-    insert_tables(cur, conn)
+    # warehouses created before generations were kept lack the table
+    cur.execute(load_generation_create)
+    cur.execute(load_generation_bump, (datetime.utcnow(),))
+    conn.commit()
 
+    cur.execute(load_generation_select)
+    generation = cur.fetchone()[0]
     conn.close()
 
+    logging.info("Load generation %d." % generation)
+    return generation
+
+
+def estimate_input_bytes(storage, config, incremental=False):
+    """
+    Description: This function is responsible for estimating the volume
+    of a load from the s3 listing of the '[S3]' log_data and song_data
+    uris, just the objects not ingested yet for incremental loads.
+
+    Arguments:
+        storage (S3Storage, required): S3 access layer.
+        config: the loaded configurations.
+        incremental (bool, optional): Count just the objects that are not
+        in the watermark.
+
+    Returns:
+        int: Bytes to be loaded.
+    """
+    watermark = load_watermark(config["ETL"]["WATERMARK"]) if incremental else {}
+
+    input_bytes = 0
+    for uri in [config["S3"]["LOG_DATA"], config["S3"]["SONG_DATA"]]:
+        objects = new_objects(storage.list_objects(uri), watermark.get(uri, {}))
+        input_bytes += sum(obj["size"] for obj in objects)
+
+    return input_bytes
+
+
+def load_nodes(config, input_bytes):
+    """
+    Description: This function is responsible for sizing the cluster for
+    a load: a node for each '[DWH] load_gb_per_node' GB of input, never
+    less than 'num_nodes' nor more than 'load_max_nodes'.
+
+    Arguments:
+        config: the loaded configurations.
+        input_bytes (int, required): Bytes to be loaded.
+
+    Returns:
+        int: Number of nodes.
+    """
+    needed = math.ceil(input_bytes / (float(config["DWH"]["LOAD_GB_PER_NODE"]) * 2**30))
+
+    return min(
+        max(int(config["DWH"]["NUM_NODES"]), needed),
+        int(config["DWH"]["LOAD_MAX_NODES"]),
+    )
+
+
+def main_resized(config_path="dwh.cfg", pause=False, **kwargs):
+    """
+    Description: This function is responsible for running the ETL on a
+    cluster sized for the load: a paused cluster is resumed, the cluster
+    is scaled out to the nodes estimated from the input volume before the
+    run and scaled back to its size after it (even when the run fails),
+    and paused again when asked, so the peak capacity is just paid for
+    during the load.
+
+    Arguments:
+        config_path (str, optional): Configuration file path.
+        pause (bool, optional): Pause the cluster after the run.
+        kwargs: Arguments of main.
+
+    Returns:
+        list: The profiler records of the run statements.
+    """
+    config = configparser.ConfigParser()
+    config.read(config_path)
+
+    cluster = MyCluster(config_path)
+    cluster_status, _ = cluster.redshift_cluster_wait()
+    if cluster_status == "paused":
+        cluster.redshift_cluster_resume()
+
+    storage = storage_from_config(cluster.s3_client, config)
+    input_bytes = estimate_input_bytes(
+        storage, config, kwargs.get("incremental", False)
+    )
+    num_nodes = load_nodes(config, input_bytes)
+    logging.info(
+        "Load of %.2f GB sized to %d nodes." % (input_bytes / 2**30, num_nodes)
+    )
+
+    _, base_nodes = cluster.redshift_cluster_resize(num_nodes)
+    try:
+        return main(config_path=config_path, **kwargs)
+
+    finally:
+        # the cluster is paused even when it could not be scaled back
+        try:
+            cluster.redshift_cluster_resize(base_nodes)
+        finally:
+            if pause:
+                cluster.redshift_cluster_pause()
+
+
+def main(
+    incremental=False,
+    parallel=False,
+    config_path="dwh.cfg",
+    window=None,
+    checkpoint=False,
+    resume=False,
+    runner=None,
+):
+    """
+    Description: This function is responsible for executing the transformations and
+    the ingest process.
+
+    Arguments:
+        incremental (bool, optional): Load just the files not ingested by
+        previous runs, keeping a watermark of the ingested files.
+        parallel (bool, optional): Run independent statements at the same
+        time over a pool of '[ETL] workers' connections.
+        config_path (str, optional): Configuration file path.
+        window (tuple, optional): (first day, last day) of the log_data
+        partitions to be loaded in windows of '[ETL] window_days', over a
+        pool of '[ETL] workers' connections.
+        checkpoint (bool, optional): Stage into run scoped tables, recording
+        each step in the '[ETL] ledger' run ledger.
+        resume (bool, optional): Resume the last checkpointed run that did not
+        finish, with its inputs, at its failing step.
+        runner (TransactionRunner, optional): Runner grouping the serial load
+        statements into transactions, set by the 'ETL' configurations when
+        not given.
+
+    Returns:
+        list: The profiler records of the run statements.
+    """
+
+    # loading configurations
+    config = configparser.ConfigParser()
+    config.read(config_path)
+    target = config["ETL"]["TARGET"]
+
+    # deduplication strategy of the star schema inserts
+    insert_queries = insert_strategies[config["ETL"]["STRATEGY"]]
+
+    if (checkpoint or resume) and (parallel or window is not None):
+        raise ValueError("Checkpointed runs are just run serially.")
+
+    if incremental and config["ETL"]["LOADER"] != "copy":
+        # just COPY ... MANIFEST loads the new files alone
+        raise ValueError("Incremental runs just work with the 'copy' loader.")
+
+    if incremental and window is not None:
+        # the watermark would hold the files out of the windows as ingested
+        raise ValueError("Windowed runs are not incremental.")
+
+    if config["ETL"].getboolean("LOCAL_TRANSFORM") and target == "redshift":
+        # Redshift does not support COPY FROM STDIN
+        raise ValueError("The local transform just works with the 'postgres' target.")
+
+    copy_queries, watermark, staged_uri = copy_table_queries, None, None
+    # objects to be loaded by source uri, whole sources when not listed
+    loading = {}
+    # s3 is not needed just when streaming from the local data directory
+    storage = None
+    if config["ETL"]["LOADER"] != "stream" or not config["ETL"]["LOCAL_DATA"]:
+        storage = storage_from_config(MyCluster(config_path).s3_client, config)
+
+    ledger = None
+    if checkpoint or resume:
+        ledger = RunLedger(config["ETL"]["LEDGER"], "etl")
+
+    if resume:
+        # a resumed run loads the very same inputs (e.g. manifests)
+        if ledger.resume() is None:
+            raise ValueError("There is no checkpointed run to be resumed.")
+        copy_queries = ledger.inputs["copy_queries"]
+        watermark = ledger.inputs["watermark"]
+        staged_uri = ledger.inputs.get("staged_uri")
+    elif config["ETL"]["LOADER"] == "stream":
+        # staging tables are loaded through COPY FROM STDIN
+        copy_queries = []
+    elif config["ETL"]["LOADER"] == "prestage":
+        # staging tables are loaded from right sized, compressed files,
+        # as many per slice of the cluster
+        copy_queries, staged_uri = prestage_tables(
+            config, storage, slice_count(config)
+        )
+    elif incremental:
+        copy_queries, watermark, loading = incremental_copy_queries(
+            storage, config
+        )
+
+    validator = None
+    if config["ETL"]["LOADER"] == "copy" and not resume:
+        # COPY loads the files as they are, so they are just checked before,
+        # the log_data files of windowed runs once dealt to the windows
+        validator = validator_from_config(config)
+        if validator is not None and window is None:
+            validate_sources(validator, config, storage, loading)
+
+    if checkpoint and not resume:
+        ledger.start(
+            {
+                "copy_queries": copy_queries,
+                "watermark": watermark,
+                "staged_uri": staged_uri,
+            }
+        )
+
+    # tracing every statement of the run
+    profiler = profiler_from_config("etl", config)
+
+    try:
+        if window is not None:
+            if config["ETL"]["LOADER"] != "copy":
+                raise ValueError("Windowed runs just work with the 'copy' loader.")
+
+            load_windows(
+                config,
+                storage,
+                *window,
+                insert_queries,
+                int(config["ETL"]["WORKERS"]),
+                profiler,
+                int(config["ETL"]["WINDOW_DAYS"]),
+                validator,
+            )
+
+        elif parallel:
+            load_parallel(
+                config,
+                copy_queries,
+                insert_queries,
+                int(config["ETL"]["WORKERS"]),
+                profiler,
+                storage,
+            )
+
+        else:
+            # connecting to redshift
+            conn = psycopg2.connect(
+                "host={} dbname={} user={} password={} port={}".format(
+                    *config["DB"].values()
+                )
+            )
+            cur = profiler.wrap(dialect.cursor(conn, target))
+            # committed, so rolled back transactions do not reset the session
+            for query in session_queries(config):
+                cur.execute(query)
+            conn.commit()
+
+            if ledger is not None:
+                # run scoped staging tables, resumable at the failing step
+                load_checkpointed(
+                    cur, conn, config, copy_queries, insert_queries, ledger, storage
+                )
+
+            else:
+                runner = runner or runner_from_config(config)
+
+                # creating temporary tables
+                create_staging_tables(cur, conn, runner)
+
+                # loading data
+                if config["ETL"]["LOADER"] == "stream":
+                    stream_staging_tables(conn, config, storage)
+                load_staging_tables(cur, conn, copy_queries, runner)
+                create_match_keys(cur, conn, runner)
+                if config["ETL"].getboolean("LOCAL_TRANSFORM"):
+                    # times are derived out of the database (the last insert)
+                    insert_tables(cur, conn, insert_queries[:-1], runner)
+                    load_times(cur, conn)
+                else:
+                    insert_tables(cur, conn, insert_queries, runner)
+                report_match_rate(cur)
+                backfill_songplays(cur, conn, int(config["ETL"]["BACKFILL_DAYS"]))
+                refresh_rollups(cur, conn)
+                runner.summary()
+
+            conn.close()
+
+    finally:
+        profiler.write_report()
+
+    # the watermark is just moved forward after a successful load
+    if watermark is not None:
+        save_watermark(config["ETL"]["WATERMARK"], watermark)
+
+    # results cached by the query client are invalidated by a new generation
+    bump_load_generation(config)
+
+    # prestaged files are kept until loaded, so a resumed run finds them
+    if staged_uri is not None:
+        prestage_delete(storage, staged_uri)
+
+    return profiler.records
+
 
 if __name__ == "__main__":
     # set logging
     logging.root.setLevel(logging.INFO)
-    
-    main()
+
+    parser = argparse.ArgumentParser(description="Sparkify ETL process.")
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="load just the files not ingested by previous runs",
+    )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="run independent statements at the same time",
+    )
+    parser.add_argument(
+        "--from",
+        dest="start",
+        type=date.fromisoformat,
+        help="first day (YYYY-MM-DD) of the log_data windows to be loaded",
+    )
+    parser.add_argument(
+        "--to",
+        dest="end",
+        type=date.fromisoformat,
+        help="last day (YYYY-MM-DD) of the log_data windows to be loaded",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        action="store_true",
+        help="stage into run scoped tables, recording each step in the run ledger",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="resume the last checkpointed run at its failing step",
+    )
+    parser.add_argument(
+        "--resize",
+        action="store_true",
+        help="scale the cluster out for the estimated input volume during the run",
+    )
+    parser.add_argument(
+        "--pause",
+        action="store_true",
+        help="pause the cluster after a resized run",
+    )
+    args = parser.parse_args()
+
+    window = None
+    if args.start or args.end:
+        window = (args.start or args.end, args.end or args.start)
+        if window[0] > window[1]:
+            parser.error("--from must not be after --to")
+
+    options = {
+        "incremental": args.incremental,
+        "parallel": args.parallel,
+        "window": window,
+        "checkpoint": args.checkpoint,
+        "resume": args.resume,
+    }
+
+    if args.resize:
+        main_resized(pause=args.pause, **options)
+    elif args.pause:
+        parser.error("--pause just works with --resize")
+    else:
+        main(**options)
@@ -0,0 +1,193 @@
+import logging
+import random
+import time
+
+
+def is_serialization_error(error):
+    """
+    Description: This function is responsible for telling whether an
+    error was raised by a concurrent transaction (SQLSTATE 40001 or the
+    Redshift serializable isolation violation), so it can be retried.
+
+    Arguments:
+        error (Exception, required): The raised error.
+
+    Returns:
+        bool: True when the transaction can be retried.
+    """
+    return (
+        getattr(error, "pgcode", None) == "40001"
+        or "Serializable isolation violation" in str(error)
+    )
+
+
+def transaction_units(queries, commit_every=0):
+    """
+    Description: This function is responsible for grouping statements
+    into the transactions committed at once.
+
+    Arguments:
+        queries (list, required): SQL statements.
+        commit_every (int, optional): Statements of each transaction
+        (0 commits them all at once).
+
+    Returns:
+        list: The statements of each transaction.
+    """
+    queries = list(queries)
+    if not queries:
+        return []
+
+    size = commit_every or len(queries)
+    return [queries[i : i + size] for i in range(0, len(queries), size)]
+
+
+def batch_statements(queries):
+    """
+    Description: This function is responsible for joining the statements
+    of a transaction into a multi-statement batch sent in one round trip.
+    Statements run by the runner take no parameters and return no rows,
+    so just the rowcount of the last one is lost.
+
+    Arguments:
+        queries (list, required): SQL statements of a transaction.
+
+    Returns:
+        str: The batch.
+    """
+    return ";\n".join(query.strip().rstrip(";") for query in queries)
+
+
+class TransactionRunner:
+    """
+    Description: This class is responsible for running statements grouped
+    into transactional units, each unit committed once and, optionally,
+    sent as multi-statement batches. A unit failing by a serialization
+    error is rolled back and retried with exponential backoff. The number
+    of statements, round trips, commits and retries are counted.
+    """
+
+    def __init__(self, commit_every=1, batch=False, retries=0, delay=1.0):
+        """
+        Description: This function is responsible for setting the unit
+        size, the batching and the retries. The defaults commit each
+        statement on its own round trip.
+
+        Arguments:
+            commit_every (int, optional): Statements of each transaction
+            (0 commits the statements of each call at once).
+            batch (bool, optional): Send the statements of a transaction
+            as multi-statement batches.
+            retries (int, optional): Retries of a transaction failing by
+            a serialization error.
+            delay (float, optional): Seconds waited before the first retry.
+
+        Returns:
+            None
+        """
+        self.commit_every = commit_every
+        self.batch = batch
+        self.retries = retries
+        self.delay = delay
+
+        self.statements = 0
+        self.round_trips = 0
+        self.commits = 0
+        self.retried = 0
+
+    def _run_unit(self, cur, conn, queries):
+        """
+        Description: This function is responsible for running and
+        committing a transaction, retrying serialization errors.
+
+        Arguments:
+            cur: the cursor object.
+            conn: connection to the database.
+            queries (list, required): SQL statements of the transaction.
+
+        Returns:
+            None
+        """
+        requests = [batch_statements(queries)] if self.batch else queries
+        attempt = 0
+        while True:
+            try:
+                for query in requests:
+                    cur.execute(query)
+                    self.round_trips += 1
+                conn.commit()
+                self.commits += 1
+                self.statements += len(queries)
+                return
+
+            except Exception as error:
+                conn.rollback()
+                if not is_serialization_error(error) or attempt >= self.retries:
+                    raise
+
+                attempt += 1
+                self.retried += 1
+                wait = random.uniform(0, self.delay * 2 ** (attempt - 1))
+                logging.warning(
+                    "Serialization error, transaction retry %d of %d in %.1fs."
+                    % (attempt, self.retries, wait)
+                )
+                time.sleep(wait)
+
+    def run(self, cur, conn, queries):
+        """
+        Description: This function is responsible for running statements
+        in transactional units.
+
+        Arguments:
+            cur: the cursor object.
+            conn: connection to the database.
+            queries (list, required): SQL statements, in execution order.
+
+        Returns:
+            None
+        """
+        for unit in transaction_units(queries, self.commit_every):
+            self._run_unit(cur, conn, unit)
+
+    def summary(self):
+        """
+        Description: This function is responsible for logging
+        the counters of the runner.
+
+        Arguments:
+            None
+
+        Returns:
+            dict: The statements, round trips, commits and retries.
+        """
+        counters = {
+            "statements": self.statements,
+            "round_trips": self.round_trips,
+            "commits": self.commits,
+            "retries": self.retried,
+        }
+        logging.info(
+            "Execution: %(statements)d statements, %(round_trips)d round trips, "
+            "%(commits)d commits, %(retries)d retries." % counters
+        )
+
+        return counters
+
+
+def runner_from_config(config):
+    """
+    Description: This function is responsible for creating a transaction
+    runner from the 'ETL' configurations.
+
+    Arguments:
+        config: the loaded configurations.
+
+    Returns:
+        TransactionRunner: The runner.
+    """
+    return TransactionRunner(
+        commit_every=int(config["ETL"]["COMMIT_EVERY"]),
+        batch=config["ETL"].getboolean("BATCH_STATEMENTS"),
+        retries=int(config["ETL"]["SERIALIZATION_RETRIES"]),
+    )
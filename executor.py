@@ -0,0 +1,335 @@
+import logging
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from psycopg2.pool import ThreadedConnectionPool
+
+import dialect
+
+# a statement of the DAG and the names of the steps it waits for
+Step = namedtuple("Step", ["name", "query", "depends_on"])
+
+_label_keywords = {
+    "ALTER", "ANALYZE", "COPY", "CREATE", "DELETE", "DROP", "EXISTS", "FROM",
+    "IF", "INSERT", "INTO", "NOT", "SCHEMA", "TABLE", "TEMP", "TEMPORARY",
+    "TRUNCATE", "UPDATE", "VACUUM",
+}
+
+
+def statement_label(query):
+    """
+    Description: This function is responsible for naming a statement
+    by its leading keywords and target (e.g. 'COPY staging_events' or
+    'INSERT INTO songs'). Batches of statements are named by the last one.
+
+    Arguments:
+        query (str, required): SQL statement.
+
+    Returns:
+        str: The statement label.
+    """
+    statements = [statement for statement in query.split(";") if statement.strip()]
+    words = statements[-1].split()
+    for i, word in enumerate(words):
+        if word.upper() not in _label_keywords:
+            return " ".join(words[: i + 1])
+
+    return " ".join(words)
+
+
+def connection_pool(config, size):
+    """
+    Description: This function is responsible for creating a thread safe
+    pool of connections to the database set in the 'DB' configurations.
+
+    Arguments:
+        config: the loaded configurations.
+        size (int, required): Maximum number of connections.
+
+    Returns:
+        ThreadedConnectionPool: The connection pool.
+    """
+    return ThreadedConnectionPool(
+        1,
+        size,
+        "host={} dbname={} user={} password={} port={}".format(*config["DB"].values()),
+    )
+
+
+def _run_step(pool, step, session_queries, started_at, profiler, target, delay=0.0):
+    """
+    Description: This function is responsible for executing a step
+    over a connection borrowed from the pool.
+
+    Arguments:
+        pool: the connection pool.
+        step (Step, required): The step to be executed.
+        session_queries (list, required): Statements setting the session up.
+        started_at (float, required): Run start (perf counter).
+        profiler (QueryProfiler, required): Profiler tracing the step, or None.
+        target (str, required): Database dialect ('redshift' or 'postgres').
+        delay (float, optional): Seconds waited before starting (retries).
+
+    Returns:
+        (float, float): Step start and end, in seconds since the run start.
+    """
+    time.sleep(delay)
+    conn = pool.getconn()
+    try:
+        cur = dialect.cursor(conn, target)
+        for query in session_queries:
+            cur.execute(query)
+
+        if profiler is not None:
+            cur = profiler.wrap(cur)
+
+        start = time.perf_counter() - started_at
+        cur.execute(step.query)
+        conn.commit()
+        end = time.perf_counter() - started_at
+
+        logging.info("Step '%s' done in %.2fs." % (step.name, end - start))
+        return start, end
+
+    except Exception:
+        conn.rollback()
+        raise
+
+    finally:
+        pool.putconn(conn)
+
+
+def declared_steps(named_queries, tables):
+    """
+    Description: This function is responsible for building the steps of
+    a DAG from the tables each statement reads and writes: a step depends
+    on the steps writing the tables it reads. Tables no scheduled step
+    writes (e.g. staged through COPY FROM STDIN) are considered loaded.
+
+    Arguments:
+        named_queries (list, required): (step name, statement) tuples.
+        tables (dict, required): (tables read, tables written) by step name.
+
+    Returns:
+        list: Steps of the DAG.
+    """
+    writers = {}
+    for name, _ in named_queries:
+        for table in tables[name][1]:
+            writers.setdefault(table, []).append(name)
+
+    steps = []
+    for name, query in named_queries:
+        depends_on = [
+            writer
+            for table in tables[name][0]
+            for writer in writers.get(table, [])
+            if writer != name
+        ]
+        steps.append(Step(name, query, sorted(set(depends_on))))
+
+    return steps
+
+
+def timeline(timings, path=(), width=60):
+    """
+    Description: This function is responsible for drawing a Gantt chart
+    of the steps, one bar per step in start order, over the run wall
+    clock. Steps of the critical path are marked with '*'.
+
+    Arguments:
+        timings (dict, required): (start, end) of each step by name.
+        path (list, optional): Step names of the critical path.
+        width (int, optional): Characters of the chart.
+
+    Returns:
+        str: The chart.
+    """
+    if not timings:
+        return ""
+
+    wall_clock = max(end for _, end in timings.values()) or 1.0
+    label = max(len(name) for name in timings)
+
+    lines = []
+    for name, (start, end) in sorted(timings.items(), key=lambda item: item[1]):
+        first = int(start / wall_clock * width)
+        last = max(first + 1, int(round(end / wall_clock * width)))
+        lines.append(
+            "%s %s |%s%s%s| %7.2fs - %7.2fs"
+            % (
+                "*" if name in path else " ",
+                name.ljust(label),
+                " " * first,
+                "#" * (last - first),
+                " " * (width - last),
+                start,
+                end,
+            )
+        )
+
+    return "\n".join(lines)
+
+
+def critical_path(steps, timings):
+    """
+    Description: This function is responsible for finding the chain of
+    dependent steps with the longest summed duration.
+
+    Arguments:
+        steps (list, required): The executed steps.
+        timings (dict, required): (start, end) of each step by name.
+
+    Returns:
+        (list, float): The step names of the critical path and its duration.
+    """
+    by_name = {step.name: step for step in steps}
+    longest = {}
+
+    def visit(name):
+        if name not in longest:
+            start, end = timings[name]
+            previous = max(
+                (visit(dep) for dep in by_name[name].depends_on if dep in by_name),
+                key=lambda path: path[1],
+                default=([], 0.0),
+            )
+            longest[name] = (previous[0] + [name], previous[1] + end - start)
+        return longest[name]
+
+    return max(
+        (visit(name) for name in by_name), key=lambda path: path[1], default=([], 0.0)
+    )
+
+
+def run_dag(
+    pool,
+    steps,
+    max_workers,
+    session_queries=(),
+    profiler=None,
+    target="redshift",
+    retries=0,
+    keep_going=False,
+):
+    """
+    Description: This function is responsible for executing statements
+    concurrently over a bounded connection pool. A step starts as soon as
+    all the steps it depends on are done. Dependencies on steps that are
+    not scheduled are considered satisfied. A failed step is retried up to
+    'retries' times, with exponential backoff. When it still fails, no other
+    step is started and the error is raised after the running ones end or,
+    with keep_going, just the steps depending on it are skipped.
+
+    Arguments:
+        pool: the connection pool.
+        steps (list, required): Steps to be executed.
+        max_workers (int, required): Maximum number of concurrent statements.
+        session_queries (list, optional): Statements executed on the
+        connection before each step (e.g. SET search_path).
+        profiler (QueryProfiler, optional): Profiler tracing the steps.
+        target (str, optional): Database dialect ('redshift' or 'postgres').
+        retries (int, optional): Maximum number of retries of a step.
+        keep_going (bool, optional): Run the steps not depending on a
+        failed step instead of raising its error.
+
+    Returns:
+        dict: The run report, with the (start, end) of each step by name
+        in seconds since the run start ('timings'), the 'wall_clock'
+        duration, the 'critical_path' steps and duration, and the error of
+        each 'failed' step and the 'skipped' steps (with keep_going).
+    """
+    by_name = {step.name: step for step in steps}
+    pending = {
+        step.name: set(dep for dep in step.depends_on if dep in by_name)
+        for step in steps
+    }
+    timings = {}
+    running = {}
+    attempts = {name: 0 for name in by_name}
+    failed, skipped = {}, []
+    error = None
+
+    started_at = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            # starting every step with its dependencies done
+            if error is None:
+                for name in [name for name, deps in pending.items() if not deps]:
+                    del pending[name]
+                    delay = min(30.0, 2.0 ** attempts[name]) if attempts[name] else 0.0
+                    future = executor.submit(
+                        _run_step,
+                        pool,
+                        by_name[name],
+                        session_queries,
+                        started_at,
+                        profiler,
+                        target,
+                        delay,
+                    )
+                    running[future] = name
+
+            if not running:
+                if pending and error is None:
+                    raise ValueError("Cyclic dependencies among %s." % list(pending))
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timings[name] = future.result()
+                except Exception as step_error:
+                    attempts[name] += 1
+                    if attempts[name] <= retries:
+                        logging.warning(
+                            "Step '%s' failed (%s), retry %d of %d."
+                            % (name, step_error, attempts[name], retries)
+                        )
+                        pending[name] = set()
+                        continue
+
+                    logging.error("Step '%s' failed: %s" % (name, step_error))
+                    failed[name] = step_error
+                    if not keep_going:
+                        error = error or step_error
+                        continue
+
+                    # skipping the steps depending on the failed one
+                    blocked = {name}
+                    while True:
+                        names = [n for n, deps in pending.items() if deps & blocked]
+                        if not names:
+                            break
+                        for blocked_name in names:
+                            del pending[blocked_name]
+                            blocked.add(blocked_name)
+                            skipped.append(blocked_name)
+                            logging.warning("Step '%s' skipped." % blocked_name)
+                    continue
+
+                for deps in pending.values():
+                    deps.discard(name)
+
+    if error is not None:
+        raise error
+
+    wall_clock = time.perf_counter() - started_at
+    path, path_duration = critical_path(
+        [step for step in steps if step.name in timings], timings
+    )
+    logging.info(
+        "DAG done in %.2fs (wall clock). Critical path %.2fs: %s."
+        % (wall_clock, path_duration, " -> ".join(path))
+    )
+    logging.info("DAG timeline:\n%s" % timeline(timings, path))
+
+    return {
+        "timings": timings,
+        "wall_clock": wall_clock,
+        "critical_path": (path, path_duration),
+        "failed": {name: str(step_error) for name, step_error in failed.items()},
+        "skipped": skipped,
+    }
@@ -0,0 +1,338 @@
+import json
+import math
+import time
+from array import array
+from itertools import accumulate
+
+try:
+    # optional faster JSON parser, reading memoryviews with no copy
+    from orjson import loads as _orjson_loads
+except ImportError:
+    _orjson_loads = None
+
+# bytes read from a stream at once
+_chunk_size = 1 << 20
+# records parsed before being moved to the columns, small enough to stay
+# in the CPU caches
+_parsed_rows = 4096
+
+
+def _number(value):
+    """
+    Description: This function is responsible for converting a JSON value
+    of a numeric field to a double.
+
+    Arguments:
+        value: the JSON value.
+
+    Returns:
+        float: The number, NaN for NULL and values that are not numbers.
+    """
+    try:
+        return float(value) if value not in (None, "") else math.nan
+    except (TypeError, ValueError):
+        return math.nan
+
+
+def _text(value):
+    """
+    Description: This function is responsible for converting a JSON value
+    of a text field that is not a string to text.
+
+    Arguments:
+        value: the JSON value.
+
+    Returns:
+        str: The JSON text, empty for NULL.
+    """
+    return "" if value is None else json.dumps(value)
+
+
+def parse_line(line):
+    """
+    Description: This function is responsible for parsing a JSON line
+    held by a memoryview, with orjson when installed (which reads the view
+    as it is) or the json module (which needs a bytes copy).
+
+    Arguments:
+        line (memoryview, required): The JSON line.
+
+    Returns:
+        The JSON value.
+    """
+    if _orjson_loads is not None:
+        return _orjson_loads(line)
+
+    return json.loads(line.tobytes())
+
+
+def iter_lines(stream, buffer=None):
+    """
+    Description: This function is responsible for splitting a binary
+    stream (file object or botocore StreamingBody) into lines, reading it
+    in chunks into a reused buffer. Lines are yielded as memoryviews of
+    the buffer, with no per line copy, so memory is bounded by the chunk
+    size (or the longest line) and not by the stream size. A view is
+    valid just until the next line is requested.
+
+    Arguments:
+        stream (required): Binary stream with a read (or readinto) method.
+        buffer (bytearray, optional): Buffer reused across streams (many
+        small objects), whose size is the bytes read at once.
+
+    Returns:
+        generator: memoryviews of the lines, without the line breaks.
+    """
+    if buffer is None:
+        buffer = bytearray(_chunk_size)
+    view = memoryview(buffer)
+    readinto = getattr(stream, "readinto", None)
+    start = end = 0
+
+    while True:
+        if start:
+            # the partial last line is moved to the buffer start
+            buffer[: end - start] = view[start:end]
+            end -= start
+            start = 0
+        elif end == len(buffer):
+            # a line longer than the buffer, which is doubled
+            view.release()
+            buffer = buffer + bytearray(len(buffer))
+            view = memoryview(buffer)
+
+        if readinto is not None:
+            read = readinto(view[end:])
+        else:
+            data = stream.read(len(buffer) - end)
+            read = len(data)
+            view[end : end + read] = data
+        if not read:
+            break
+        end += read
+
+        newline = buffer.find(b"\n", start, end)
+        while newline >= 0:
+            yield view[start:newline]
+            start = newline + 1
+            newline = buffer.find(b"\n", start, end)
+
+    if start < end:
+        yield view[start:end]
+
+    view.release()
+
+
+class ColumnBatch:
+    """
+    Description: This class is responsible for holding a batch of records
+    column by column in typed arrays instead of a list of dicts: numeric
+    fields as doubles (NaN for NULL), text fields as their UTF-8 bytes
+    concatenated in a bytearray, with an array of offsets and a NULL mask.
+    """
+
+    def __init__(self, fields, numeric):
+        """
+        Description: This function is responsible for creating the
+        empty columns of the fields.
+
+        Arguments:
+            fields (list, required): Field names, in the jsonpaths order.
+            numeric (set, required): Lower case numeric field names.
+
+        Returns:
+            None
+        """
+        self.fields = list(fields)
+        self.numeric = {field for field in self.fields if field.lower() in numeric}
+        self.rows = 0
+
+        self.numbers = {field: array("d") for field in self.numeric}
+        self.data = {}
+        self.offsets = {}
+        self.nulls = {}
+        for field in self.fields:
+            if field not in self.numeric:
+                self.data[field] = bytearray()
+                self.offsets[field] = array("q", [0])
+                self.nulls[field] = bytearray()
+
+    def __len__(self):
+        return self.rows
+
+    def nbytes(self):
+        """
+        Description: This function is responsible for computing the
+        bytes held by the columns.
+
+        Arguments:
+            None
+
+        Returns:
+            int: The size of the column buffers.
+        """
+        size = sum(len(values) * values.itemsize for values in self.numbers.values())
+        for field in self.data:
+            size += len(self.data[field]) + len(self.nulls[field])
+            size += len(self.offsets[field]) * self.offsets[field].itemsize
+
+        return size
+
+    def extend(self, records):
+        """
+        Description: This function is responsible for appending records
+        to the columns, a column at a time. Numeric values that are not
+        numbers are NULL, other text values are their JSON text.
+
+        Arguments:
+            records (list, required): JSON records.
+
+        Returns:
+            None
+        """
+        for field, numbers in self.numbers.items():
+            values = [record.get(field) for record in records]
+            try:
+                # the common case, all values are numbers
+                numbers.extend(array("d", values))
+            except TypeError:
+                numbers.extend(array("d", map(_number, values)))
+
+        for field, data in self.data.items():
+            values = [record.get(field) for record in records]
+            try:
+                # the common case, all values are strings
+                text = "".join(values)
+                self.nulls[field] += bytes(len(values))
+            except TypeError:
+                self.nulls[field] += bytes(value is None for value in values)
+                values = [
+                    value if value.__class__ is str else _text(value)
+                    for value in values
+                ]
+                text = "".join(values)
+
+            if text.isascii():
+                # characters are bytes, the column is encoded at once
+                data += text.encode("ascii")
+                lengths = map(len, values)
+            else:
+                encoded = [value.encode("utf-8") for value in values]
+                data += b"".join(encoded)
+                lengths = map(len, encoded)
+
+            offsets = self.offsets[field]
+            offsets.extend(accumulate(lengths, initial=offsets[-1]))
+            # the initial offset was the last one already there
+            del offsets[-len(values) - 1]
+
+        self.rows += len(records)
+
+    def column(self, field):
+        """
+        Description: This function is responsible for reading a column.
+
+        Arguments:
+            field (str, required): Field name.
+
+        Returns:
+            array|list: The doubles of a numeric field or the strings
+            (None for NULL) of a text field.
+        """
+        if field in self.numbers:
+            return self.numbers[field]
+
+        data, offsets, nulls = self.data[field], self.offsets[field], self.nulls[field]
+        return [
+            None if nulls[i] else data[offsets[i] : offsets[i + 1]].decode("utf-8")
+            for i in range(self.rows)
+        ]
+
+
+def read_batches(objects, fields, numeric, rejected, batch_rows=50000):
+    """
+    Description: This function is responsible for reading the JSON lines
+    of each object into column batches of at most batch_rows records.
+    Lines that are not valid JSON objects are counted as rejected and
+    skipped. Records are moved to the columns a few thousand at a time,
+    so just a few dicts are alive at once.
+
+    Arguments:
+        objects (iterable, required): (name, binary stream) tuples.
+        fields (list, required): Field names, in the jsonpaths order.
+        numeric (set, required): Lower case numeric field names.
+        rejected (dict, required): Rejected lines counter by object name.
+        batch_rows (int, optional): Maximum number of records in a batch.
+
+    Returns:
+        generator: ColumnBatch objects.
+    """
+    batch = ColumnBatch(fields, numeric)
+    records = []
+    buffer = bytearray(_chunk_size)
+    for name, stream in objects:
+        for line in iter_lines(stream, buffer):
+            if not line:
+                continue
+
+            try:
+                record = parse_line(line)
+            except ValueError:
+                if not line.tobytes().strip():
+                    # blank lines are not rejected
+                    continue
+                record = None
+
+            if not isinstance(record, dict):
+                rejected[name] = rejected.get(name, 0) + 1
+                continue
+
+            records.append(record)
+            if len(records) == _parsed_rows or batch.rows + len(records) == batch_rows:
+                batch.extend(records)
+                records = []
+                if batch.rows == batch_rows:
+                    yield batch
+                    batch = ColumnBatch(fields, numeric)
+
+    batch.extend(records)
+    if batch.rows:
+        yield batch
+
+
+def reader_throughput(objects, fields, numeric, batch_rows=50000):
+    """
+    Description: This function is responsible for measuring the throughput
+    of the streaming reader over objects.
+
+    Arguments:
+        objects (iterable, required): (name, binary stream) tuples.
+        fields (list, required): Field names, in the jsonpaths order.
+        numeric (set, required): Lower case numeric field names.
+        batch_rows (int, optional): Maximum number of records in a batch.
+
+    Returns:
+        dict: Bytes and records read, rejected lines, seconds and MB/s.
+    """
+    read_bytes = [0]
+
+    def counted(objects):
+        for name, stream in objects:
+            start = stream.tell()
+            yield name, stream
+            read_bytes[0] += stream.tell() - start
+
+    rejected = {}
+    rows = 0
+    start = time.perf_counter()
+    for batch in read_batches(counted(objects), fields, numeric, rejected, batch_rows):
+        rows += batch.rows
+    elapsed = time.perf_counter() - start
+
+    return {
+        "bytes": read_bytes[0],
+        "rows": rows,
+        "rejected": sum(rejected.values()),
+        "seconds": elapsed,
+        "mb_per_second": read_bytes[0] / elapsed / (1 << 20) if elapsed else 0.0,
+    }
@@ -0,0 +1,216 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from datetime import datetime
+
+ledger_tables_create = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    process TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    inputs TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS steps (
+    run_id TEXT NOT NULL REFERENCES runs (run_id),
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    rows INTEGER,
+    wall_time REAL,
+    finished_at TEXT NOT NULL,
+    error TEXT,
+    PRIMARY KEY (run_id, step)
+);
+"""
+
+last_failed_run_select = """
+SELECT run_id, inputs
+FROM runs
+WHERE process = ? AND status != 'done'
+ORDER BY started_at DESC
+LIMIT 1
+"""
+
+
+class RunLedger:
+    """
+    Description: This class is responsible for keeping the ledger of the
+    runs of a process in a local SQLite database: the inputs of each run
+    (e.g. its COPY statements and manifests) and the completion of each of
+    its steps, so a failed run can be resumed at the failing step with the
+    very same inputs.
+    """
+
+    def __init__(self, filepath, process):
+        """
+        Description: This function is responsible for opening the
+        ledger, creating its tables when needed.
+
+        Arguments:
+            filepath (str, required): Ledger database file path.
+            process (str, required): Name of the process (e.g. 'etl').
+
+        Returns:
+            None
+        """
+        self.process = process
+        self.run_id = None
+        self.inputs = None
+
+        self._db = sqlite3.connect(filepath)
+        self._db.executescript(ledger_tables_create)
+
+    def start(self, inputs):
+        """
+        Description: This function is responsible for starting a new run.
+
+        Arguments:
+            inputs (dict, required): JSON serializable inputs of the run.
+
+        Returns:
+            str: The run id.
+        """
+        self.run_id = uuid.uuid4().hex[:13]
+        self.inputs = inputs
+
+        with self._db:
+            self._db.execute(
+                "INSERT INTO runs VALUES (?, ?, 'running', ?, NULL, ?)",
+                (
+                    self.run_id,
+                    self.process,
+                    datetime.utcnow().isoformat(),
+                    json.dumps(inputs),
+                ),
+            )
+
+        logging.info("Ledger: run %s started." % self.run_id)
+        return self.run_id
+
+    def resume(self):
+        """
+        Description: This function is responsible for resuming the last
+        run of the process that did not finish.
+
+        Arguments:
+            None
+
+        Returns:
+            str: The run id, or None when every run finished.
+        """
+        row = self._db.execute(last_failed_run_select, (self.process,)).fetchone()
+        if row is None:
+            return None
+
+        self.run_id, inputs = row
+        self.inputs = json.loads(inputs)
+
+        with self._db:
+            self._db.execute(
+                "UPDATE runs SET status = 'running' WHERE run_id = ?", (self.run_id,)
+            )
+
+        logging.info(
+            "Ledger: resuming run %s, %d steps already done."
+            % (self.run_id, len(self.done_steps()))
+        )
+        return self.run_id
+
+    def done_steps(self):
+        """
+        Description: This function is responsible for listing the
+        steps of the run already done.
+
+        Arguments:
+            None
+
+        Returns:
+            set: The names of the done steps.
+        """
+        rows = self._db.execute(
+            "SELECT step FROM steps WHERE run_id = ? AND status = 'done'",
+            (self.run_id,),
+        )
+        return {step for step, in rows}
+
+    def _record(self, step, status, rows=None, wall_time=None, error=None):
+        """
+        Description: This function is responsible for recording
+        the outcome of a step.
+
+        Arguments:
+            step (str, required): Step name.
+            status (str, required): 'done' or 'failed'.
+            rows (int, optional): Rows affected by the step.
+            wall_time (float, optional): Execution time in seconds.
+            error (str, optional): Error of a failed step.
+
+        Returns:
+            None
+        """
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.run_id,
+                    step,
+                    status,
+                    rows,
+                    wall_time,
+                    datetime.utcnow().isoformat(),
+                    error,
+                ),
+            )
+
+    def checkpoint(self, step, action):
+        """
+        Description: This function is responsible for running a step just
+        when it is not done yet, recording its completion (or its error)
+        once the action returns. The action must commit its own work.
+
+        Arguments:
+            step (str, required): Step name.
+            action (callable, required): Function running the step,
+            returning the rows affected (or None).
+
+        Returns:
+            bool: True when the step was run, False when it was skipped.
+        """
+        if step in self.done_steps():
+            logging.info("Ledger: step '%s' already done, skipped." % step)
+            return False
+
+        start = time.perf_counter()
+        try:
+            rows = action()
+        except Exception as error:
+            self._record(step, "failed", error=str(error))
+            self.finish("failed")
+            raise
+
+        self._record(
+            step, "done", rows=rows, wall_time=round(time.perf_counter() - start, 3)
+        )
+        return True
+
+    def finish(self, status="done"):
+        """
+        Description: This function is responsible for closing the run.
+
+        Arguments:
+            status (str, optional): 'done' or 'failed'.
+
+        Returns:
+            None
+        """
+        with self._db:
+            self._db.execute(
+                "UPDATE runs SET status = ?, finished_at = ? WHERE run_id = ?",
+                (status, datetime.utcnow().isoformat(), self.run_id),
+            )
+
+        logging.info("Ledger: run %s %s." % (self.run_id, status))
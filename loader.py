@@ -0,0 +1,343 @@
+import io
+import json
+import logging
+import os
+import re
+import time
+
+from jsonstream import iter_lines, parse_line
+from storage import parse_s3_uri
+
+from sql_queries import (
+    staging_events_fields,
+    staging_events_table_create,
+    staging_songs_fields,
+    staging_songs_table_create,
+)
+
+# staging table, folder in the data directory, loaded JSON fields and DDL
+staging_sources = [
+    (
+        "staging_events",
+        "log_data",
+        staging_events_fields,
+        staging_events_table_create,
+    ),
+    (
+        "staging_songs",
+        "song_data",
+        staging_songs_fields,
+        staging_songs_table_create,
+    ),
+]
+
+_jsonpath = re.compile(r"^\$(?:\['([^']+)'\]|\.(\w+))$")
+_column = re.compile(r"^\s*(\w+)\s+(\w+)(?:\((\d+)(?:,\s*(\d+))?\))?", re.M)
+_numeric_types = {"INTEGER", "SMALLINT", "BIGINT", "NUMERIC", "DECIMAL", "REAL", "DOUBLE"}
+
+# escapes of the PostgreSQL COPY text format
+_copy_escapes = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+_needs_escape = re.compile(r"[\\\t\n\r]").search
+
+
+def jsonpath_fields(document):
+    """
+    Description: This function is responsible for reading the field names
+    of a Redshift jsonpaths document (e.g. "$['artist_id']" or "$.artist_id").
+    Just top level fields are supported, as in the Sparkify jsonpaths files.
+
+    Arguments:
+        document (dict, required): The jsonpaths document.
+
+    Returns:
+        list: Field names, in the jsonpaths order.
+    """
+    fields = []
+    for path in document["jsonpaths"]:
+        match = _jsonpath.match(path)
+        if match is None:
+            raise ValueError("Unsupported jsonpath %s." % path)
+        fields.append(match.group(1) or match.group(2))
+
+    return fields
+
+
+def table_columns(create_query):
+    """
+    Description: This function is responsible for reading the columns
+    of a table definition.
+
+    Arguments:
+        create_query (str, required): CREATE TABLE statement.
+
+    Returns:
+        list: (name, upper case type, precision, scale) tuples, in the
+        table order. Precision and scale are None when not declared.
+    """
+    body = create_query[create_query.index("(") + 1 : create_query.rindex(")")]
+
+    return [
+        (
+            name,
+            sql_type.upper(),
+            int(precision) if precision else None,
+            int(scale) if scale else None,
+        )
+        for name, sql_type, precision, scale in _column.findall(body)
+    ]
+
+
+def numeric_columns(create_query):
+    """
+    Description: This function is responsible for finding the numeric
+    columns of a table definition.
+
+    Arguments:
+        create_query (str, required): CREATE TABLE statement.
+
+    Returns:
+        set: Lower case numeric column names.
+    """
+    return {
+        name.lower()
+        for name, sql_type, _, _ in table_columns(create_query)
+        if sql_type in _numeric_types
+    }
+
+
+def local_objects(directory):
+    """
+    Description: This function is responsible for opening, one at a time,
+    the JSON files found in a directory tree.
+
+    Arguments:
+        directory (str, required): Directory path.
+
+    Returns:
+        generator: (file name, iterable of lines) tuples.
+    """
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for filename in sorted(files):
+            if not filename.endswith(".json"):
+                continue
+
+            with open(os.path.join(root, filename), "rb") as json_file:
+                yield filename, json_file
+
+
+def s3_objects(storage, uri, objects=None):
+    """
+    Description: This function is responsible for opening, one at a
+    time, the objects stored under an s3 uri. Objects are prefetched
+    concurrently by the storage, from its cache when already downloaded.
+
+    Arguments:
+        storage (S3Storage, required): S3 access layer.
+        uri (str, required): S3 uri (s3://bucket/prefix).
+        objects (list, optional): Objects already listed under the uri.
+
+    Returns:
+        generator: (object key, binary stream) tuples.
+    """
+    bucket, _ = parse_s3_uri(uri)
+    if objects is None:
+        objects = storage.list_objects(uri)
+
+    for obj, content in storage.fetch(bucket, objects):
+        if not isinstance(content, str):
+            # the body, streamed when there is no cache
+            yield obj["key"], content
+            continue
+
+        with open(content, "rb") as object_file:
+            yield obj["key"], object_file
+
+
+def parse_records(objects, rejected):
+    """
+    Description: This function is responsible for parsing the JSON lines
+    of each object. Objects are read by the streaming reader (jsonstream),
+    in chunks into a buffer reused by every object, so an object is never
+    held in memory as a whole. Lines that are not valid JSON objects are
+    counted as rejected and skipped, instead of failing the whole load.
+
+    Arguments:
+        objects (iterable, required): (name, binary stream) tuples.
+        rejected (dict, required): Rejected lines counter by object name.
+
+    Returns:
+        generator: JSON records.
+    """
+    # bytes read at once, most song_data objects fit at once
+    buffer = bytearray(1 << 20)
+    for name, stream in objects:
+        for line in iter_lines(stream, buffer):
+            try:
+                record = parse_line(line)
+            except ValueError:
+                if not line.tobytes().strip():
+                    # blank lines are not rejected
+                    continue
+                record = None
+
+            if not isinstance(record, dict):
+                rejected[name] = rejected.get(name, 0) + 1
+                continue
+
+            yield record
+
+
+def copy_lines(records, fields, numeric):
+    """
+    Description: This function is responsible for mapping records to
+    lines of the PostgreSQL COPY text format, in the jsonpaths order.
+    Missing fields are loaded as NULL, as empty strings in numeric columns.
+
+    Arguments:
+        records (iterable, required): JSON records.
+        fields (list, required): Field names, in the jsonpaths order.
+        numeric (set, required): Lower case numeric column names.
+
+    Returns:
+        generator: COPY text lines.
+    """
+    columns = [(field, field.lower() in numeric) for field in fields]
+
+    # the common cases are checked first, as this is the loader hot loop
+    for record in records:
+        values = []
+        for field, is_numeric in columns:
+            value = record.get(field)
+
+            if value is None:
+                values.append("\\N")
+            elif value.__class__ is str:
+                if not value:
+                    values.append("\\N" if is_numeric else "")
+                elif _needs_escape(value):
+                    values.append(value.translate(_copy_escapes))
+                else:
+                    values.append(value)
+            elif value is True or value is False:
+                values.append("true" if value else "false")
+            else:
+                values.append(str(value))
+
+        yield "\t".join(values) + "\n"
+
+
+def copy_batches(lines, batch_rows):
+    """
+    Description: This function is responsible for grouping COPY lines in
+    in-memory buffers of at most batch_rows lines, so memory is bounded
+    by the batch size and not by the input size.
+
+    Arguments:
+        lines (iterable, required): COPY text lines.
+        batch_rows (int, required): Maximum number of lines in a buffer.
+
+    Returns:
+        generator: (buffer, number of lines) tuples.
+    """
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == batch_rows:
+            yield io.StringIO("".join(batch)), len(batch)
+            batch = []
+
+    if batch:
+        yield io.StringIO("".join(batch)), len(batch)
+
+
+def copy_records(cur, table, fields, numeric, records, batch_rows):
+    """
+    Description: This function is responsible for pushing records to a
+    table through COPY FROM STDIN, one bounded batch at a time.
+
+    Arguments:
+        cur: the cursor object (psycopg2 cursor supporting copy_expert).
+        table (str, required): Target table.
+        fields (list, required): Field names, in the jsonpaths order.
+        numeric (set, required): Lower case numeric column names.
+        records (iterable, required): JSON records.
+        batch_rows (int, required): Maximum number of rows in a batch.
+
+    Returns:
+        int: Number of loaded rows.
+    """
+    copy = "COPY %s (%s) FROM STDIN" % (table, ", ".join(fields))
+
+    rows = 0
+    for buffer, size in copy_batches(copy_lines(records, fields, numeric), batch_rows):
+        cur.copy_expert(copy, buffer)
+        rows += size
+
+    return rows
+
+
+def stream_staging_tables(conn, config, storage=None, batch_rows=50000):
+    """
+    Description: This function is responsible for loading the staging
+    tables through COPY FROM STDIN, streaming the JSON files from the
+    '[ETL] local_data' directory (laid out as the udacity-dend bucket) or,
+    when it is not set, from the '[S3]' log_data and song_data uris. It is
+    the loader of targets that can not COPY from s3 (e.g. PostgreSQL).
+    With '[ETL] validate', rejected records are quarantined, not loaded.
+
+    Arguments:
+        conn: connection to the database.
+        config: the loaded configurations.
+        storage (S3Storage): S3 access layer (required to read from s3).
+        batch_rows (int, optional): Maximum number of rows in a COPY batch.
+
+    Returns:
+        dict: Number of loaded rows by staging table.
+    """
+    data_dir = config["ETL"]["LOCAL_DATA"]
+    s3_sources = {
+        "staging_events": (config["S3"]["LOG_DATA"], config["S3"]["LOG_JSONPATH"]),
+        "staging_songs": (config["S3"]["SONG_DATA"], config["S3"]["SONG_JSONPATH"]),
+    }
+
+    # avoiding an import cycle, as validation reads the table definitions
+    from validation import validator_from_config
+
+    validator = validator_from_config(config)
+    cur = conn.cursor()
+    loaded = {}
+
+    for table, folder, fields, create_query in staging_sources:
+        logging.info("Streaming data to %s." % table)
+        start = time.perf_counter()
+
+        if data_dir:
+            objects = local_objects(os.path.join(data_dir, folder))
+        else:
+            uri, jsonpath_uri = s3_sources[table]
+            bucket, key = parse_s3_uri(jsonpath_uri)
+            body = storage.s3_client.get_object(Bucket=bucket, Key=key)["Body"]
+            fields = jsonpath_fields(json.loads(body.read()))
+            objects = s3_objects(storage, uri)
+
+        rejected = {}
+        records = parse_records(objects, rejected)
+        if validator is not None:
+            records = validator.filter(table, fields, create_query, records)
+        rows = copy_records(
+            cur, table, fields, numeric_columns(create_query), records, batch_rows
+        )
+        conn.commit()
+
+        elapsed = time.perf_counter() - start
+        loaded[table] = rows
+
+        logging.info(
+            "Loaded %d rows to %s in %.2fs (%.0f rows/s)."
+            % (rows, table, elapsed, rows / elapsed if elapsed else 0.0)
+        )
+        for name, count in rejected.items():
+            logging.warning("Rejected %d invalid lines of %s." % (count, name))
+
+    return loaded
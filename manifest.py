@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import uuid
+
+from storage import parse_s3_uri
+
+
+def load_watermark(filepath):
+    """
+    Description: This function is responsible for reading the
+    watermark of already ingested s3 objects from the local disk.
+
+    Arguments:
+        filepath (str, required): Watermark file path.
+
+    Returns:
+        dict: Ingested objects by source uri and key. It is empty
+        when the file does not exist yet.
+    """
+    if not os.path.exists(filepath):
+        return {}
+
+    with open(filepath) as watermark_file:
+        return json.load(watermark_file)
+
+
+def save_watermark(filepath, watermark):
+    """
+    Description: This function is responsible for persisting the
+    watermark of ingested s3 objects. The file is replaced atomically,
+    so an interrupted run never leaves a partial watermark behind.
+
+    Arguments:
+        filepath (str, required): Watermark file path.
+        watermark (dict, required): Ingested objects by source uri and key.
+
+    Returns:
+        None
+    """
+    tmp_filepath = "%s.tmp" % filepath
+    with open(tmp_filepath, "w") as watermark_file:
+        json.dump(watermark, watermark_file, indent=1, sort_keys=True)
+
+    os.replace(tmp_filepath, filepath)
+
+
+def new_objects(objects, ingested):
+    """
+    Description: This function is responsible for selecting the objects
+    that were not ingested yet. An object is considered new when its key
+    is unknown or when its ETag or LastModified changed.
+
+    Arguments:
+        objects (iterable, required): Objects listed by the storage.
+        ingested (dict, required): Ingested objects of the source by key.
+
+    Returns:
+        list: Objects to be loaded.
+    """
+    return [
+        obj
+        for obj in objects
+        if ingested.get(obj["key"])
+        != {"etag": obj["etag"], "last_modified": obj["last_modified"]}
+    ]
+
+
+def build_manifest(bucket, objects):
+    """
+    Description: This function is responsible for building a Redshift
+    COPY manifest listing the given objects.
+    (More: https://docs.aws.amazon.com/redshift/latest/dg/loading-data-files-using-manifest.html)
+
+    Arguments:
+        bucket (str, required): Bucket name of the objects.
+        objects (list, required): Objects listed by the storage.
+
+    Returns:
+        dict: The manifest content.
+    """
+    return {
+        "entries": [
+            {
+                "url": "s3://%s/%s" % (bucket, obj["key"]),
+                "mandatory": True,
+                "meta": {"content_length": obj["size"]},
+            }
+            for obj in objects
+        ]
+    }
+
+
+def upload_manifest(s3_client, uri, manifest):
+    """
+    Description: This function is responsible for uploading a
+    manifest to s3.
+
+    Arguments:
+        s3_client: boto3 s3 client.
+        uri (str, required): S3 uri of the manifest file.
+        manifest (dict, required): The manifest content.
+
+    Returns:
+        None
+    """
+    bucket, key = parse_s3_uri(uri)
+    s3_client.put_object(
+        Body=json.dumps(manifest).encode("UTF-8"),
+        Bucket=bucket,
+        Key=key,
+    )
+
+
+def prepare_incremental_load(storage, sources, watermark, manifest_prefix):
+    """
+    Description: This function is responsible for finding the new objects
+    of each source, uploading a manifest holding just them and filling
+    the manifest COPY statement of the source.
+
+    Arguments:
+        storage (S3Storage, required): S3 access layer.
+        sources (list, required): (manifest copy query, source uri) tuples.
+        watermark (dict, required): Ingested objects by source uri and key.
+        manifest_prefix (str, required): S3 uri where manifests are stored.
+
+    Returns:
+        (list, dict, dict): The COPY statements to be executed, the
+        watermark to be saved once the load succeeds and the objects to be
+        loaded by source uri.
+    """
+    queries = []
+    pending = {}
+    loading = {}
+    run_id = uuid.uuid4().hex[:13]
+
+    for query, uri in sources:
+        objects = storage.list_objects(uri)
+        ingested = watermark.get(uri, {})
+        objects_to_load = new_objects(objects, ingested)
+        loading[uri] = objects_to_load
+
+        logging.info(
+            "Incremental load: %d of %d objects are new in %s."
+            % (len(objects_to_load), len(objects), uri)
+        )
+
+        # keeping just the objects still present in the source
+        pending[uri] = {
+            obj["key"]: {"etag": obj["etag"], "last_modified": obj["last_modified"]}
+            for obj in objects
+        }
+
+        # COPY fails with an empty manifest, so nothing is loaded
+        if not objects_to_load:
+            continue
+
+        bucket, prefix = parse_s3_uri(uri)
+        manifest_uri = "%s/%s/%s.manifest" % (
+            manifest_prefix.rstrip("/"),
+            run_id,
+            prefix.strip("/").replace("/", "_"),
+        )
+        upload_manifest(
+            storage.s3_client, manifest_uri, build_manifest(bucket, objects_to_load)
+        )
+        queries.append(query.format(manifest_uri))
+
+    return queries, pending, loading
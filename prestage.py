@@ -0,0 +1,355 @@
+import gzip
+import logging
+import os
+import shutil
+import tempfile
+import uuid
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from loader import parse_records, s3_objects, staging_sources, table_columns
+from splitter import Splitter, chunk_count, node_slices
+from storage import parse_s3_uri, with_retry
+
+try:
+    # optional, without it files are written as gzip delimited text
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# escapes of the Redshift COPY delimited text format with ESCAPE
+_text_escapes = str.maketrans(
+    {"\\": "\\\\", "\t": "\\\t", "\n": "\\\n", "\r": "\\\r"}
+)
+
+# bounds of the integer types
+_integer_bounds = {
+    "SMALLINT": (-(2**15), 2**15 - 1),
+    "INTEGER": (-(2**31), 2**31 - 1),
+    "BIGINT": (-(2**63), 2**63 - 1),
+}
+_decimal_types = {"NUMERIC", "DECIMAL"}
+
+
+def _converter(sql_type, precision, scale):
+    """
+    Description: This function is responsible for choosing how JSON values
+    are converted to a column type. Numeric strings (e.g. the log 'userId')
+    are converted, empty strings load as NULL on numeric columns. Values
+    out of the column type (integers out of their bounds or with decimals,
+    decimals with more integer digits than the precision allows) are
+    invalid, so just their row is skipped and not the whole file.
+
+    Arguments:
+        sql_type (str, required): Upper case column type.
+        precision (int, required): Decimal precision of the column, or None.
+        scale (int, required): Decimal scale of the column, or None.
+
+    Returns:
+        callable: The converter, raising ValueError on invalid values.
+    """
+    if sql_type in _integer_bounds:
+        low, high = _integer_bounds[sql_type]
+
+        def to_integer(value):
+            if value == "":
+                return None
+            try:
+                number = Decimal(str(value))
+                if not number.is_finite() or number != number.to_integral_value():
+                    raise ValueError(value)
+            except InvalidOperation:
+                raise ValueError(value)
+
+            integer = int(number)
+            if not low <= integer <= high:
+                raise ValueError(value)
+            return integer
+
+        return to_integer
+
+    if sql_type in _decimal_types:
+        scale = scale or 0
+        quantum = Decimal(1).scaleb(-scale)
+        # the integer digits the precision leaves
+        limit = Decimal(10) ** ((precision or 18) - scale)
+
+        def to_decimal(value):
+            if value == "":
+                return None
+            try:
+                number = Decimal(str(value))
+                if not number.is_finite():
+                    raise ValueError(value)
+                number = number.quantize(quantum, ROUND_HALF_UP)
+            except InvalidOperation:
+                raise ValueError(value)
+
+            if abs(number) >= limit:
+                raise ValueError(value)
+            return number
+
+        return to_decimal
+
+    return lambda value: value if isinstance(value, str) else str(value)
+
+
+def _arrow_type(sql_type, precision, scale):
+    """
+    Description: This function is responsible for mapping a column
+    type to the Parquet (arrow) type loaded by Redshift COPY.
+
+    Arguments:
+        sql_type (str, required): Upper case column type.
+        precision (int, required): Column precision, or None.
+        scale (int, required): Column scale, or None.
+
+    Returns:
+        pyarrow.DataType: The arrow type.
+    """
+    if sql_type == "SMALLINT":
+        return pyarrow.int16()
+    if sql_type == "INTEGER":
+        return pyarrow.int32()
+    if sql_type == "BIGINT":
+        return pyarrow.int64()
+    if sql_type in _decimal_types:
+        return pyarrow.decimal128(precision or 18, scale or 0)
+
+    return pyarrow.string()
+
+
+class _ParquetPart:
+    """
+    Description: This class is responsible for writing the rows of a
+    Parquet file in row groups of a bounded number of rows.
+    """
+
+    def __init__(self, path, columns, row_group_rows):
+        self.columns = columns
+        self.row_group_rows = row_group_rows
+        self.schema = pyarrow.schema(
+            [
+                (name.lower(), _arrow_type(sql_type, precision, scale))
+                for name, sql_type, precision, scale in columns
+            ]
+        )
+        self.writer = pyarrow.parquet.ParquetWriter(
+            path, self.schema, compression="snappy"
+        )
+        self.rows = []
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) == self.row_group_rows:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            arrays = [list(values) for values in zip(*self.rows)]
+            self.writer.write_table(
+                pyarrow.Table.from_arrays(arrays, schema=self.schema)
+            )
+            self.rows = []
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+
+class _TextPart:
+    """
+    Description: This class is responsible for writing the rows of a gzip
+    tab delimited text file, escaped for Redshift COPY ... ESCAPE.
+    """
+
+    def __init__(self, path, columns, row_group_rows):
+        self.file = gzip.open(path, "wt", encoding="UTF-8")
+
+    def add(self, row):
+        self.file.write(
+            "\t".join(
+                "\\N"
+                if value is None
+                else value.translate(_text_escapes)
+                if isinstance(value, str)
+                else str(value)
+                for value in row
+            )
+            + "\n"
+        )
+
+    def close(self):
+        self.file.close()
+
+
+def write_parts(records, columns, fields, directory, splitter, row_group_rows=100000):
+    """
+    Description: This function is responsible for merging the records of
+    many small JSON files into the chunks of a splitter, each row going to
+    the chunk with the fewest bytes so the files have about the same size.
+    Records with values not matching the column types are skipped.
+
+    Arguments:
+        records (iterable, required): JSON records.
+        columns (list, required): Table columns, as returned by table_columns.
+        fields (list, required): JSON fields, in the columns order.
+        directory (str, required): Output directory.
+        splitter (Splitter, required): Splitter of the rows to the files.
+        row_group_rows (int, optional): Rows buffered by each Parquet file.
+
+    Returns:
+        (list, int, int): Written file paths and the number of written
+        and skipped rows.
+    """
+    part_class, extension = (
+        (_ParquetPart, "parquet") if pyarrow is not None else (_TextPart, "gz")
+    )
+    paths = [
+        os.path.join(directory, "part-%05d.%s" % (part, extension))
+        for part in range(len(splitter.chunk_bytes))
+    ]
+    parts = [part_class(path, columns, row_group_rows) for path in paths]
+    converters = [
+        _converter(sql_type, precision, scale)
+        for _, sql_type, precision, scale in columns
+    ]
+
+    written, skipped = 0, 0
+    try:
+        for record in records:
+            try:
+                values = [record.get(field) for field in fields]
+                row = [
+                    None if value is None else convert(value)
+                    for convert, value in zip(converters, values)
+                ]
+            except (ValueError, TypeError):
+                skipped += 1
+                continue
+
+            # the text size of the row stands in for its size in the file
+            size = sum(len(str(value)) + 1 for value in row if value is not None)
+            parts[splitter.assign(size)].add(row)
+            written += 1
+    finally:
+        for part in parts:
+            part.close()
+
+    return paths, written, skipped
+
+
+def prestage_tables(config, storage, slices=None, target_bytes=None):
+    """
+    Description: This function is responsible for converting the song_data
+    and log_data JSON files into a few right sized, compressed files
+    (Parquet when pyarrow is installed, gzip delimited text otherwise),
+    uploading them to the '[S3] staging_prefix' and building the COPY
+    statements loading them in place of the JSON COPY statements. The
+    number of files of each table is a multiple of the cluster slices and
+    the bytes each slice is going to load are logged. With '[ETL] validate',
+    rejected records are quarantined, not staged.
+
+    Arguments:
+        config: the loaded configurations.
+        storage (S3Storage, required): S3 access layer.
+        slices (int, optional): Number of slices of the cluster (default:
+        computed from the 'DWH' configurations).
+        target_bytes (int, optional): Input bytes merged into each file
+        (default: '[ETL] prestage_file_mb').
+
+    Returns:
+        (list, str): The COPY statements of the staging tables and the
+        s3 uri of the run files, to be deleted once loaded.
+    """
+    # avoiding an import cycle, as sql_queries reads the configurations
+    from sql_queries import staging_parquet_copy, staging_text_copy
+    from validation import validator_from_config
+
+    validator = validator_from_config(config)
+
+    target_bytes = target_bytes or int(config["ETL"]["PRESTAGE_FILE_MB"]) << 20
+    slices = slices or node_slices(config)
+    run_uri = "%s/%s" % (
+        config["S3"]["STAGING_PREFIX"].rstrip("/"),
+        uuid.uuid4().hex[:13],
+    )
+    copy_template = staging_parquet_copy if pyarrow is not None else staging_text_copy
+    sources = {
+        "staging_events": config["S3"]["LOG_DATA"],
+        "staging_songs": config["S3"]["SONG_DATA"],
+    }
+
+    queries = []
+    for table, folder, fields, create_query in staging_sources:
+        uri = sources[table]
+        objects = storage.list_objects(uri)
+
+        files = chunk_count(sum(obj["size"] for obj in objects), target_bytes, slices)
+        logging.info(
+            "Prestage: merging %d objects of %s into %d files."
+            % (len(objects), uri, files)
+        )
+
+        directory = tempfile.mkdtemp(prefix="prestage-")
+        try:
+            rejected = {}
+            records = parse_records(s3_objects(storage, uri, objects), rejected)
+            if validator is not None:
+                records = validator.filter(table, fields, create_query, records)
+            splitter = Splitter(files)
+            paths, written, skipped = write_parts(
+                records, table_columns(create_query), fields, directory, splitter
+            )
+            splitter.report(slices)
+
+            table_uri = "%s/%s/" % (run_uri, table)
+            staging_bucket, prefix = parse_s3_uri(table_uri)
+            for path in paths:
+                storage.s3_client.upload_file(
+                    path, staging_bucket, prefix + os.path.basename(path)
+                )
+        finally:
+            shutil.rmtree(directory)
+
+        logging.info(
+            "Prestage: wrote %d rows of %s to %s (%d skipped)."
+            % (written, table, table_uri, skipped + sum(rejected.values()))
+        )
+        queries.append(copy_template.format(table, table_uri))
+
+    return queries, run_uri + "/"
+
+
+def prestage_delete(storage, run_uri):
+    """
+    Description: This function is responsible for deleting the files
+    prestaged by a run once they were loaded, 1000 keys at a time.
+
+    Arguments:
+        storage (S3Storage, required): S3 access layer.
+        run_uri (str, required): S3 uri of the run files.
+
+    Returns:
+        int: Number of deleted files.
+    """
+    bucket, prefix = parse_s3_uri(run_uri)
+    s3_client = storage.s3_client
+    paginator = s3_client.get_paginator("list_objects_v2")
+
+    deleted = 0
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        keys = [{"Key": obj["Key"]} for obj in page.get("Contents", [])]
+        if not keys:
+            continue
+
+        with_retry(
+            lambda: s3_client.delete_objects(
+                Bucket=bucket, Delete={"Objects": keys, "Quiet": True}
+            )
+        )
+        deleted += len(keys)
+
+    logging.info("Prestage: deleted %d files of %s." % (deleted, run_uri))
+
+    return deleted
@@ -0,0 +1,312 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from executor import statement_label
+from splitter import skew
+
+# statistics of a query, available just on redshift system tables
+query_summary_select = """
+SELECT
+    COALESCE(SUM(bytes), 0),
+    COALESCE(SUM(CASE WHEN is_diskbased = 't' THEN bytes ELSE 0 END), 0)
+FROM svl_query_summary
+WHERE query = %s
+"""
+
+load_commits_select = """
+SELECT COUNT(DISTINCT filename), COALESCE(SUM(lines_scanned), 0)
+FROM stl_load_commits
+WHERE query = %s
+"""
+
+slice_scans_select = """
+SELECT slice, COALESCE(SUM(bytes), 0)
+FROM stl_file_scan
+WHERE query = %s
+GROUP BY slice
+ORDER BY slice
+"""
+
+
+class ProfiledCursor:
+    """
+    Description: This class is responsible for wrapping a database cursor,
+    recording the statistics of each executed statement in a profiler.
+    Everything else is delegated to the wrapped cursor.
+    """
+
+    def __init__(self, cursor, profiler):
+        """
+        Description: This function is responsible for setting the
+        wrapped cursor and the profiler.
+
+        Arguments:
+            cursor: the cursor object.
+            profiler (QueryProfiler, required): Profiler of the run.
+
+        Returns:
+            None
+        """
+        self._cursor = cursor
+        self._profiler = profiler
+
+    def execute(self, query, vars=None):
+        """
+        Description: This function is responsible for executing a
+        statement and recording its statistics.
+
+        Arguments:
+            query (str, required): SQL statement.
+            vars (tuple|dict, optional): Statement parameters.
+
+        Returns:
+            None
+        """
+        start = time.perf_counter()
+        self._cursor.execute(query, vars)
+        wall_time = time.perf_counter() - start
+
+        self._profiler.record(self._cursor, query, wall_time)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class QueryProfiler:
+    """
+    Description: This class is responsible for tracing the statements of
+    a run (wall time, rows affected and, on Redshift, the query id and the
+    bytes scanned, spilled to disk and loaded) and writing them as a JSON
+    lines run report, flagging regressions against the previous run.
+    """
+
+    def __init__(self, process, report_path, threshold=0.5, min_seconds=1.0):
+        """
+        Description: This function is responsible for starting the run.
+
+        Arguments:
+            process (str, required): Name of the traced process (e.g. 'etl').
+            report_path (str, required): JSON lines run report file path.
+            threshold (float, optional): Relative slowdown flagged as regression.
+            min_seconds (float, optional): Statements faster than it are
+            never flagged.
+
+        Returns:
+            None
+        """
+        self.process = process
+        self.report_path = report_path
+        self.threshold = threshold
+        self.min_seconds = min_seconds
+
+        self.run_id = uuid.uuid4().hex[:13]
+        self.started_at = datetime.utcnow().isoformat()
+        self.records = []
+
+        self._redshift = None
+        self._lock = threading.Lock()
+
+    def wrap(self, cursor):
+        """
+        Description: This function is responsible for wrapping a cursor
+        so its statements are traced.
+
+        Arguments:
+            cursor: the cursor object.
+
+        Returns:
+            ProfiledCursor: The traced cursor.
+        """
+        return ProfiledCursor(cursor, self)
+
+    def _is_redshift(self, cur):
+        """
+        Description: This function is responsible for checking once
+        whether the database is a Redshift cluster.
+
+        Arguments:
+            cur: a cursor not used by the traced statements.
+
+        Returns:
+            bool: True when the Redshift system tables are available.
+        """
+        if self._redshift is None:
+            cur.execute("SELECT version()")
+            self._redshift = "Redshift" in cur.fetchone()[0]
+
+        return self._redshift
+
+    def _redshift_stats(self, cur):
+        """
+        Description: This function is responsible for reading the
+        statistics of the last query of the session from the Redshift
+        system tables.
+
+        Arguments:
+            cur: a cursor not used by the traced statements.
+
+        Returns:
+            dict: The query id, the bytes scanned, spilled and loaded and,
+            for COPY statements, the bytes loaded by each slice.
+        """
+        cur.execute("SELECT pg_last_query_id()")
+        query_id = cur.fetchone()[0]
+
+        cur.execute(query_summary_select, (query_id,))
+        bytes_scanned, bytes_spilled = cur.fetchone()
+
+        cur.execute(load_commits_select, (query_id,))
+        files_loaded, lines_loaded = cur.fetchone()
+
+        stats = {
+            "query_id": query_id,
+            "bytes_scanned": int(bytes_scanned),
+            "bytes_spilled": int(bytes_spilled),
+            "files_loaded": int(files_loaded),
+            "lines_loaded": int(lines_loaded),
+        }
+
+        # bytes loaded by each slice, so the skew of a COPY is visible
+        if files_loaded:
+            cur.execute(slice_scans_select, (query_id,))
+            loaded = [int(size) for _, size in cur.fetchall()]
+            stats["slice_bytes"] = loaded
+            stats["slice_skew"] = round(skew(loaded), 2)
+
+        return stats
+
+    def record(self, cursor, query, wall_time):
+        """
+        Description: This function is responsible for recording the
+        statistics of a statement just executed by the cursor.
+
+        Arguments:
+            cursor: the cursor that executed the statement.
+            query (str, required): SQL statement.
+            wall_time (float, required): Execution time in seconds.
+
+        Returns:
+            dict: The statement record.
+        """
+        record = {
+            "run_id": self.run_id,
+            "process": self.process,
+            "started_at": self.started_at,
+            "step": statement_label(query),
+            "wall_time": round(wall_time, 3),
+            "rows": cursor.rowcount,
+        }
+
+        stats_cur = cursor.connection.cursor()
+        if self._is_redshift(stats_cur):
+            record.update(self._redshift_stats(stats_cur))
+        stats_cur.close()
+
+        logging.info(
+            "Profiler: '%s' took %.2fs (%s rows)."
+            % (record["step"], wall_time, record["rows"])
+        )
+        if "slice_bytes" in record:
+            logging.info(
+                "Profiler: '%s' bytes per slice %s (skew %.2f)."
+                % (record["step"], record["slice_bytes"], record["slice_skew"])
+            )
+
+        with self._lock:
+            self.records.append(record)
+
+        return record
+
+    def _previous_run(self):
+        """
+        Description: This function is responsible for reading the records
+        of the last run of the same process from the report file.
+
+        Arguments:
+            None
+
+        Returns:
+            dict: The wall time of each statement of the previous run.
+        """
+        if not os.path.exists(self.report_path):
+            return {}
+
+        previous = {}
+        with open(self.report_path) as report_file:
+            for line in report_file:
+                record = json.loads(line)
+                if record["process"] != self.process:
+                    continue
+
+                # a new run replaces the statements of the older one
+                if record["run_id"] != previous.get("run_id"):
+                    previous = {"run_id": record["run_id"], "steps": {}}
+                previous["steps"][record["step"]] = record["wall_time"]
+
+        return previous.get("steps", {})
+
+    def write_report(self):
+        """
+        Description: This function is responsible for flagging the statements
+        slower than in the previous run and appending the run records to
+        the report file.
+
+        Arguments:
+            None
+
+        Returns:
+            list: The records of the run.
+        """
+        previous = self._previous_run()
+
+        for record in self.records:
+            before = previous.get(record["step"])
+            record["previous_wall_time"] = before
+            record["regression"] = bool(
+                before is not None
+                and record["wall_time"] >= self.min_seconds
+                and record["wall_time"] > before * (1 + self.threshold)
+            )
+
+            if record["regression"]:
+                logging.warning(
+                    "Profiler: '%s' regressed from %.2fs to %.2fs."
+                    % (record["step"], before, record["wall_time"])
+                )
+
+        with open(self.report_path, "a") as report_file:
+            for record in self.records:
+                report_file.write(json.dumps(record) + "\n")
+
+        slowest = sorted(self.records, key=lambda record: -record["wall_time"])[:5]
+        for record in slowest:
+            logging.info(
+                "Profiler: slow statement '%s' %.2fs."
+                % (record["step"], record["wall_time"])
+            )
+
+        return self.records
+
+
+def profiler_from_config(process, config):
+    """
+    Description: This function is responsible for creating a profiler
+    from the 'ETL' configurations.
+
+    Arguments:
+        process (str, required): Name of the traced process.
+        config: the loaded configurations.
+
+    Returns:
+        QueryProfiler: The run profiler.
+    """
+    return QueryProfiler(
+        process,
+        config["ETL"]["REPORT"],
+        threshold=float(config["ETL"]["REGRESSION_THRESHOLD"]),
+    )
@@ -0,0 +1,291 @@
+import configparser
+import hashlib
+import logging
+import os
+import pickle
+import re
+import time
+
+import psycopg2
+
+import dialect
+from sql_queries import load_generation_select
+
+# string literals and quoted identifiers are kept as they are, comments
+# (just outside of them) are dropped and the rest is split into words
+_token = re.compile(
+    r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(--[^\n]*|/\*.*?\*/)"
+    r"|(?:[^\s'\"/-]|-(?!-)|/(?!\*))+",
+    re.S,
+)
+# statements returning result sets
+_reads = ("select", "with")
+
+
+def normalize_query(query):
+    """
+    Description: This function is responsible for normalizing a statement,
+    so the same query written with other comments, spacing, case or
+    trailing semicolon has the same cache key. String literals and quoted
+    identifiers are kept, so a '--' or '/*' in them is not a comment.
+
+    Arguments:
+        query (str, required): SQL statement.
+
+    Returns:
+        str: The normalized statement.
+    """
+    tokens = [
+        match.group() for match in _token.finditer(query) if not match.group(1)
+    ]
+    while tokens and tokens[-1] == ";":
+        tokens.pop()
+    if tokens and tokens[-1].endswith(";") and tokens[-1][0] not in "'\"":
+        tokens[-1] = tokens[-1].rstrip(";")
+
+    return " ".join(
+        token if token[0] in "'\"" else token.lower() for token in tokens
+    )
+
+
+class QueryClient:
+    """
+    Description: This class is responsible for running the analytical
+    reads against the warehouse set in the 'DB' configurations, caching
+    the result sets on disk. Results are keyed by the normalized statement
+    and the load generation, which each successful ETL run bumps, so the
+    cache is invalidated after each load. The least recently used results
+    are evicted beyond the size limits.
+    """
+
+    def __init__(self, config_path="dwh.cfg"):
+        """
+        Description: This function is responsible for reading the
+        configurations and setting the cache up.
+
+        Arguments:
+            config_path (str, optional): Configuration file path.
+
+        Returns:
+            None
+        """
+        config = configparser.ConfigParser()
+        config.read(config_path)
+
+        self.config = config
+        self.cache_dir = config["CACHE"]["DIR"]
+        self.max_bytes = int(config["CACHE"]["MAX_MB"]) << 20
+        self.max_entries = int(config["CACHE"]["MAX_ENTRIES"])
+        self.generation_ttl = float(config["CACHE"]["GENERATION_TTL"])
+
+        self.metrics = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+        self._conn = None
+        self._generation = None
+        self._generation_read_at = 0.0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _cursor(self):
+        """
+        Description: This function is responsible for opening the
+        connection once and creating a cursor.
+
+        Arguments:
+            None
+
+        Returns:
+            The cursor object.
+        """
+        if self._conn is None or self._conn.closed:
+            self._conn = psycopg2.connect(
+                "host={} dbname={} user={} password={} port={}".format(
+                    *self.config["DB"].values()
+                )
+            )
+            # each read runs in a read only transaction, always rolled back,
+            # so a write passing for a read never changes the warehouse
+            self._conn.set_session(readonly=True, autocommit=False)
+
+        return dialect.cursor(self._conn, self.config["ETL"]["TARGET"])
+
+    def generation(self):
+        """
+        Description: This function is responsible for reading the load
+        generation of the warehouse, at most once every 'generation_ttl'
+        seconds. The results of older generations are dropped when it
+        changes.
+
+        Arguments:
+            None
+
+        Returns:
+            int: The load generation.
+        """
+        now = time.monotonic()
+        if self._generation is not None and (
+            now - self._generation_read_at < self.generation_ttl
+        ):
+            return self._generation
+
+        cur = self._cursor()
+        try:
+            cur.execute(load_generation_select)
+            generation = cur.fetchone()[0]
+        finally:
+            cur.close()
+            self._conn.rollback()
+
+        if generation != self._generation:
+            self._invalidate(generation)
+        self._generation, self._generation_read_at = generation, now
+
+        return generation
+
+    def _entries(self):
+        """
+        Description: This function is responsible for listing the
+        cached results.
+
+        Arguments:
+            None
+
+        Returns:
+            list: (path, size, last use time) tuples, least recently used first.
+        """
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".pickle"):
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def _invalidate(self, generation):
+        """
+        Description: This function is responsible for dropping the
+        results cached by other load generations.
+
+        Arguments:
+            generation (int, required): The current load generation.
+
+        Returns:
+            None
+        """
+        prefix = "%d-" % generation
+        for path, _, _ in self._entries():
+            if not os.path.basename(path).startswith(prefix):
+                os.remove(path)
+                self.metrics["invalidations"] += 1
+
+    def _evict(self):
+        """
+        Description: This function is responsible for removing the least
+        recently used results until the cache fits its size limits.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+        """
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        while entries and (total > self.max_bytes or len(entries) > self.max_entries):
+            path, size, _ = entries.pop(0)
+            os.remove(path)
+            total -= size
+            self.metrics["evictions"] += 1
+
+    def query(self, query, vars=None):
+        """
+        Description: This function is responsible for returning the result
+        set of a read, from the cache when it was already read in the
+        current load generation. Statements other than reads (SELECT or
+        WITH) are rejected, as they return no result set to be cached, and
+        reads run in read only transactions that are rolled back, so data
+        modifying WITH queries or SELECT INTO fail without any change.
+
+        Arguments:
+            query (str, required): SQL statement.
+            vars (tuple|dict, optional): Statement parameters.
+
+        Returns:
+            (list, list): The column names and the rows.
+        """
+        normalized = normalize_query(query)
+        if not normalized.startswith(_reads):
+            raise ValueError("Just reads are run by the query client: %s" % query)
+
+        generation = self.generation()
+        digest = hashlib.sha256(repr((normalized, vars)).encode("utf-8")).hexdigest()
+        path = os.path.join(self.cache_dir, "%d-%s.pickle" % (generation, digest))
+
+        try:
+            with open(path, "rb") as cache_file:
+                result = pickle.load(cache_file)
+            # the modification time stands in for the last use time
+            os.utime(path)
+            self.metrics["hits"] += 1
+            return result
+        except FileNotFoundError:
+            self.metrics["misses"] += 1
+
+        cur = self._cursor()
+        try:
+            try:
+                cur.execute(query, vars)
+            except psycopg2.errors.ReadOnlySqlTransaction as error:
+                raise ValueError(
+                    "Just reads are run by the query client: %s" % query
+                ) from error
+            if cur.description is None:
+                raise ValueError("The statement returned no result set: %s" % query)
+            result = ([column[0] for column in cur.description], cur.fetchall())
+        finally:
+            cur.close()
+            self._conn.rollback()
+
+        # written aside and renamed, so readers never see a partial result
+        tmp_path = "%s.%d.tmp" % (path, os.getpid())
+        with open(tmp_path, "wb") as cache_file:
+            pickle.dump(result, cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        self._evict()
+
+        return result
+
+    def hit_rate(self):
+        """
+        Description: This function is responsible for computing the share
+        of the reads served by the cache.
+
+        Arguments:
+            None
+
+        Returns:
+            float: Hits over reads (0.0 before any read).
+        """
+        reads = self.metrics["hits"] + self.metrics["misses"]
+        return self.metrics["hits"] / reads if reads else 0.0
+
+    def close(self):
+        """
+        Description: This function is responsible for closing the
+        connection and logging the cache metrics.
+
+        Arguments:
+            None
+
+        Returns:
+            dict: The cache metrics.
+        """
+        if self._conn is not None:
+            self._conn.close()
+
+        logging.info(
+            "Query cache: %(hits)d hits, %(misses)d misses, %(evictions)d "
+            "evictions, %(invalidations)d invalidations." % self.metrics
+        )
+
+        return self.metrics
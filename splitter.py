@@ -0,0 +1,183 @@
+import heapq
+import logging
+import math
+
+import psycopg2
+
+# slices of each node type
+# (More: https://docs.aws.amazon.com/redshift/latest/mgmt/working-with-clusters.html)
+NODE_SLICES = {
+    "dc2.large": 2,
+    "dc2.8xlarge": 16,
+    "ds2.xlarge": 2,
+    "ds2.8xlarge": 16,
+    "ra3.xlplus": 2,
+    "ra3.4xlarge": 4,
+    "ra3.16xlarge": 16,
+}
+
+slices_select = "SELECT COUNT(*) FROM stv_slices"
+
+
+def node_slices(config):
+    """
+    Description: This function is responsible for computing the number of
+    slices of the cluster set in the 'DWH' configurations (node type slices
+    times the number of nodes), without connecting to it.
+
+    Arguments:
+        config: the loaded configurations.
+
+    Returns:
+        int: Number of slices.
+    """
+    node_type = config["DWH"]["NODE_TYPE"]
+    if node_type not in NODE_SLICES:
+        raise ValueError(
+            "Unknown node type %s, the slices of %s are known."
+            % (node_type, ", ".join(sorted(NODE_SLICES)))
+        )
+
+    return NODE_SLICES[node_type] * int(config["DWH"]["NUM_NODES"])
+
+
+def slice_count(config):
+    """
+    Description: This function is responsible for reading the number of
+    slices from stv_slices on the live cluster. When the cluster can not
+    be reached, it is computed from the 'DWH' configurations.
+
+    Arguments:
+        config: the loaded configurations.
+
+    Returns:
+        int: Number of slices.
+    """
+    try:
+        conn = psycopg2.connect(
+            "host={} dbname={} user={} password={} port={}".format(
+                *config["DB"].values()
+            )
+        )
+    except psycopg2.OperationalError as error:
+        logging.warning("Splitter: cluster unreachable (%s)." % error)
+        return node_slices(config)
+
+    try:
+        cur = conn.cursor()
+        cur.execute(slices_select)
+        return cur.fetchone()[0]
+    finally:
+        conn.close()
+
+
+def chunk_count(input_bytes, target_bytes, slices):
+    """
+    Description: This function is responsible for choosing the number
+    of chunks of an input: enough chunks of about target_bytes, rounded
+    up to a multiple of the slice count so every slice loads the same
+    number of chunks.
+
+    Arguments:
+        input_bytes (int, required): Size of the input.
+        target_bytes (int, required): Bytes of each chunk.
+        slices (int, required): Number of slices of the cluster.
+
+    Returns:
+        int: Number of chunks.
+    """
+    chunks = max(1, math.ceil(input_bytes / target_bytes))
+    return math.ceil(chunks / slices) * slices
+
+
+def slice_bytes(chunk_bytes, slices):
+    """
+    Description: This function is responsible for computing the bytes each
+    slice loads when the chunks are dealt to the slices in turn.
+
+    Arguments:
+        chunk_bytes (list, required): Bytes of each chunk.
+        slices (int, required): Number of slices of the cluster.
+
+    Returns:
+        list: Bytes of each slice.
+    """
+    loaded = [0] * slices
+    for chunk, size in enumerate(chunk_bytes):
+        loaded[chunk % slices] += size
+
+    return loaded
+
+
+def skew(loaded):
+    """
+    Description: This function is responsible for measuring how uneven
+    the work of the slices is: the largest slice over the average one
+    (1.0 when every slice loads the same bytes).
+
+    Arguments:
+        loaded (list, required): Bytes of each slice.
+
+    Returns:
+        float: The skew.
+    """
+    mean = sum(loaded) / len(loaded) if loaded else 0
+    return max(loaded) / mean if mean else 1.0
+
+
+class Splitter:
+    """
+    Description: This class is responsible for dealing rows to a fixed
+    number of chunks, always to the chunk with the fewest bytes, so chunks
+    end up evenly sized even when the row sizes vary.
+    """
+
+    def __init__(self, chunks):
+        """
+        Description: This function is responsible for setting
+        the number of chunks.
+
+        Arguments:
+            chunks (int, required): Number of chunks.
+
+        Returns:
+            None
+        """
+        self.chunk_bytes = [0] * chunks
+        self._heap = [(0, chunk) for chunk in range(chunks)]
+
+    def assign(self, size):
+        """
+        Description: This function is responsible for choosing
+        the chunk of a row.
+
+        Arguments:
+            size (int, required): Bytes of the row.
+
+        Returns:
+            int: The chunk index.
+        """
+        total, chunk = self._heap[0]
+        heapq.heapreplace(self._heap, (total + size, chunk))
+        self.chunk_bytes[chunk] = total + size
+
+        return chunk
+
+    def report(self, slices):
+        """
+        Description: This function is responsible for logging the bytes
+        each slice is going to load and their skew.
+
+        Arguments:
+            slices (int, required): Number of slices of the cluster.
+
+        Returns:
+            list: Bytes of each slice.
+        """
+        loaded = slice_bytes(self.chunk_bytes, slices)
+        logging.info(
+            "Splitter: %d chunks over %d slices, bytes per slice %s (skew %.2f)."
+            % (len(self.chunk_bytes), slices, loaded, skew(loaded))
+        )
+
+        return loaded
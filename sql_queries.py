@@ -14,9 +14,48 @@ user_table_drop = "DROP TABLE IF EXISTS usesr"
 song_table_drop = "DROP TABLE IF EXISTS songs"
 artist_table_drop = "DROP TABLE IF EXISTS artists"
 time_table_drop = "DROP TABLE IF EXISTS times"
+songplay_delta_table_drop = "DROP TABLE IF EXISTS songplays_delta"
+hourly_plays_rollup_drop = "DROP TABLE IF EXISTS rollup_hourly_plays"
+daily_song_plays_rollup_drop = "DROP TABLE IF EXISTS rollup_daily_song_plays"
 
 # CREATE TABLES
 
+# JSON fields loaded to staging tables, in the jsonpaths order
+
+staging_events_fields = [
+    "artist",
+    "auth",
+    "firstName",
+    "gender",
+    "itemInSession",
+    "lastName",
+    "length",
+    "level",
+    "location",
+    "method",
+    "page",
+    "registration",
+    "sessionId",
+    "song",
+    "status",
+    "ts",
+    "userAgent",
+    "userId",
+]
+
+staging_songs_fields = [
+    "artist_id",
+    "artist_latitude",
+    "artist_location",
+    "artist_longitude",
+    "artist_name",
+    "duration",
+    "num_songs",
+    "song_id",
+    "title",
+    "year",
+]
+
 staging_events_table_create = """
 CREATE TEMPORARY TABLE IF NOT EXISTS staging_events (
     artist VARCHAR,
@@ -65,7 +104,8 @@ CREATE TABLE IF NOT EXISTS songplays (
     artist_id VARCHAR(18) REFERENCES artists (artist_id),
     session_id INTEGER,
     location VARCHAR(150),
-    user_agent VARCHAR
+    user_agent VARCHAR,
+    match_key VARCHAR(16)
 )
 """
 
@@ -111,6 +151,159 @@ CREATE TABLE IF NOT EXISTS times (
 )
 """
 
+# Songplays inserted and not folded into the rollups yet
+
+songplay_delta_table_create = """
+CREATE TABLE IF NOT EXISTS songplays_delta (
+    start_time TIMESTAMP,
+    user_id INTEGER,
+    level VARCHAR(10),
+    song_id VARCHAR(18),
+    artist_id VARCHAR(18),
+    session_id INTEGER,
+    location VARCHAR(150),
+    user_agent VARCHAR,
+    match_key VARCHAR(16)
+)
+"""
+
+# ROLLUP TABLES
+
+hourly_plays_rollup_create = """
+CREATE TABLE IF NOT EXISTS rollup_hourly_plays (
+    start_hour TIMESTAMP SORTKEY,
+    level VARCHAR(10),
+    plays BIGINT
+) DISTSTYLE ALL
+"""
+
+daily_song_plays_rollup_create = """
+CREATE TABLE IF NOT EXISTS rollup_daily_song_plays (
+    start_day TIMESTAMP SORTKEY,
+    song_id VARCHAR(18),
+    plays BIGINT
+) DISTSTYLE ALL
+"""
+
+# LOAD GENERATIONS
+# Bumped at the end of each successful ETL run, so results cached by the
+# query client are invalidated. It is never dropped, so generations never
+# repeat when the tables are created again.
+
+load_generation_create = """
+CREATE TABLE IF NOT EXISTS load_generations (
+    generation INTEGER NOT NULL,
+    loaded_at TIMESTAMP NOT NULL
+) DISTSTYLE ALL
+"""
+
+load_generation_bump = """
+INSERT INTO load_generations (generation, loaded_at)
+SELECT COALESCE(MAX(generation), 0) + 1, %s
+FROM load_generations
+"""
+
+load_generation_select = "SELECT COALESCE(MAX(generation), 0) FROM load_generations"
+
+# WORKLOAD MANAGEMENT
+# Sessions are routed to a WLM queue by their query group (filled at run time)
+
+query_group_set = "SET query_group TO '{}'"
+
+# PERSISTENT STAGING
+# Temporary tables are seen just by the session that created them, so
+# statements running over several connections stage into a schema
+
+staging_schema_create = "CREATE SCHEMA IF NOT EXISTS etl_staging"
+staging_schema_drop = "DROP SCHEMA IF EXISTS etl_staging CASCADE"
+staging_search_path = "SET search_path TO etl_staging, public"
+
+# run scoped staging schema of checkpointed runs, kept until the run is done
+run_schema_create = "CREATE SCHEMA IF NOT EXISTS etl_run_{}"
+run_schema_drop = "DROP SCHEMA IF EXISTS etl_run_{} CASCADE"
+run_search_path = "SET search_path TO etl_run_{}, public"
+
+
+def persistent(query):
+    """
+    Description: This function is responsible for turning a temporary
+    table definition into a regular one, created in the first schema
+    of the session search path.
+
+    Arguments:
+        query (str, required): CREATE TEMPORARY TABLE statement.
+
+    Returns:
+        str: The CREATE TABLE statement.
+    """
+    return query.replace("CREATE TEMPORARY TABLE", "CREATE TABLE", 1)
+
+
+# WINDOWED RUNS
+# Windows of log_data are loaded concurrently, each one through its own
+# temporary staging tables, and append their keyed events and users to
+# tables shared by the windows. Songplays, users and times are merged once
+# all windows are done: concurrent merges into songplays would abort on
+# serializable isolation violations, and users keep the last level seen
+# whatever the windows order.
+
+window_users_create = """
+CREATE TABLE IF NOT EXISTS window_users (
+    userId INTEGER,
+    firstName VARCHAR(50),
+    lastName VARCHAR(50),
+    gender CHAR(1),
+    level VARCHAR(10),
+    ts NUMERIC(13,0)
+)
+"""
+
+window_users_insert = """
+INSERT INTO window_users (userId, firstName, lastName, gender, level, ts)
+SELECT userId, firstName, lastName, gender, level, ts
+FROM staging_events
+WHERE userId IS NOT NULL
+"""
+
+window_events_create = """
+CREATE TABLE IF NOT EXISTS window_events_keyed (
+    match_key VARCHAR(16),
+    ts NUMERIC(13,0),
+    userId INTEGER,
+    level VARCHAR(10),
+    sessionId INTEGER,
+    location VARCHAR(150),
+    userAgent VARCHAR,
+    page VARCHAR(50)
+)
+DISTKEY (match_key) SORTKEY (match_key)
+"""
+
+window_events_insert = """
+INSERT INTO window_events_keyed
+    (match_key, ts, userId, level, sessionId, location, userAgent, page)
+SELECT match_key, ts, userId, level, sessionId, location, userAgent, page
+FROM staging_events_keyed
+"""
+
+
+def windowed(query):
+    """
+    Description: This function is responsible for turning a statement
+    reading the staged events into one reading the events and users
+    staged by all windows.
+
+    Arguments:
+        query (str, required): Statement reading staging_events or
+        staging_events_keyed.
+
+    Returns:
+        str: The statement reading window_users or window_events_keyed.
+    """
+    query = query.replace("staging_events_keyed", "window_events_keyed")
+    return query.replace("staging_events", "window_users")
+
+
 # STAGING TABLES
 
 staging_events_copy = (
@@ -139,23 +332,142 @@ JSON '{}'
     config["S3"]["SONG_JSONPATH"],
 )
 
+# Manifest based copies, the manifest uri is filled at run time
+# with just the objects not ingested yet (see manifest.py)
+
+staging_events_manifest_copy = (
+    """
+COPY staging_events
+FROM '{{}}'
+iam_role '{}'
+JSON '{}'
+MANIFEST
+"""
+).format(
+    config["IAM_ROLE"]["ARN"],
+    config["S3"]["LOG_JSONPATH"],
+)
+
+staging_songs_manifest_copy = (
+    """
+COPY staging_songs
+FROM '{{}}'
+iam_role '{}'
+JSON '{}'
+MANIFEST
+"""
+).format(
+    config["IAM_ROLE"]["ARN"],
+    config["S3"]["SONG_JSONPATH"],
+)
+
+# Pre-staged copies, the table and the uri of its right sized files
+# are filled at run time (see prestage.py)
+
+staging_parquet_copy = (
+    """
+COPY {{}}
+FROM '{{}}'
+iam_role '{}'
+FORMAT AS PARQUET
+"""
+).format(config["IAM_ROLE"]["ARN"])
+
+staging_text_copy = (
+    """
+COPY {{}}
+FROM '{{}}'
+iam_role '{}'
+DELIMITER '\\t'
+ESCAPE
+GZIP
+"""
+).format(config["IAM_ROLE"]["ARN"])
+
+# MATCH KEYS
+# Events are matched to songs by a compact hash of the normalized title,
+# rounded duration and artist name, computed once per staged row. The keyed
+# tables are distributed and sorted by it, so the songplays join is
+# co-located. Songs keep one row per key, so a match never duplicates plays.
+
+staging_events_keys = """
+DROP TABLE IF EXISTS staging_events_keyed;
+
+CREATE TEMPORARY TABLE staging_events_keyed DISTKEY (match_key) SORTKEY (match_key) AS
+SELECT
+    LEFT(MD5(
+        LOWER(TRIM(song)) || '|' ||
+        CAST(ROUND(length, 3) AS VARCHAR) || '|' ||
+        LOWER(TRIM(artist))
+    ), 16) as match_key,
+    ts,
+    userId,
+    level,
+    sessionId,
+    location,
+    userAgent,
+    page
+FROM staging_events;
+"""
+
+staging_songs_keys = """
+DROP TABLE IF EXISTS staging_songs_keyed;
+
+CREATE TEMPORARY TABLE staging_songs_keyed DISTKEY (match_key) SORTKEY (match_key) AS
+SELECT match_key, song_id, artist_id
+FROM (
+    SELECT
+        match_key,
+        song_id,
+        artist_id,
+        ROW_NUMBER() OVER (PARTITION BY match_key ORDER BY song_id) as key_rank
+    FROM (
+        SELECT
+            LEFT(MD5(
+                LOWER(TRIM(title)) || '|' ||
+                CAST(ROUND(duration, 3) AS VARCHAR) || '|' ||
+                LOWER(TRIM(artist_name))
+            ), 16) as match_key,
+            song_id,
+            artist_id
+        FROM staging_songs
+    ) AS hashed
+    WHERE match_key IS NOT NULL
+) AS ranked
+WHERE key_rank = 1;
+"""
+
+# share of the played songs matched to a staged song
+songplay_match_select = """
+SELECT
+    COUNT(*),
+    COUNT(staging_events_keyed.match_key),
+    COUNT(staging_songs_keyed.match_key)
+FROM staging_events_keyed
+LEFT JOIN staging_songs_keyed ON
+    staging_events_keyed.match_key = staging_songs_keyed.match_key
+WHERE staging_events_keyed.page = 'NextSong'
+"""
+
 # FINAL TABLES
 
 songplay_table_insert = """
-INSERT INTO songplays (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent)
+DROP TABLE IF EXISTS songplays_new;
+
+CREATE TEMPORARY TABLE songplays_new AS
 SELECT
     TIMESTAMP 'epoch' + ts / 1000 * interval '1 second' as start_time,
     userId as user_id,
     level,
-    staging_songs.song_id,
-    staging_songs.artist_id,
+    staging_songs_keyed.song_id,
+    staging_songs_keyed.artist_id,
     sessionId as session_id,
     location,
-    userAgent as user_agent
-FROM staging_events 
-LEFT JOIN staging_songs ON 
-    staging_events.song = staging_songs.title AND
-    ROUND(staging_events.length, 3) = ROUND(staging_songs.duration, 3)
+    userAgent as user_agent,
+    staging_events_keyed.match_key
+FROM staging_events_keyed
+LEFT JOIN staging_songs_keyed ON
+    staging_events_keyed.match_key = staging_songs_keyed.match_key
 EXCEPT
 SELECT 
     start_time, 
@@ -165,8 +477,15 @@ SELECT
     artist_id, 
     session_id, 
     location, 
-    user_agent 
-FROM songplays
+    user_agent,
+    match_key
+FROM songplays;
+
+INSERT INTO songplays_delta
+SELECT * FROM songplays_new;
+
+INSERT INTO songplays (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent, match_key)
+SELECT * FROM songplays_new;
 """
 
 user_table_insert = """
@@ -224,6 +543,349 @@ EXCEPT
 SELECT * FROM times
 """
 
+# LOCAL TIME TRANSFORM
+# The times dimension can be derived out of the database (see transform.py)
+# from the staged ts, pushed to times_local through COPY FROM STDIN and
+# inserted into the target table (filled at run time) when not there yet.
+
+staging_ts_select = "SELECT ts FROM staging_events WHERE ts IS NOT NULL"
+
+times_local_create = """
+DROP TABLE IF EXISTS times_local;
+
+CREATE TEMPORARY TABLE times_local (
+    start_time TIMESTAMP,
+    hour SMALLINT,
+    day SMALLINT,
+    week SMALLINT,
+    month SMALLINT,
+    year SMALLINT,
+    weekday SMALLINT
+);
+"""
+
+times_local_insert = """
+INSERT INTO {0} (start_time, hour, day, week, month, year, weekday)
+SELECT start_time, hour, day, week, month, year, weekday
+FROM times_local
+WHERE NOT EXISTS (
+    SELECT 1 FROM {0} WHERE {0}.start_time = times_local.start_time
+)
+"""
+
+# MERGE FINAL TABLES
+# Staged row sets deduplicated by the primary keys replace the rows with the
+# same key, so the target tables are just probed by key instead of being
+# fully scanned by EXCEPT. The last level seen for each user is kept, and
+# times are derived from the songplays not yet folded (songplays_delta).
+# Each merge ends with its insert, so the cursor rowcount is the number
+# of merged rows.
+
+songplay_table_merge = """
+DROP TABLE IF EXISTS songplays_stage;
+
+CREATE TEMPORARY TABLE songplays_stage AS
+SELECT DISTINCT
+    TIMESTAMP 'epoch' + ts / 1000 * interval '1 second' as start_time,
+    userId as user_id,
+    level,
+    staging_songs_keyed.song_id,
+    staging_songs_keyed.artist_id,
+    sessionId as session_id,
+    location,
+    userAgent as user_agent,
+    staging_events_keyed.match_key
+FROM staging_events_keyed
+LEFT JOIN staging_songs_keyed ON
+    staging_events_keyed.match_key = staging_songs_keyed.match_key;
+
+DELETE FROM songplays_stage
+USING songplays
+WHERE
+    songplays_stage.start_time = songplays.start_time AND
+    songplays_stage.session_id = songplays.session_id AND
+    (
+        songplays_stage.user_id = songplays.user_id OR
+        (songplays_stage.user_id IS NULL AND songplays.user_id IS NULL)
+    );
+
+INSERT INTO songplays_delta
+SELECT * FROM songplays_stage;
+
+INSERT INTO songplays (start_time, user_id, level, song_id, artist_id, session_id, location, user_agent, match_key)
+SELECT
+    start_time,
+    user_id,
+    level,
+    song_id,
+    artist_id,
+    session_id,
+    location,
+    user_agent,
+    match_key
+FROM songplays_stage;
+"""
+
+user_table_merge = """
+DROP TABLE IF EXISTS users_stage;
+
+CREATE TEMPORARY TABLE users_stage AS
+SELECT user_id, first_name, last_name, gender, level
+FROM (
+    SELECT
+        userId as user_id,
+        firstName as first_name,
+        lastName as last_name,
+        gender,
+        level,
+        ROW_NUMBER() OVER (PARTITION BY userId ORDER BY ts DESC) as key_rank
+    FROM staging_events
+    WHERE userId IS NOT NULL
+) AS ranked
+WHERE key_rank = 1;
+
+DELETE FROM users
+USING users_stage
+WHERE users.user_id = users_stage.user_id;
+
+INSERT INTO users (user_id, first_name, last_name, gender, level)
+SELECT user_id, first_name, last_name, gender, level FROM users_stage;
+"""
+
+song_table_merge = """
+DROP TABLE IF EXISTS songs_stage;
+
+CREATE TEMPORARY TABLE songs_stage AS
+SELECT song_id, title, artist_id, year, duration
+FROM (
+    SELECT
+        song_id,
+        title,
+        artist_id,
+        year,
+        duration,
+        ROW_NUMBER() OVER (PARTITION BY song_id ORDER BY year DESC, duration) as key_rank
+    FROM staging_songs
+    WHERE song_id IS NOT NULL
+) AS ranked
+WHERE key_rank = 1;
+
+DELETE FROM songs
+USING songs_stage
+WHERE songs.song_id = songs_stage.song_id;
+
+INSERT INTO songs (song_id, title, artist_id, year, duration)
+SELECT song_id, title, artist_id, year, duration FROM songs_stage;
+"""
+
+artist_table_merge = """
+DROP TABLE IF EXISTS artists_stage;
+
+CREATE TEMPORARY TABLE artists_stage AS
+SELECT artist_id, name, location, latitude, longitude
+FROM (
+    SELECT
+        artist_id,
+        artist_name as name,
+        artist_location as location,
+        artist_latitude as latitude,
+        artist_longitude as longitude,
+        ROW_NUMBER() OVER (
+            PARTITION BY artist_id
+            ORDER BY artist_latitude NULLS LAST, artist_location NULLS LAST, artist_name
+        ) as key_rank
+    FROM staging_songs
+    WHERE artist_id IS NOT NULL
+) AS ranked
+WHERE key_rank = 1;
+
+DELETE FROM artists
+USING artists_stage
+WHERE artists.artist_id = artists_stage.artist_id;
+
+INSERT INTO artists (artist_id, name, location, latitude, longitude)
+SELECT artist_id, name, location, latitude, longitude FROM artists_stage;
+"""
+
+time_table_merge = """
+DROP TABLE IF EXISTS times_stage;
+
+CREATE TEMPORARY TABLE times_stage AS
+SELECT DISTINCT start_time
+FROM songplays_delta
+WHERE start_time IS NOT NULL;
+
+DELETE FROM times_stage
+USING times
+WHERE times_stage.start_time = times.start_time;
+
+INSERT INTO times (start_time, hour, day, week, month, year, weekday)
+SELECT
+    start_time,
+    extract(hour from start_time) as hour,
+    extract(day from start_time) as day,
+    extract(week from start_time) as week,
+    extract(month from start_time) as month,
+    extract(year from start_time) as year,
+    extract(dayofweek from start_time) as weekday
+FROM times_stage;
+"""
+
+# ROLLUP REFRESH
+# The songplays of songplays_delta are counted and added to the rollup rows
+# of the hours (days) they touch, which are replaced, so each refresh reads
+# just the new songplays and the touched rollup rows. Each refresh ends
+# with its insert, so the cursor rowcount is the number of replaced rows.
+
+hourly_plays_rollup_refresh = """
+DROP TABLE IF EXISTS rollup_hourly_plays_stage;
+
+CREATE TEMPORARY TABLE rollup_hourly_plays_stage AS
+SELECT start_hour, level, SUM(plays) as plays
+FROM (
+    SELECT DATE_TRUNC('hour', start_time) as start_hour, level, COUNT(*) as plays
+    FROM songplays_delta
+    GROUP BY 1, 2
+    UNION ALL
+    SELECT rolled.start_hour, rolled.level, rolled.plays
+    FROM rollup_hourly_plays rolled
+    JOIN (
+        SELECT DISTINCT DATE_TRUNC('hour', start_time) as start_hour
+        FROM songplays_delta
+    ) AS touched ON rolled.start_hour = touched.start_hour
+) AS folded
+GROUP BY start_hour, level;
+
+DELETE FROM rollup_hourly_plays
+USING rollup_hourly_plays_stage
+WHERE rollup_hourly_plays.start_hour = rollup_hourly_plays_stage.start_hour;
+
+INSERT INTO rollup_hourly_plays (start_hour, level, plays)
+SELECT start_hour, level, plays FROM rollup_hourly_plays_stage;
+"""
+
+daily_song_plays_rollup_refresh = """
+DROP TABLE IF EXISTS rollup_daily_song_plays_stage;
+
+CREATE TEMPORARY TABLE rollup_daily_song_plays_stage AS
+SELECT start_day, song_id, SUM(plays) as plays
+FROM (
+    SELECT DATE_TRUNC('day', start_time) as start_day, song_id, COUNT(*) as plays
+    FROM songplays_delta
+    WHERE song_id IS NOT NULL
+    GROUP BY 1, 2
+    UNION ALL
+    SELECT rolled.start_day, rolled.song_id, rolled.plays
+    FROM rollup_daily_song_plays rolled
+    JOIN (
+        SELECT DISTINCT DATE_TRUNC('day', start_time) as start_day
+        FROM songplays_delta
+        WHERE song_id IS NOT NULL
+    ) AS touched ON rolled.start_day = touched.start_day
+) AS folded
+GROUP BY start_day, song_id;
+
+DELETE FROM rollup_daily_song_plays
+USING rollup_daily_song_plays_stage
+WHERE rollup_daily_song_plays.start_day = rollup_daily_song_plays_stage.start_day;
+
+INSERT INTO rollup_daily_song_plays (start_day, song_id, plays)
+SELECT start_day, song_id, plays FROM rollup_daily_song_plays_stage;
+"""
+
+songplay_delta_count = "SELECT COUNT(*) FROM songplays_delta"
+songplay_delta_clear = "DELETE FROM songplays_delta"
+
+# SONGPLAYS BACKFILL
+# Songs may be loaded after their plays. Unmatched songplays of the last
+# days (filled at run time), whose match key is found among the staged
+# songs, get their song_id and artist_id. Just the recent unmatched plays
+# are scanned, so the cost is bounded whatever the fact table size. The
+# backfill ends with its update, so the cursor rowcount is the number of
+# resolved plays.
+
+songplay_backfill = """
+DROP TABLE IF EXISTS songplays_backfill;
+
+CREATE TEMPORARY TABLE songplays_backfill AS
+SELECT
+    songplays.songplay_id,
+    songplays.start_time,
+    staging_songs_keyed.song_id,
+    staging_songs_keyed.artist_id
+FROM songplays
+JOIN staging_songs_keyed ON songplays.match_key = staging_songs_keyed.match_key
+WHERE
+    songplays.song_id IS NULL AND
+    songplays.start_time >= (SELECT MAX(start_time) FROM songplays) - INTERVAL '{} days';
+
+UPDATE songplays
+SET song_id = songplays_backfill.song_id, artist_id = songplays_backfill.artist_id
+FROM songplays_backfill
+WHERE songplays.songplay_id = songplays_backfill.songplay_id;
+"""
+
+# resolved plays were left out of the song rollup while unmatched
+daily_song_plays_backfill_refresh = daily_song_plays_rollup_refresh.replace(
+    "songplays_delta", "songplays_backfill"
+)
+
+songplay_unmatched_count = """
+SELECT COUNT(*)
+FROM songplays
+WHERE
+    song_id IS NULL AND
+    match_key IS NOT NULL AND
+    start_time >= (SELECT MAX(start_time) FROM songplays) - INTERVAL '{} days'
+"""
+
+# ANALYTICAL QUERIES
+# Workload run by the analysts on the star schema, used to advise
+# and benchmark the physical table design (see advisor.py)
+
+top_songs_select = """
+SELECT s.title, COUNT(*) AS plays
+FROM songplays sp
+JOIN songs s ON sp.song_id = s.song_id
+WHERE sp.start_time >= (SELECT MAX(start_time) FROM songplays) - INTERVAL '7 days'
+GROUP BY s.title
+ORDER BY plays DESC
+LIMIT 10
+"""
+
+top_artists_select = """
+SELECT a.name, COUNT(DISTINCT sp.user_id) AS listeners
+FROM songplays sp
+JOIN artists a ON sp.artist_id = a.artist_id
+GROUP BY a.name
+ORDER BY listeners DESC
+LIMIT 10
+"""
+
+hourly_plays_select = """
+SELECT t.hour, COUNT(*) AS plays
+FROM songplays sp
+JOIN times t ON sp.start_time = t.start_time
+GROUP BY t.hour
+ORDER BY t.hour
+"""
+
+weekday_plays_select = """
+SELECT t.weekday, sp.level, COUNT(*) AS plays
+FROM songplays sp
+JOIN times t ON sp.start_time = t.start_time
+WHERE t.start_time >= (SELECT MAX(start_time) FROM times) - INTERVAL '30 days'
+GROUP BY t.weekday, sp.level
+ORDER BY t.weekday, sp.level
+"""
+
+user_level_plays_select = """
+SELECT u.level, u.gender, COUNT(*) AS plays
+FROM songplays sp
+JOIN users u ON sp.user_id = u.user_id
+GROUP BY u.level, u.gender
+"""
+
 # QUERY LISTS
 
 create_table_queries = [
@@ -232,6 +894,10 @@ create_table_queries = [
     artist_table_create,
     time_table_create,
     songplay_table_create,
+    songplay_delta_table_create,
+    hourly_plays_rollup_create,
+    daily_song_plays_rollup_create,
+    load_generation_create,
 ]
 
 drop_table_queries = [
@@ -240,6 +906,9 @@ drop_table_queries = [
     song_table_drop,
     artist_table_drop,
     time_table_drop,
+    songplay_delta_table_drop,
+    hourly_plays_rollup_drop,
+    daily_song_plays_rollup_drop,
 ]
 
 create_staging_table_queries = [
@@ -249,6 +918,13 @@ create_staging_table_queries = [
 
 copy_table_queries = [staging_events_copy, staging_songs_copy]
 
+match_key_queries = [staging_events_keys, staging_songs_keys]
+
+manifest_copy_table_queries = [
+    (staging_events_manifest_copy, config["S3"]["LOG_DATA"]),
+    (staging_songs_manifest_copy, config["S3"]["SONG_DATA"]),
+]
+
 insert_table_queries = [
     song_table_insert,
     songplay_table_insert,
@@ -256,3 +932,47 @@ insert_table_queries = [
     artist_table_insert,
     time_table_insert,
 ]
+
+merge_table_queries = [
+    song_table_merge,
+    songplay_table_merge,
+    user_table_merge,
+    artist_table_merge,
+    time_table_merge,
+]
+
+# rollup tables kept by the ETL, refreshed after the inserts
+rollup_table_queries = [
+    ("rollup_hourly_plays", hourly_plays_rollup_refresh),
+    ("rollup_daily_song_plays", daily_song_plays_rollup_refresh),
+]
+
+insert_strategies = {
+    "except": insert_table_queries,
+    "merge": merge_table_queries,
+}
+
+# tables read and written by each load step, so a step starts as soon as
+# the steps writing the tables it reads are done (whatever the strategy)
+step_tables = {
+    "COPY staging_events": ([], ["staging_events"]),
+    "COPY staging_songs": ([], ["staging_songs"]),
+    "staging_events_keyed": (["staging_events"], ["staging_events_keyed"]),
+    "staging_songs_keyed": (["staging_songs"], ["staging_songs_keyed"]),
+    "songs": (["staging_songs"], ["songs"]),
+    "songplays": (
+        ["staging_events_keyed", "staging_songs_keyed"],
+        ["songplays", "songplays_delta"],
+    ),
+    "users": (["staging_events"], ["users"]),
+    "artists": (["staging_songs"], ["artists"]),
+    "times": (["songplays", "songplays_delta"], ["times"]),
+}
+
+analytical_queries = [
+    ("top_songs", top_songs_select),
+    ("top_artists", top_artists_select),
+    ("hourly_plays", hourly_plays_select),
+    ("weekday_plays", weekday_plays_select),
+    ("user_level_plays", user_level_plays_select),
+]
@@ -0,0 +1,622 @@
+import collections
+import contextlib
+import logging
+import os
+import random
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from botocore.exceptions import BotoCoreError, ClientError
+
+# error codes worth retrying, as they are transient
+_retry_codes = {
+    "500",
+    "503",
+    "InternalError",
+    "RequestTimeout",
+    "RequestTimeTooSkewed",
+    "ServiceUnavailable",
+    "SlowDown",
+    "Throttling",
+    "ThrottlingException",
+}
+
+
+def parse_s3_uri(uri):
+    """
+    Description: This function is responsible for splitting an
+    s3 uri into its bucket name and key prefix.
+
+    Arguments:
+        uri (str, required): S3 uri (s3://bucket/prefix).
+
+    Returns:
+        (str, str): The bucket name and the key prefix.
+    """
+    bucket, _, prefix = uri.replace("s3://", "", 1).partition("/")
+    return bucket, prefix
+
+
+def _object_record(obj):
+    """
+    Description: This function is responsible for keeping the fields of
+    a listed object used by the pipeline.
+
+    Arguments:
+        obj (dict, required): Object returned by the list_objects_v2 api.
+
+    Returns:
+        dict: The key, etag, last_modified and size of the object.
+    """
+    return {
+        "key": obj["Key"],
+        "etag": obj["ETag"].strip('"'),
+        "last_modified": obj["LastModified"].isoformat(),
+        "size": obj["Size"],
+    }
+
+
+def list_objects(s3_client, uri):
+    """
+    Description: This function is responsible for listing all
+    objects stored under an s3 uri, following the pagination of
+    the list_objects_v2 api. Directory placeholders (objects with
+    size 0) are skipped.
+
+    Arguments:
+        s3_client: boto3 s3 client.
+        uri (str, required): S3 uri (s3://bucket/prefix).
+
+    Returns:
+        generator: Dictionaries with the key, etag, last_modified
+        and size of each object.
+    """
+    bucket, prefix = parse_s3_uri(uri)
+    paginator = s3_client.get_paginator("list_objects_v2")
+
+    for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+        for obj in page.get("Contents", []):
+            if obj["Size"] == 0:
+                continue
+
+            yield _object_record(obj)
+
+
+def with_retry(function, retries=5, backoff=0.2, max_backoff=10.0):
+    """
+    Description: This function is responsible for calling an s3 operation,
+    retrying transient errors (throttling, timeouts, 5xx and connection
+    errors) with exponential backoff and full jitter.
+
+    Arguments:
+        function (callable, required): Operation without arguments.
+        retries (int, optional): Maximum number of retries.
+        backoff (float, optional): Base delay in seconds.
+        max_backoff (float, optional): Maximum delay in seconds.
+
+    Returns:
+        The operation result.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return function()
+
+        except (ClientError, BotoCoreError) as error:
+            transient = not isinstance(error, ClientError) or (
+                error.response.get("Error", {}).get("Code") in _retry_codes
+            )
+            if not transient or attempt == retries:
+                raise
+
+            delay = random.uniform(0, min(max_backoff, backoff * 2 ** attempt))
+            logging.warning("S3: %s, retrying in %.2fs." % (error, delay))
+            time.sleep(delay)
+
+
+class ObjectCache:
+    """
+    Description: This class is responsible for keeping downloaded objects
+    on the local disk, keyed by their ETag, so the same object content is
+    never downloaded twice. Beyond the size limit, the least recently used
+    objects are evicted, but for the pinned ones (handed out and not read
+    yet). The use order is kept in memory, so the directory is just
+    scanned once, when the cache is opened.
+    """
+
+    def __init__(self, directory, max_bytes=0):
+        """
+        Description: This function is responsible for setting
+        the cache directory and its size limit.
+
+        Arguments:
+            directory (str, required): Cache directory path.
+            max_bytes (int, optional): Size limit (0 for no limit).
+
+        Returns:
+            None
+        """
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # objects are put by many threads at once
+        self._lock = threading.Lock()
+        # sizes by path, the least recently used first
+        self._index = collections.OrderedDict(
+            (path, size) for path, size, _ in (self._entries() if max_bytes else [])
+        )
+        self._bytes = sum(self._index.values())
+        self._pinned = collections.Counter()
+
+    def path(self, etag):
+        """
+        Description: This function is responsible for finding the
+        cache file path of an ETag.
+
+        Arguments:
+            etag (str, required): Object ETag.
+
+        Returns:
+            str: The cache file path.
+        """
+        return os.path.join(self.directory, etag[:2], etag)
+
+    def _entries(self):
+        """
+        Description: This function is responsible for listing the
+        cached objects.
+
+        Arguments:
+            None
+
+        Returns:
+            list: (path, size, last use time) tuples, least recently used first.
+        """
+        entries = []
+        if not os.path.isdir(self.directory):
+            return entries
+
+        for folder in os.scandir(self.directory):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if not entry.name.endswith(".tmp"):
+                    stat = entry.stat()
+                    entries.append((entry.path, stat.st_size, stat.st_mtime))
+
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def _use(self, path, pin):
+        """
+        Description: This function is responsible for moving an object to
+        the most recently used end of the index and pinning it. It is
+        called holding the lock.
+
+        Arguments:
+            path (str, required): Cache file path.
+            pin (bool, required): Pin the object until released.
+
+        Returns:
+            None
+        """
+        if pin:
+            self._pinned[path] += 1
+
+        if self.max_bytes:
+            size = self._index.pop(path, None)
+            if size is None:
+                # put by another process or the first time
+                size = os.path.getsize(path)
+                self._bytes += size
+            self._index[path] = size
+
+    def _evict(self):
+        """
+        Description: This function is responsible for removing the least
+        recently used objects that are not pinned, until the cache fits its
+        size limit. It is called holding the lock.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+        """
+        excess = self._bytes - self.max_bytes
+        evicted = []
+        for path, size in self._index.items():
+            if excess <= 0:
+                break
+            if not self._pinned[path]:
+                evicted.append(path)
+                excess -= size
+
+        for path in evicted:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+            self._bytes -= self._index.pop(path)
+            self.evictions += 1
+
+    def get(self, etag, pin=False):
+        """
+        Description: This function is responsible for looking for an
+        object in the cache.
+
+        Arguments:
+            etag (str, required): Object ETag.
+            pin (bool, optional): Keep the object from being evicted until
+            released.
+
+        Returns:
+            str: The cache file path, or None when not cached.
+        """
+        path = self.path(etag)
+        with self._lock:
+            try:
+                # the modification time keeps the use order across runs
+                os.utime(path)
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._use(path, pin)
+
+        return path
+
+    def put(self, etag, body, pin=False):
+        """
+        Description: This function is responsible for storing an object
+        body in the cache. The file is written under a temporary name and
+        renamed, so concurrent readers never see a partial file, and the
+        temporary file is removed when the download fails.
+
+        Arguments:
+            etag (str, required): Object ETag.
+            body: file-like object with the object content.
+            pin (bool, optional): Keep the object from being evicted until
+            released.
+
+        Returns:
+            str: The cache file path.
+        """
+        path = self.path(etag)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        tmp_path = "%s.%s.tmp" % (path, uuid.uuid4().hex[:8])
+        try:
+            with open(tmp_path, "wb") as cache_file:
+                shutil.copyfileobj(body, cache_file, 1 << 20)
+            os.replace(tmp_path, path)
+        finally:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(tmp_path)
+
+        with self._lock:
+            self._use(path, pin)
+            if self.max_bytes and self._bytes > self.max_bytes:
+                self._evict()
+
+        return path
+
+    def release(self, path):
+        """
+        Description: This function is responsible for unpinning an object,
+        so it can be evicted again.
+
+        Arguments:
+            path (str, required): Cache file path, as returned by get or put.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._pinned[path] -= 1
+            if self._pinned[path] <= 0:
+                del self._pinned[path]
+
+
+class S3Storage:
+    """
+    Description: This class is responsible for the s3 object access of the
+    pipeline: listing split by key prefix and run in parallel, fetching
+    with bounded concurrency and retries, and caching on the local disk.
+    """
+
+    def __init__(
+        self, s3_client, cache_dir=None, workers=16, retries=5, cache_max_bytes=0
+    ):
+        """
+        Description: This function is responsible for setting the
+        client, the cache and the concurrency of the storage.
+
+        Arguments:
+            s3_client: boto3 s3 client.
+            cache_dir (str, optional): ETag cache directory (no cache if None).
+            workers (int, optional): Maximum number of concurrent requests.
+            retries (int, optional): Maximum number of retries of a request.
+            cache_max_bytes (int, optional): Cache size limit (0 for no limit).
+
+        Returns:
+            None
+        """
+        self.s3_client = s3_client
+        self.cache = ObjectCache(cache_dir, cache_max_bytes) if cache_dir else None
+        self.workers = workers
+        self.retries = retries
+
+    def _list_level(self, bucket, prefix):
+        """
+        Description: This function is responsible for listing one level
+        of a prefix (split by '/'): the objects stored directly under it
+        and its sub prefixes.
+
+        Arguments:
+            bucket (str, required): Bucket name.
+            prefix (str, required): Key prefix.
+
+        Returns:
+            (list, list): The objects and the sub prefixes.
+        """
+        paginator = self.s3_client.get_paginator("list_objects_v2")
+        objects, prefixes = [], []
+
+        pages = paginator.paginate(Bucket=bucket, Prefix=prefix, Delimiter="/")
+        for page in pages:
+            prefixes += [common["Prefix"] for common in page.get("CommonPrefixes", [])]
+            objects += [
+                _object_record(obj) for obj in page.get("Contents", []) if obj["Size"] > 0
+            ]
+
+        return objects, prefixes
+
+    def list_objects(self, uri, depth=2):
+        """
+        Description: This function is responsible for listing all the
+        objects stored under an s3 uri. The prefix is split by '/' up to
+        the given depth (e.g. song_data/A/B/) and each part is paginated
+        in parallel.
+
+        Arguments:
+            uri (str, required): S3 uri (s3://bucket/prefix).
+            depth (int, optional): Number of prefix levels to split.
+
+        Returns:
+            list: Objects sorted by key, as returned by list_objects.
+        """
+        bucket, prefix = parse_s3_uri(uri)
+        if prefix and not prefix.endswith("/"):
+            prefix += "/"
+
+        objects = []
+        prefixes = [prefix]
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            # the objects of the intermediate levels are listed on the way
+            for _ in range(depth):
+                levels = executor.map(lambda p: self._list_level(bucket, p), prefixes)
+
+                prefixes = []
+                for level_objects, level_prefixes in levels:
+                    objects += level_objects
+                    prefixes += level_prefixes
+
+            listings = executor.map(
+                lambda p: list(list_objects(self.s3_client, "s3://%s/%s" % (bucket, p))),
+                prefixes,
+            )
+            objects += [obj for listing in listings for obj in listing]
+
+        logging.info(
+            "S3: listed %d objects of %s over %d prefixes."
+            % (len(objects), uri, len(prefixes))
+        )
+        return sorted(objects, key=lambda obj: obj["key"])
+
+    def _fetch(self, bucket, obj):
+        """
+        Description: This function is responsible for fetching an object,
+        from the cache when its ETag was already downloaded.
+
+        Arguments:
+            bucket (str, required): Bucket name.
+            obj (dict, required): Object returned by list_objects.
+
+        Returns:
+            (dict, str|StreamingBody): The object and its cache file path,
+            or its body, to be streamed, when there is no cache.
+        """
+        # cached objects are pinned until handed out by fetch
+        if self.cache is not None:
+            path = self.cache.get(obj["etag"], pin=True)
+            if path is not None:
+                return obj, path
+
+        def get():
+            body = self.s3_client.get_object(Bucket=bucket, Key=obj["key"])["Body"]
+            if self.cache is None:
+                return body
+
+            try:
+                return self.cache.put(obj["etag"], body, pin=True)
+            finally:
+                body.close()
+
+        return obj, with_retry(get, retries=self.retries)
+
+    def _hand_out(self, future):
+        """
+        Description: This function is responsible for handing a fetched
+        object out, releasing its cache file (or closing its body) once the
+        consumer is done.
+
+        Arguments:
+            future (Future, required): The object fetch.
+
+        Returns:
+            generator: The (object, cache file path or body) tuple.
+        """
+        obj, content = future.result()
+        try:
+            yield obj, content
+        finally:
+            self._release(content)
+
+    def _release(self, content):
+        """
+        Description: This function is responsible for releasing a fetched
+        object: unpinning its cache file or closing its body.
+
+        Arguments:
+            content (str|StreamingBody, required): Cache file path or body.
+
+        Returns:
+            None
+        """
+        if self.cache is not None:
+            self.cache.release(content)
+        else:
+            content.close()
+
+    def fetch(self, bucket, objects, prefetch=None):
+        """
+        Description: This function is responsible for fetching objects
+        over a thread pool. Results are returned in the objects order and
+        at most 'prefetch' objects are fetched ahead of the consumer, so
+        memory is bounded. Cached objects are kept from eviction until the
+        consumer asks for the next one. With no cache, the bodies are handed
+        out to be streamed, never read as a whole.
+
+        Arguments:
+            bucket (str, required): Bucket name.
+            objects (list, required): Objects returned by list_objects.
+            prefetch (int, optional): Objects fetched ahead (default: 4 x workers).
+
+        Returns:
+            generator: (object, cache file path or body) tuples.
+        """
+        prefetch = prefetch or self.workers * 4
+        if self.cache is None:
+            # each body holds a pooled connection until it is read
+            prefetch = min(prefetch, self.s3_client.meta.config.max_pool_connections)
+        objects = iter(objects)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            window = []
+            try:
+                for obj in objects:
+                    window.append(executor.submit(self._fetch, bucket, obj))
+                    if len(window) >= prefetch:
+                        yield from self._hand_out(window.pop(0))
+
+                while window:
+                    yield from self._hand_out(window.pop(0))
+            finally:
+                # objects fetched ahead of a consumer that stopped early
+                for future in window:
+                    if future.exception() is None:
+                        self._release(future.result()[1])
+
+        if self.cache is not None:
+            logging.info(
+                "S3: cache hits %d, misses %d, evictions %d."
+                % (self.cache.hits, self.cache.misses, self.cache.evictions)
+            )
+
+
+class LocalStorage:
+    """
+    Description: This class is responsible for standing in for S3Storage
+    with a local directory, where s3://bucket/key is the file
+    <root>/bucket/key. It is used to run and test the pipeline offline.
+    """
+
+    def __init__(self, root):
+        """
+        Description: This function is responsible for setting
+        the root directory.
+
+        Arguments:
+            root (str, required): Root directory path.
+
+        Returns:
+            None
+        """
+        self.root = root
+
+    def list_objects(self, uri, depth=2):
+        """
+        Description: This function is responsible for listing the files
+        stored under an s3 uri.
+
+        Arguments:
+            uri (str, required): S3 uri (s3://bucket/prefix).
+            depth (int, optional): Ignored, kept for compatibility.
+
+        Returns:
+            list: Objects sorted by key, as returned by list_objects.
+        """
+        bucket, prefix = parse_s3_uri(uri)
+        bucket_dir = os.path.join(self.root, bucket)
+
+        objects = []
+        for root, _, files in os.walk(os.path.join(bucket_dir, prefix)):
+            for filename in files:
+                path = os.path.join(root, filename)
+                stat = os.stat(path)
+                if stat.st_size == 0:
+                    continue
+
+                objects.append(
+                    {
+                        "key": os.path.relpath(path, bucket_dir).replace(os.sep, "/"),
+                        "etag": "%x-%x" % (stat.st_mtime_ns, stat.st_size),
+                        "last_modified": time.strftime(
+                            "%Y-%m-%dT%H:%M:%S+00:00", time.gmtime(stat.st_mtime)
+                        ),
+                        "size": stat.st_size,
+                    }
+                )
+
+        return sorted(objects, key=lambda obj: obj["key"])
+
+    def fetch(self, bucket, objects, prefetch=None):
+        """
+        Description: This function is responsible for returning
+        the file path of each object.
+
+        Arguments:
+            bucket (str, required): Bucket name.
+            objects (list, required): Objects returned by list_objects.
+            prefetch (int, optional): Ignored, kept for compatibility.
+
+        Returns:
+            generator: (object, file path) tuples.
+        """
+        for obj in objects:
+            yield obj, os.path.join(self.root, bucket, obj["key"])
+
+
+def storage_from_config(s3_client, config):
+    """
+    Description: This function is responsible for creating the s3
+    access layer from the 'ETL' configurations.
+
+    Arguments:
+        s3_client: boto3 s3 client.
+        config: the loaded configurations.
+
+    Returns:
+        S3Storage: The s3 access layer.
+    """
+    return S3Storage(
+        s3_client,
+        cache_dir=config["ETL"]["CACHE_DIR"] or None,
+        workers=int(config["ETL"]["S3_WORKERS"]),
+        cache_max_bytes=int(config["ETL"]["CACHE_MAX_MB"]) << 20,
+    )
@@ -0,0 +1,424 @@
+import array
+import hashlib
+import json
+import os
+import random
+import string
+import struct
+from datetime import datetime, timezone
+
+_pages = ["Home", "Logout", "Settings", "About", "Help", "Upgrade"]
+_user_agents = [
+    '"Mozilla/5.0 (Macintosh; Intel Mac OS X 10_9_4) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/36.0.1985.143 Safari/537.36"',
+    "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:31.0) Gecko/20100101 Firefox/31.0",
+    '"Mozilla/5.0 (iPhone; CPU iPhone OS 7_1_2 like Mac OS X) AppleWebKit/537.51.2 (KHTML, like Gecko) Version/7.0 Mobile/11D257 Safari/9537.53"',
+]
+_locations = [
+    "San Francisco-Oakland-Hayward, CA",
+    "Phoenix-Mesa-Scottsdale, AZ",
+    "New York-Newark-Jersey City, NY-NJ-PA",
+    "Chicago-Naperville-Elgin, IL-IN-WI",
+    None,
+]
+
+
+def _epoch_ms(moment):
+    """
+    Description: This function is responsible for converting a datetime
+    to epoch milliseconds, as the log 'ts' field. Naive datetimes are
+    taken as UTC.
+
+    Arguments:
+        moment (datetime, required): Datetime to be converted.
+
+    Returns:
+        int: Epoch milliseconds.
+    """
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+
+    return int(moment.timestamp() * 1000)
+
+
+# random bytes to identifier characters, and to eight 64 bits numbers
+_identifier_table = bytes(
+    (string.ascii_uppercase + string.digits).encode()[byte % 36] for byte in range(256)
+)
+_slots = struct.Struct(">8Q")
+# song years, 0 when unknown as in the Million Song Dataset
+_years = [0] + list(range(1960, 2019))
+
+
+def _draws(seed, kind, index):
+    """
+    Description: This function is responsible for drawing the random
+    bytes of a record from its seed, kind and index alone, so the record
+    is derived again whenever it is needed instead of being kept in memory.
+
+    Arguments:
+        seed (int, required): Random seed of the dataset.
+        kind (str, required): Record kind (e.g. 'song' or 'artist').
+        index (int, required): Record index.
+
+    Returns:
+        bytes: 64 pseudo random bytes.
+    """
+    return hashlib.blake2b(b"%d:%s:%d" % (seed, kind.encode(), index)).digest()
+
+
+def _uniforms(draws):
+    """
+    Description: This function is responsible for reading uniform
+    numbers in [0, 1) out of the random bytes of a record.
+
+    Arguments:
+        draws (bytes, required): Random bytes, as returned by _draws.
+
+    Returns:
+        list: 8 uniform numbers, one by 8 bytes.
+    """
+    return [value / 2.0 ** 64 for value in _slots.unpack(draws)]
+
+
+def _identifier(draws, prefix):
+    """
+    Description: This function is responsible for creating an identifier
+    shaped as the Million Song Dataset ones (e.g. SOQPWCR12A6D4FB2A3).
+
+    Arguments:
+        draws (bytes, required): 16 random bytes.
+        prefix (str, required): Identifier prefix (e.g. 'SO' or 'AR').
+
+    Returns:
+        str: The 18 characters identifier.
+    """
+    return prefix + draws[:16].translate(_identifier_table).decode()
+
+
+def _zipf_rank(uniform, size, skew):
+    """
+    Description: This function is responsible for drawing a Zipf-like
+    rank, where the item of rank k weights about 1 / k ** skew, inverting
+    the cumulative weights of the continuous distribution, so no weights
+    are kept by item. A skew of 0 gives a uniform distribution.
+
+    Arguments:
+        uniform (float, required): Uniform number in [0, 1).
+        size (int, required): Number of items.
+        skew (float, required): Distribution skew.
+
+    Returns:
+        int: The drawn rank, from 0 (the most frequent item) to size - 1.
+    """
+    if abs(skew - 1.0) < 1e-9:
+        rank = (size + 1) ** uniform
+    else:
+        exponent = 1.0 - skew
+        rank = (1.0 + uniform * ((size + 1) ** exponent - 1.0)) ** (1.0 / exponent)
+
+    return min(max(int(rank), 1), size) - 1
+
+
+def artist_record(seed, index):
+    """
+    Description: This function is responsible for deriving the artist
+    fields of the song_data files of an artist.
+
+    Arguments:
+        seed (int, required): Random seed of the dataset.
+        index (int, required): Artist index.
+
+    Returns:
+        dict: Artist fields.
+    """
+    draws = _draws(seed, "artist", index)
+    uniforms = _uniforms(draws)
+    location = _locations[int(uniforms[0] * len(_locations))]
+    has_coordinates = location is not None and uniforms[1] < 0.6
+
+    return {
+        "artist_id": _identifier(draws[32:48], "AR"),
+        "artist_latitude": (
+            round(uniforms[2] * 180 - 90, 5) if has_coordinates else None
+        ),
+        "artist_location": location or "",
+        "artist_longitude": (
+            round(uniforms[3] * 360 - 180, 5) if has_coordinates else None
+        ),
+        "artist_name": "Artist %d" % index,
+    }
+
+
+class SongCatalog:
+    """
+    Description: This class is responsible for standing in for the list
+    of the song records of a dataset, deriving each song (and its artist)
+    from its index when it is read, so memory does not grow with the
+    number of songs.
+    """
+
+    def __init__(self, seed, num_songs, num_artists, artist_skew):
+        """
+        Description: This function is responsible for setting the
+        catalog up.
+
+        Arguments:
+            seed (int, required): Random seed of the dataset.
+            num_songs (int, required): Number of songs.
+            num_artists (int, required): Number of artists.
+            artist_skew (float, required): Skew of the songs per artist.
+
+        Returns:
+            None
+        """
+        self.seed = seed
+        self.num_songs = num_songs
+        self.num_artists = num_artists
+        self.artist_skew = artist_skew
+
+    def __len__(self):
+        return self.num_songs
+
+    def __getitem__(self, index):
+        """
+        Description: This function is responsible for deriving a song
+        record with the fields of the song_data files.
+
+        Arguments:
+            index (int, required): Song index.
+
+        Returns:
+            dict: Song record.
+        """
+        if not 0 <= index < self.num_songs:
+            raise IndexError(index)
+
+        draws = _draws(self.seed, "song", index)
+        uniforms = _uniforms(draws)
+        artist = _zipf_rank(uniforms[0], self.num_artists, self.artist_skew)
+
+        song = artist_record(self.seed, artist)
+        song.update(
+            {
+                "duration": round(60 + uniforms[1] * 540, 5),
+                "num_songs": 1,
+                "song_id": _identifier(draws[24:40], "SO"),
+                "title": "Song %d" % index,
+                "year": _years[int(uniforms[2] * len(_years))],
+            }
+        )
+
+        return song
+
+    def played(self, index):
+        """
+        Description: This function is responsible for deriving just the
+        song fields logged by the plays of a song, without its artist record.
+
+        Arguments:
+            index (int, required): Song index.
+
+        Returns:
+            (str, str, float): The artist name, title and duration.
+        """
+        uniforms = _uniforms(_draws(self.seed, "song", index))
+        artist = _zipf_rank(uniforms[0], self.num_artists, self.artist_skew)
+
+        return (
+            "Artist %d" % artist,
+            "Song %d" % index,
+            round(60 + uniforms[1] * 540, 5),
+        )
+
+    def track_id(self, index):
+        """
+        Description: This function is responsible for deriving the track
+        id naming the song_data file of a song.
+
+        Arguments:
+            index (int, required): Song index.
+
+        Returns:
+            str: The track id.
+        """
+        return _identifier(_draws(self.seed, "song", index)[40:56], "TR")
+
+
+def user_record(seed, index, start_ms):
+    """
+    Description: This function is responsible for deriving the fields of
+    the events of a user, as they are at the first event.
+
+    Arguments:
+        seed (int, required): Random seed of the users.
+        index (int, required): User index.
+        start_ms (int, required): Epoch milliseconds of the first event.
+
+    Returns:
+        dict: User fields.
+    """
+    uniforms = _uniforms(_draws(seed, "user", index))
+
+    return {
+        "firstName": "First%d" % index,
+        "lastName": "Last%d" % index,
+        "gender": "MF"[int(uniforms[0] * 2)],
+        "level": ["free", "paid"][int(uniforms[1] * 2)],
+        "location": _locations[int(uniforms[2] * (len(_locations) - 1))],
+        "registration": float(start_ms - int(uniforms[3] * (10 ** 10 + 1))),
+        "userAgent": _user_agents[int(uniforms[4] * len(_user_agents))],
+        "userId": str(index + 1),
+        "sessionId": 1 + int(uniforms[5] * 1000),
+    }
+
+
+def generate_events(rng, songs, num_events, num_users, user_skew, start, days):
+    """
+    Description: This function is responsible for generating, in time order,
+    log records with the fields of the log_data files. Most of the events
+    are song plays ('NextSong' page) of the given songs. Users are derived
+    from their index, just their session, item and level changes are kept.
+
+    Arguments:
+        rng (random.Random, required): Random generator.
+        songs (SongCatalog, required): Songs played by the users.
+        num_events (int, required): Number of events.
+        num_users (int, required): Number of users.
+        user_skew (float, required): Skew of the events per user.
+        start (datetime, required): Timestamp of the first event.
+        days (int, required): Number of days covered by the events.
+
+    Returns:
+        generator: Log records.
+    """
+    users_seed = rng.getrandbits(64)
+    new_sessions = array.array("l", [0]) * num_users
+    items = array.array("l", [0]) * num_users
+    level_changes = bytearray(num_users)
+
+    start_ms = _epoch_ms(start)
+    step_ms = days * 24 * 3600 * 1000 / max(num_events, 1)
+
+    for i in range(num_events):
+        index = _zipf_rank(rng.random(), num_users, user_skew)
+        user = user_record(users_seed, index, start_ms)
+
+        # users eventually start a new session or change their level
+        if rng.random() < 0.02:
+            new_sessions[index] += 1
+            items[index] = 0
+        if rng.random() < 0.001:
+            level_changes[index] ^= 1
+        if level_changes[index]:
+            user["level"] = "paid" if user["level"] == "free" else "free"
+
+        if rng.random() < 0.8:
+            artist, title, length = songs.played(rng.randrange(len(songs)))
+            page = "NextSong"
+        else:
+            artist, title, length, page = None, None, None, rng.choice(_pages)
+
+        items[index] += 1
+        yield {
+            "artist": artist,
+            "auth": "Logged In",
+            "firstName": user["firstName"],
+            "gender": user["gender"],
+            "itemInSession": items[index],
+            "lastName": user["lastName"],
+            "length": length,
+            "level": user["level"],
+            "location": user["location"],
+            "method": "PUT" if page == "NextSong" else "GET",
+            "page": page,
+            "registration": user["registration"],
+            "sessionId": user["sessionId"] + new_sessions[index] * num_users,
+            "song": title,
+            "status": 200,
+            "ts": start_ms + int(i * step_ms),
+            "userAgent": user["userAgent"],
+            "userId": user["userId"],
+        }
+
+
+def write_dataset(
+    data_dir,
+    num_events=10000,
+    num_songs=None,
+    num_artists=None,
+    num_users=None,
+    artist_skew=1.0,
+    user_skew=1.0,
+    start=datetime(2018, 11, 1),
+    days=30,
+    songs_per_file=1,
+    seed=0,
+):
+    """
+    Description: This function is responsible for writing a synthetic
+    Sparkify dataset laid out as the udacity-dend bucket. Songs are written
+    to song_data/A/B/C/<track id>.json files and events to daily JSON lines
+    files in log_data/YYYY/MM/YYYY-MM-DD-events.json. Songs, artists and
+    users are derived from their index whenever they are needed and events
+    are generated and written as a stream, so memory just grows with the
+    number of users (a few bytes of session state each).
+
+    Arguments:
+        data_dir (str, required): Output directory.
+        num_events (int, optional): Number of log events.
+        num_songs (int, optional): Number of songs (default: events / 10).
+        num_artists (int, optional): Number of artists (default: songs / 4).
+        num_users (int, optional): Number of users (default: events / 100).
+        artist_skew (float, optional): Zipf skew of the songs per artist.
+        user_skew (float, optional): Zipf skew of the events per user.
+        start (datetime, optional): Timestamp of the first event.
+        days (int, optional): Number of days covered by the events.
+        songs_per_file (int, optional): Songs in each song_data file.
+        seed (int, optional): Random seed.
+
+    Returns:
+        dict: Number of songs, events and files written.
+    """
+    rng = random.Random(seed)
+    num_songs = num_songs or max(num_events // 10, 1)
+    num_artists = num_artists or max(num_songs // 4, 1)
+    num_users = num_users or max(num_events // 100, 1)
+
+    # songs are derived from their index, when written and when played
+    songs = SongCatalog(seed, num_songs, num_artists, artist_skew)
+
+    files = 0
+    for i in range(0, len(songs), songs_per_file):
+        track_id = songs.track_id(i)
+        song_dir = os.path.join(data_dir, "song_data", *track_id[2:5])
+        os.makedirs(song_dir, exist_ok=True)
+
+        with open(os.path.join(song_dir, track_id + ".json"), "w") as song_file:
+            for index in range(i, min(i + songs_per_file, len(songs))):
+                song_file.write(json.dumps(songs[index]) + "\n")
+        files += 1
+
+    day, log_file = None, None
+    events = generate_events(rng, songs, num_events, num_users, user_skew, start, days)
+    for event in events:
+        event_day = datetime.fromtimestamp(event["ts"] / 1000, timezone.utc).date()
+        if event_day != day:
+            if log_file:
+                log_file.close()
+
+            day = event_day
+            log_dir = os.path.join(
+                data_dir, "log_data", "%04d" % day.year, "%02d" % day.month
+            )
+            os.makedirs(log_dir, exist_ok=True)
+            log_file = open(
+                os.path.join(log_dir, "%s-events.json" % day.isoformat()), "w"
+            )
+            files += 1
+
+        log_file.write(json.dumps(event) + "\n")
+
+    if log_file:
+        log_file.close()
+
+    return {"songs": len(songs), "events": num_events, "files": files}
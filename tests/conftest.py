@@ -0,0 +1,184 @@
+import configparser
+import os
+import shutil
+import sys
+import tempfile
+import urllib.parse
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# sql_queries reads dwh.cfg from the working directory when imported
+_workdir = tempfile.mkdtemp(prefix="sparkify-tests-")
+shutil.copy(os.path.join(ROOT, "dwh.default.cfg"), os.path.join(_workdir, "dwh.cfg"))
+os.chdir(_workdir)
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """
+    Description: This fixture is responsible for writing configuration
+    files made of dwh.default.cfg with some values replaced.
+
+    Arguments:
+        tmp_path: the pytest temporary directory.
+
+    Returns:
+        function: Called with {section: {option: value}}, returning the
+        configuration file path.
+    """
+
+    def make(sections=None, name="dwh.cfg"):
+        config = configparser.ConfigParser()
+        config.read(os.path.join(ROOT, "dwh.default.cfg"))
+        for section, options in (sections or {}).items():
+            for option, value in options.items():
+                config[section][option] = str(value)
+
+        path = str(tmp_path / name)
+        with open(path, "w") as config_file:
+            config.write(config_file)
+
+        return path
+
+    return make
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    """
+    Description: This fixture is responsible for writing a small
+    synthetic dataset of three days.
+
+    Arguments:
+        tmp_path: the pytest temporary directory.
+
+    Returns:
+        str: The dataset directory.
+    """
+    from synthetic import write_dataset
+
+    data_dir = str(tmp_path / "data")
+    write_dataset(data_dir, num_events=3000, days=3, seed=7)
+    return data_dir
+
+
+@pytest.fixture
+def aws(monkeypatch):
+    """
+    Description: This fixture is responsible for mocking the AWS services
+    with moto, with fake credentials.
+
+    Arguments:
+        monkeypatch: the pytest monkeypatch fixture.
+
+    Returns:
+        None
+    """
+    moto = pytest.importorskip("moto")
+    for name in ["AWS_ACCESS_KEY_ID", "AWS_SECRET_ACCESS_KEY", "AWS_SESSION_TOKEN"]:
+        monkeypatch.setenv(name, "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-west-2")
+    # the role is attached to the AmazonS3ReadOnlyAccess managed policy
+    monkeypatch.setenv("MOTO_IAM_LOAD_MANAGED_POLICIES", "true")
+
+    with moto.mock_aws():
+        yield
+
+
+@pytest.fixture(scope="session")
+def postgres_server(tmp_path_factory):
+    """
+    Description: This fixture is responsible for finding a PostgreSQL
+    server: the one of the PGHOST, PGPORT, PGUSER and PGPASSWORD variables
+    or, when they are not set, one started with pgserver. Tests needing it
+    are skipped when there is none.
+
+    Arguments:
+        tmp_path_factory: the pytest temporary directory factory.
+
+    Returns:
+        dict: The 'DB' section values of the server (without dbname).
+    """
+    pytest.importorskip("psycopg2")
+
+    if os.environ.get("PGHOST"):
+        yield {
+            "host": os.environ["PGHOST"],
+            "user": os.environ.get("PGUSER", "postgres"),
+            "password": os.environ.get("PGPASSWORD", "postgres"),
+            "port": os.environ.get("PGPORT", "5432"),
+        }
+        return
+
+    pgserver = pytest.importorskip("pgserver")
+    server = pgserver.get_server(
+        str(tmp_path_factory.mktemp("pgdata")), cleanup_mode="stop"
+    )
+    # the server listens on a unix socket, the host of its uri
+    uri = urllib.parse.urlparse(server.get_uri())
+    yield {
+        "host": urllib.parse.parse_qs(uri.query)["host"][0],
+        "user": "postgres",
+        "password": "postgres",
+        "port": "5432",
+    }
+    server.cleanup()
+
+
+@pytest.fixture
+def postgres_db(postgres_server, request):
+    """
+    Description: This fixture is responsible for creating an empty
+    database for a test, dropped afterwards.
+
+    Arguments:
+        postgres_server: the PostgreSQL server fixture.
+        request: the pytest request.
+
+    Returns:
+        function: Called with a database name suffix, returning the 'DB'
+        section values of the new database.
+    """
+    import psycopg2
+
+    created = []
+
+    def connect(dbname):
+        conn = psycopg2.connect(
+            host=postgres_server["host"],
+            port=postgres_server["port"],
+            user=postgres_server["user"],
+            password=postgres_server["password"],
+            dbname=dbname,
+        )
+        conn.autocommit = True
+        return conn
+
+    def make(suffix="db"):
+        dbname = ("test_%s_%s" % (request.node.name, suffix)).lower()[:63]
+        dbname = "".join(c if c.isalnum() else "_" for c in dbname)
+
+        conn = connect("postgres")
+        conn.cursor().execute("DROP DATABASE IF EXISTS %s" % dbname)
+        conn.cursor().execute("CREATE DATABASE %s" % dbname)
+        conn.close()
+        created.append(dbname)
+
+        # in the order of the 'DB' section
+        return {
+            "host": postgres_server["host"],
+            "dbname": dbname,
+            "user": postgres_server["user"],
+            "password": postgres_server["password"],
+            "port": postgres_server["port"],
+        }
+
+    yield make
+
+    conn = connect("postgres")
+    for dbname in created:
+        conn.cursor().execute("DROP DATABASE IF EXISTS %s WITH (FORCE)" % dbname)
+    conn.close()
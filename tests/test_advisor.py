@@ -0,0 +1,140 @@
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from advisor import advise, advised_ddl, table_name, workload_usage  # noqa: E402
+from loader import table_columns  # noqa: E402
+from sql_queries import (  # noqa: E402
+    analytical_queries,
+    artist_table_create,
+    song_table_create,
+    songplay_table_create,
+    time_table_create,
+    user_table_create,
+)
+
+
+def table_sample(create_query, rows, skews=None):
+    """
+    Description: This function is responsible for building the sample of
+    a table as returned by advisor.sample_table, without a database.
+
+    Arguments:
+        create_query (str, required): CREATE TABLE statement.
+        rows (int, required): Number of rows of the table.
+        skews (dict, optional): Skew of some columns, 1.0 for the others.
+
+    Returns:
+        dict: The table rows, column types and column statistics.
+    """
+    columns = [
+        (name, sql_type) for name, sql_type, _, _ in table_columns(create_query)
+    ]
+    return {
+        "rows": rows,
+        "types": dict(columns),
+        "columns": {
+            name: {
+                "distinct": rows,
+                "null_fraction": 0.0,
+                "skew": (skews or {}).get(name, 1.0),
+                "compression": 3.0,
+            }
+            for name, _ in columns
+        },
+    }
+
+
+def star_samples(song_id_skew=1.0):
+    rows = {
+        user_table_create: 100,
+        artist_table_create: 5000,
+        song_table_create: 5000000,
+        time_table_create: 2000000,
+        songplay_table_create: 30000000,
+    }
+    return {
+        table_name(query): table_sample(
+            query, count, {"song_id": song_id_skew} if "songplays" in query else None
+        )
+        for query, count in rows.items()
+    }
+
+
+def test_workload_usage_reads_joins_and_ranges_through_aliases():
+    queries = [
+        (
+            "plays",
+            """
+SELECT s.title, COUNT(*) FROM songplays AS sp
+JOIN songs s ON sp.song_id = s.song_id
+WHERE sp.start_time >= '2018-11-01'
+GROUP BY s.title
+""",
+        ),
+        (
+            "users",
+            "SELECT * FROM songplays JOIN users ON songplays.user_id = users.user_id",
+        ),
+    ]
+
+    usage = workload_usage(queries)
+
+    assert usage["joins"] == {
+        ("songplays", "song_id", "songs", "song_id"): 1,
+        ("songs", "song_id", "songplays", "song_id"): 1,
+        ("songplays", "user_id", "users", "user_id"): 1,
+        ("users", "user_id", "songplays", "user_id"): 1,
+    }
+    assert usage["ranges"] == {("songplays", "start_time"): 1}
+
+
+def test_advise_co_locates_the_fact_with_its_largest_dimension():
+    usage = workload_usage(analytical_queries)
+
+    designs = advise(star_samples(), usage, all_max_rows=1000000)
+
+    # songs is the largest dimension not copied to every node
+    assert designs["songplays"]["diststyle"] == "KEY"
+    assert designs["songplays"]["distkey"] == "song_id"
+    assert (designs["songs"]["diststyle"], designs["songs"]["distkey"]) == (
+        "KEY",
+        "song_id",
+    )
+    assert designs["users"]["diststyle"] == "ALL"
+    assert designs["artists"]["diststyle"] == "ALL"
+    assert designs["times"]["diststyle"] == "EVEN"
+    # range filters lead the sort key, then the join columns
+    assert designs["songplays"]["sortkey"] == ["start_time"]
+    assert designs["songs"]["sortkey"] == ["song_id"]
+    assert designs["songplays"]["encodings"]["start_time"] == "RAW"
+    assert designs["songplays"]["encodings"]["user_id"] == "AZ64"
+    assert designs["songplays"]["encodings"]["location"] == "ZSTD"
+
+
+def test_advise_skips_skewed_distribution_keys():
+    usage = workload_usage(analytical_queries)
+
+    designs = advise(star_samples(song_id_skew=3.0), usage, all_max_rows=1000000)
+
+    # the next largest dimension is taken instead of the skewed one
+    assert designs["songplays"]["distkey"] == "start_time"
+    assert designs["times"]["distkey"] == "start_time"
+    assert designs["songs"]["diststyle"] == "EVEN"
+    assert designs["songplays"]["reasons"][0].startswith("not KEY (song_id)")
+
+
+def test_advised_ddl_replaces_the_table_and_column_attributes():
+    design = advise(star_samples(), workload_usage(analytical_queries))["songplays"]
+
+    ddl = advised_ddl(songplay_table_create, design)
+
+    lines = ddl.strip("\n").split("\n")
+    assert lines[0] == "CREATE TABLE IF NOT EXISTS songplays ("
+    assert lines[1] == "    songplay_id INTEGER IDENTITY(0,1) ENCODE AZ64,"
+    # the former DISTKEY column attribute is dropped
+    assert lines[2] == (
+        "    start_time TIMESTAMP REFERENCES times (start_time) ENCODE RAW,"
+    )
+    assert lines[-2] == "    match_key VARCHAR(16) ENCODE ZSTD"
+    assert lines[-1] == ") DISTSTYLE KEY DISTKEY (song_id) SORTKEY (start_time)"
@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import benchmark  # noqa: E402
+
+
+def test_run_reports_each_insert(make_config, postgres_db, data_dir):
+    # the defaults commit and batch the inserts at once
+    config_path = make_config(
+        {
+            "DB": postgres_db(),
+            "ETL": {
+                "target": "postgres",
+                "loader": "stream",
+                "local_data": data_dir,
+                "commit_every": 0,
+                "batch_statements": "true",
+            },
+        }
+    )
+
+    report = benchmark.run(config_path)
+
+    # followed by the rollup refreshes
+    assert [step for step, _, _, _ in report][:5] == [
+        "INSERT INTO songs",
+        "INSERT INTO songplays",
+        "INSERT INTO users",
+        "INSERT INTO artists",
+        "INSERT INTO times",
+    ]
+    assert all(rows > 0 for _, rows, _, _ in report[:5])
+
+
+def test_measure_reader_reads_each_source_in_its_own_process(data_dir):
+    report = benchmark.measure_reader(data_dir, batch_rows=500)
+
+    assert [source for source, _, _, _, _ in report] == ["log_data", "song_data"]
+    assert all(rows > 0 and peak > 0 for _, _, rows, _, peak in report)
+
+
+def write_source(data_dir, folder, record, lines):
+    os.makedirs(os.path.join(data_dir, folder))
+    with open(os.path.join(data_dir, folder, "part.json"), "w") as json_file:
+        json_file.write((json.dumps(record) + "\n") * lines)
+
+
+def test_measure_reader_peak_memory_does_not_grow_with_the_input(tmp_path):
+    event = {
+        "artist": "Artist",
+        "page": "NextSong",
+        "song": "Song",
+        "ts": 1541105830796,
+        "userAgent": "Mozilla/5.0 " * 10,
+        "userId": "1",
+    }
+    peaks = []
+    for scale in [1, 10]:
+        data_dir = str(tmp_path / ("x%d" % scale))
+        write_source(data_dir, "log_data", event, 15000 * scale)
+        write_source(data_dir, "song_data", {"song_id": "SO1"}, 1)
+
+        (_, size, rows, _, peak), _ = benchmark.measure_reader(data_dir, 1000)
+        assert rows == 15000 * scale
+        peaks.append((size, peak))
+
+    # reading 10 times more MB (about 30 more) takes just a few more MB
+    (small_size, small_peak), (large_size, large_peak) = peaks
+    assert large_size > 9 * small_size
+    assert large_peak - small_peak < 10
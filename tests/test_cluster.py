@@ -0,0 +1,319 @@
+import copy
+import json
+import threading
+import types
+
+import pytest
+
+import cluster as cluster_module
+from cluster import MyCluster
+
+
+@pytest.fixture
+def cluster(aws, make_config):
+    """
+    Description: This fixture is responsible for creating a MyCluster
+    session against the mocked AWS services. moto is not thread safe, so
+    the requests of the s3 client are serialized, and the parameters set
+    in parameter groups are recorded, as moto does not set them.
+
+    Arguments:
+        aws: the aws fixture.
+        make_config: the make_config fixture.
+
+    Returns:
+        MyCluster: The session.
+    """
+    cl = MyCluster(make_config({"ETL": {"s3_workers": 4}}))
+
+    # moto does not implement modify_cluster_parameter_group
+    def modify_cluster_parameter_group(**params):
+        modify_cluster_parameter_group.calls.append(params)
+        return {"ParameterGroupName": params["ParameterGroupName"]}
+
+    modify_cluster_parameter_group.calls = []
+    cl.redshift_client.modify_cluster_parameter_group = modify_cluster_parameter_group
+
+    lock = threading.Lock()
+    make_api_call = cl.s3_client._make_api_call
+
+    def serialized(*args, **kwargs):
+        with lock:
+            return make_api_call(*args, **kwargs)
+
+    cl.s3_client._make_api_call = serialized
+    return cl
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """
+    Description: This fixture is responsible for replacing the clock and
+    the sleeps of cluster.py by a simulated clock, so waits take no time.
+
+    Arguments:
+        monkeypatch: the pytest monkeypatch fixture.
+
+    Returns:
+        dict: The simulated seconds and the slept delays.
+    """
+    clock = {"now": 0.0, "sleeps": []}
+
+    def sleep(seconds):
+        clock["sleeps"].append(seconds)
+        clock["now"] += seconds
+
+    monkeypatch.setattr(cluster_module, "monotonic", lambda: clock["now"])
+    monkeypatch.setattr(cluster_module, "sleep", sleep)
+    return clock
+
+
+def status_timeline(monkeypatch, cl, clock, timeline):
+    """
+    Description: This function is responsible for making the cluster go
+    through transition statuses in simulated time, as moto makes every
+    change at once. Its properties get the VpcId of the default VPC, which
+    moto leaves out.
+
+    Arguments:
+        monkeypatch: the pytest monkeypatch fixture.
+        cl (MyCluster, required): The session.
+        clock (dict, required): The clock fixture.
+        timeline (list, required): (simulated seconds, status) tuples, the
+        status reported until those seconds, in order. The moto status is
+        reported after the last one.
+
+    Returns:
+        None
+    """
+    get_cluster_status = cl.get_cluster_status
+
+    def status():
+        cluster_status, cluster_props = get_cluster_status()
+        if cluster_props is None:
+            return cluster_status, cluster_props
+
+        vpcs = cl.ec2_client.describe_vpcs(
+            Filters=[{"Name": "is-default", "Values": ["true"]}]
+        )
+        cluster_props["VpcId"] = vpcs["Vpcs"][0]["VpcId"]
+        for until, timeline_status in timeline:
+            if clock["now"] < until:
+                return timeline_status, cluster_props
+
+        return cluster_status, cluster_props
+
+    monkeypatch.setattr(cl, "get_cluster_status", status)
+
+
+def test_provision_is_ready_soon_after_the_cluster(monkeypatch, cluster, clock):
+    status_timeline(monkeypatch, cluster, clock, [(200, "creating")])
+
+    cluster_status, elapsed = cluster.provision(timeout=1800)
+
+    # noticed no later than a poll (max_delay) after it was available
+    assert cluster_status == "available"
+    assert 200 <= elapsed <= 230
+    assert max(clock["sleeps"]) <= 30
+
+    config = MyCluster(cluster.filepath).config
+    assert config["DB"]["HOST"].startswith("dwhcluster.")
+    assert config["IAM_ROLE"]["ARN"].endswith(":role/sparkifydwh_role")
+    assert config["S3"]["SONG_JSONPATH"].endswith("/song_json_path.json")
+
+    groups = cluster.ec2_client.describe_security_groups()["SecurityGroups"]
+    ports = [
+        rule.get("FromPort") for group in groups for rule in group["IpPermissions"]
+    ]
+    assert int(config["DB"]["PORT"]) in ports
+
+
+def test_redshift_cluster_wait_polls_early_with_backoff(monkeypatch, cluster, clock):
+    cluster.redshift_cluster_create()
+    status_timeline(monkeypatch, cluster, clock, [(5, "creating")])
+
+    cluster_status, _ = cluster.redshift_cluster_wait(delay=2.0, max_delay=30.0)
+
+    assert cluster_status == "available"
+    # the first polls are a few seconds apart, not max_delay
+    assert clock["sleeps"][0] <= 2.0
+    assert clock["now"] < 5 + 30
+
+
+def test_redshift_cluster_wait_times_out(monkeypatch, cluster, clock):
+    cluster.redshift_cluster_create()
+    status_timeline(monkeypatch, cluster, clock, [(float("inf"), "creating")])
+
+    with pytest.raises(TimeoutError):
+        cluster.redshift_cluster_wait(timeout=600)
+    assert clock["now"] == pytest.approx(600)
+
+
+def test_parameter_group_create_tolerates_an_existing_group(cluster):
+    first = cluster.parameter_group_create()
+    second = cluster.parameter_group_create()
+
+    groups = cluster.redshift_client.describe_cluster_parameter_groups(
+        ParameterGroupName="sparkify-wlm"
+    )["ParameterGroups"]
+    assert len(groups) == 1
+
+    calls = cluster.redshift_client.modify_cluster_parameter_group.calls
+    assert [call["Parameters"] for call in calls] == [first, second]
+    wlm = json.loads(first[0]["ParameterValue"])
+    assert wlm == cluster.wlm_configuration()
+
+
+def test_parameter_group_create_raises_other_failures(cluster):
+    redshift_client = cluster.redshift_client
+    error = redshift_client.exceptions.InvalidClusterParameterGroupStateFault
+
+    def modify_cluster_parameter_group(**params):
+        raise error(
+            {"Error": {"Code": "InvalidClusterParameterGroupState", "Message": ""}},
+            "ModifyClusterParameterGroup",
+        )
+
+    redshift_client.modify_cluster_parameter_group = modify_cluster_parameter_group
+    with pytest.raises(error):
+        cluster.parameter_group_create()
+
+
+def test_parameter_group_apply_attaches_the_group(cluster):
+    with pytest.raises(cluster.redshift_client.exceptions.ClusterNotFoundFault):
+        cluster.parameter_group_apply()
+
+    cluster.redshift_cluster_create()
+    cluster.parameter_group_apply()
+
+    _, cluster_props = cluster.get_cluster_status()
+    assert [
+        group["ParameterGroupName"] for group in cluster_props["ClusterParameterGroups"]
+    ] == ["sparkify-wlm"]
+
+
+def fail_with(client, operation, error_code):
+    """
+    Description: This function is responsible for making an operation of
+    a client fail with one of its modeled errors.
+
+    Arguments:
+        client: boto3 client.
+        operation (str, required): Method name (e.g. 'resize_cluster').
+        error_code (str, required): Error shape (e.g. 'UnsupportedOperationFault').
+
+    Returns:
+        list: The parameters of the failed calls.
+    """
+    calls = []
+    error = getattr(client.exceptions, error_code)
+
+    def failing(**params):
+        calls.append(params)
+        raise error({"Error": {"Code": error_code, "Message": ""}}, operation)
+
+    setattr(client, operation, failing)
+    return calls
+
+
+def test_resize_falls_back_to_classic_when_elastic_is_unsupported(
+    monkeypatch, cluster, clock
+):
+    cluster.redshift_cluster_create()
+    calls = fail_with(
+        cluster.redshift_client, "resize_cluster", "UnsupportedOperationFault"
+    )
+    # still reported available for a while after the request
+    status_timeline(
+        monkeypatch, cluster, clock, [(20, "available"), (300, "resizing")]
+    )
+
+    cluster_status, base_nodes = cluster.redshift_cluster_resize(8)
+
+    assert (cluster_status, base_nodes) == ("available", 4)
+    assert calls[0]["NumberOfNodes"] == 8
+    assert cluster.get_cluster_status()[1]["NumberOfNodes"] == 8
+    # not before the resize was done
+    assert clock["now"] >= 300
+
+
+def test_resize_raises_other_failures(cluster):
+    cluster.redshift_cluster_create()
+    fail_with(cluster.redshift_client, "resize_cluster", "InvalidClusterStateFault")
+
+    with pytest.raises(cluster.redshift_client.exceptions.InvalidClusterStateFault):
+        cluster.redshift_cluster_resize(8)
+    assert cluster.get_cluster_status()[1]["NumberOfNodes"] == 4
+
+
+def versioned_bucket(monkeypatch, s3_client, bucket, keys, versions, markers):
+    """
+    Description: This function is responsible for filling a versioned
+    bucket with versions and delete markers, through the moto backend as
+    the api would take minutes for hundreds of thousands of objects.
+
+    Arguments:
+        monkeypatch: the pytest monkeypatch fixture.
+        s3_client: boto3 s3 client.
+        bucket (str, required): Bucket name.
+        keys (int, required): Number of keys.
+        versions (int, required): Versions of each key.
+        markers (int, required): Keys deleted (with a delete marker).
+
+    Returns:
+        int: Number of versions and delete markers.
+    """
+    import moto.s3.models
+    from moto.core import DEFAULT_ACCOUNT_ID
+
+    s3_client.create_bucket(
+        Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": "us-west-2"}
+    )
+    s3_client.put_bucket_versioning(
+        Bucket=bucket, VersioningConfiguration={"Status": "Enabled"}
+    )
+
+    backend = moto.s3.models.s3_backends[DEFAULT_ACCOUNT_ID]["aws"]
+    for version in range(versions):
+        for key in range(keys):
+            backend.put_object(bucket, "log_data/%06d.json" % key, b"{}")
+    for key in range(markers):
+        backend.delete_object(bucket, "log_data/%06d.json" % key)
+
+    # moto deep copies the whole bucket on each listed page, which is just
+    # read here, so the listing stays linear on the number of pages
+    monkeypatch.setattr(
+        moto.s3.models,
+        "copy",
+        types.SimpleNamespace(copy=copy.copy, deepcopy=lambda value: list(value)),
+    )
+
+    return keys * versions + markers
+
+
+def test_bucket_delete_removes_versions_and_markers(monkeypatch, cluster):
+    s3_client = cluster.s3_client
+    objects = versioned_bucket(
+        monkeypatch, s3_client, "sparkify-delete", 50000, 2, 1000
+    )
+    assert objects > 100000
+
+    assert cluster.bucket_delete("sparkify-delete") == "sparkify-delete"
+
+    buckets = s3_client.list_buckets()["Buckets"]
+    assert "sparkify-delete" not in [bucket["Name"] for bucket in buckets]
+
+
+def test_bucket_objects_delete_counts_every_version(monkeypatch, cluster):
+    s3_client = cluster.s3_client
+    objects = versioned_bucket(monkeypatch, s3_client, "sparkify-count", 1500, 2, 300)
+
+    deleted = 0
+    while True:
+        batch_deleted = cluster.bucket_objects_delete("sparkify-count", workers=4)
+        if not batch_deleted:
+            break
+        deleted += batch_deleted
+
+    assert deleted == objects
+    assert "Versions" not in s3_client.list_object_versions(Bucket="sparkify-count")
@@ -0,0 +1,284 @@
+import hashlib
+import json
+import logging
+from datetime import date
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import create_tables  # noqa: E402
+import dialect  # noqa: E402
+import etl  # noqa: E402
+from ledger import RunLedger  # noqa: E402
+from manifest import (  # noqa: E402
+    load_watermark,
+    new_objects,
+    prepare_incremental_load,
+    save_watermark,
+)
+
+
+class FakeCluster:
+    """
+    Description: This class is responsible for standing in for MyCluster
+    in main_resized, recording the calls and failing the scale back.
+    """
+
+    calls = []
+
+    def __init__(self, config_path):
+        self.s3_client = None
+
+    def redshift_cluster_wait(self):
+        return "available", {}
+
+    def redshift_cluster_resize(self, num_nodes):
+        FakeCluster.calls.append(("resize", num_nodes))
+        if num_nodes == 4:
+            raise RuntimeError("scale back failed")
+        return "available", 4
+
+    def redshift_cluster_pause(self):
+        FakeCluster.calls.append(("pause",))
+
+
+def test_main_resized_pauses_when_the_scale_back_fails(monkeypatch, make_config):
+    FakeCluster.calls = []
+    monkeypatch.setattr(etl, "MyCluster", FakeCluster)
+    monkeypatch.setattr(etl, "storage_from_config", lambda s3_client, config: None)
+    monkeypatch.setattr(etl, "estimate_input_bytes", lambda *args: 20 * 2**30)
+
+    def main(**kwargs):
+        raise ValueError("load failed")
+
+    monkeypatch.setattr(etl, "main", main)
+
+    with pytest.raises(RuntimeError):
+        etl.main_resized(config_path=make_config(), pause=True)
+
+    assert FakeCluster.calls == [("resize", 8), ("resize", 4), ("pause",)]
+
+
+def test_main_rejects_incremental_windowed_runs(make_config):
+    with pytest.raises(ValueError):
+        etl.main(
+            incremental=True,
+            window=(date(2018, 11, 1), date(2018, 11, 2)),
+            config_path=make_config(),
+        )
+
+
+@pytest.mark.parametrize("loader", ["stream", "prestage"])
+def test_main_rejects_incremental_runs_of_other_loaders(make_config, loader):
+    with pytest.raises(ValueError):
+        etl.main(incremental=True, config_path=make_config({"ETL": {"loader": loader}}))
+
+
+def listed(key, etag="e1", last_modified="2018-11-01T00:00:00"):
+    return {"key": key, "etag": etag, "last_modified": last_modified, "size": 10}
+
+
+def test_new_objects_diff_by_key_etag_and_last_modified():
+    ingested = {
+        "a.json": {"etag": "e1", "last_modified": "2018-11-01T00:00:00"},
+        "b.json": {"etag": "e1", "last_modified": "2018-11-01T00:00:00"},
+        "c.json": {"etag": "e1", "last_modified": "2018-11-01T00:00:00"},
+    }
+    objects = [
+        listed("a.json"),
+        listed("b.json", etag="e2"),
+        listed("c.json", last_modified="2018-11-02T00:00:00"),
+        listed("d.json"),
+    ]
+
+    assert [obj["key"] for obj in new_objects(objects, ingested)] == [
+        "b.json",
+        "c.json",
+        "d.json",
+    ]
+    assert new_objects(objects, {}) == objects
+
+
+def test_watermark_round_trip(tmp_path):
+    path = str(tmp_path / "watermark.json")
+    assert load_watermark(path) == {}
+
+    watermark = {"s3://sparkify/log_data": {"a.json": {"etag": "e1"}}}
+    save_watermark(path, watermark)
+
+    assert load_watermark(path) == watermark
+    assert not (tmp_path / "watermark.json.tmp").exists()
+
+
+def test_incremental_manifests_list_just_the_new_objects(aws):
+    import boto3
+
+    from storage import S3Storage
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket="sparkify",
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    for key in ["log_data/a.json", "log_data/b.json"]:
+        s3_client.put_object(Bucket="sparkify", Key=key, Body=b'{"ts": 1}\n')
+
+    storage = S3Storage(s3_client, workers=1)
+    sources = [("COPY staging_events FROM '{}'", "s3://sparkify/log_data")]
+
+    def manifest_entries(query):
+        key = query.split("'")[1].replace("s3://sparkify/", "")
+        body = s3_client.get_object(Bucket="sparkify", Key=key)["Body"].read()
+        return sorted(
+            (entry["url"], entry["mandatory"], entry["meta"]["content_length"])
+            for entry in json.loads(body)["entries"]
+        )
+
+    queries, watermark, loading = prepare_incremental_load(
+        storage, sources, {}, "s3://sparkify/manifests"
+    )
+    assert manifest_entries(queries[0]) == [
+        ("s3://sparkify/log_data/a.json", True, 10),
+        ("s3://sparkify/log_data/b.json", True, 10),
+    ]
+    assert sorted(watermark["s3://sparkify/log_data"]) == [
+        "log_data/a.json",
+        "log_data/b.json",
+    ]
+
+    assert [obj["key"] for obj in loading["s3://sparkify/log_data"]] == [
+        "log_data/a.json",
+        "log_data/b.json",
+    ]
+
+    # nothing new, nothing to be copied
+    assert prepare_incremental_load(
+        storage, sources, watermark, "s3://sparkify/manifests"
+    ) == ([], watermark, {"s3://sparkify/log_data": []})
+
+    s3_client.put_object(Bucket="sparkify", Key="log_data/b.json", Body=b"{}\n")
+    s3_client.put_object(Bucket="sparkify", Key="log_data/c.json", Body=b"{}\n")
+    queries, _, _ = prepare_incremental_load(
+        storage, sources, watermark, "s3://sparkify/manifests"
+    )
+    assert manifest_entries(queries[0]) == [
+        ("s3://sparkify/log_data/b.json", True, 3),
+        ("s3://sparkify/log_data/c.json", True, 3),
+    ]
+
+
+def match_key(title, duration, artist):
+    key = "%s|%.3f|%s" % (title.strip().lower(), duration, artist.strip().lower())
+    return hashlib.md5(key.encode()).hexdigest()[:16]
+
+
+def test_match_keys_normalize_the_played_songs(postgres_db, caplog):
+    conn = psycopg2.connect(**postgres_db())
+    cur = dialect.cursor(conn, "postgres")
+    etl.create_staging_tables(cur, conn)
+
+    # the first two songs share a key, the one of the lowest song_id is kept
+    cur.execute(
+        "INSERT INTO staging_songs (song_id, artist_id, title, artist_name, duration) "
+        "VALUES (%s, %s, %s, %s, %s), (%s, %s, %s, %s, %s), (%s, %s, %s, %s, %s)",
+        (
+            *("SO2", "AR2", "Yellow", "Coldplay", 266.9999),
+            *("SO1", "AR1", "yellow ", "COLDPLAY", 267.0004),
+            *("SO3", "AR3", "Other", "Someone", 100.0),
+        ),
+    )
+    cur.execute(
+        "INSERT INTO staging_events (page, song, artist, length, ts) VALUES "
+        "('NextSong', '  YELLOW', 'coldplay', 267.0, 1), "
+        "('NextSong', 'Other', 'Someone', 100.0004, 2), "
+        "('NextSong', 'Unknown', 'Someone', 100.0, 3), "
+        "('NextSong', NULL, NULL, NULL, 4), "
+        "('Home', NULL, NULL, NULL, 5)"
+    )
+    conn.commit()
+
+    etl.create_match_keys(cur, conn)
+
+    cur.execute("SELECT match_key, song_id FROM staging_songs_keyed ORDER BY song_id")
+    assert cur.fetchall() == [
+        (match_key("Yellow", 267.0, "Coldplay"), "SO1"),
+        (match_key("Other", 100.0, "Someone"), "SO3"),
+    ]
+    cur.execute("SELECT match_key FROM staging_events_keyed ORDER BY ts")
+    assert [row[0] for row in cur.fetchall()] == [
+        match_key("Yellow", 267.0, "Coldplay"),
+        match_key("Other", 100.0, "Someone"),
+        match_key("Unknown", 100.0, "Someone"),
+        None,
+        None,
+    ]
+
+    # plays without a song have no key, other pages are not plays
+    with caplog.at_level(logging.INFO):
+        assert etl.report_match_rate(cur) == (4, 3, 2)
+    assert "2 of 4 played songs matched (50.0%), 1 without a key." in caplog.text
+    assert "2 songplays loaded without song_id and artist_id." in caplog.text
+    conn.close()
+
+
+def star_rows(db):
+    conn = psycopg2.connect(**db)
+    cur = conn.cursor()
+    rows = {}
+    for table in ["songplays", "songs", "artists", "users", "times"]:
+        # songplay_id is an identity, the other columns are compared
+        columns = "*" if table != "songplays" else "start_time, user_id, song_id"
+        cur.execute("SELECT %s FROM %s" % (columns, table))
+        rows[table] = sorted(cur.fetchall(), key=repr)
+    conn.close()
+    return rows
+
+
+def test_resume_runs_a_failed_run_from_its_failing_step(
+    monkeypatch, make_config, postgres_db, data_dir, tmp_path
+):
+    once, resumed = postgres_db("once"), postgres_db("resumed")
+    ledger_path = str(tmp_path / "ledger.db")
+    config_paths = {}
+    for name, db in [("once", once), ("resumed", resumed)]:
+        config_paths[name] = make_config(
+            {
+                "DB": db,
+                "ETL": {
+                    "target": "postgres",
+                    "loader": "stream",
+                    "local_data": data_dir,
+                    "ledger": ledger_path,
+                },
+            },
+            name="%s.cfg" % name,
+        )
+        create_tables.main(config_path=config_paths[name])
+    etl.main(config_path=config_paths["once"])
+
+    # the users insert fails, after the staging tables, songs and songplays
+    queries = list(etl.insert_strategies["merge"])
+    queries[2] = "SELECT 1 / 0"
+    monkeypatch.setitem(etl.insert_strategies, "merge", queries)
+    with pytest.raises(psycopg2.errors.DivisionByZero):
+        etl.main(config_path=config_paths["resumed"], checkpoint=True)
+
+    ledger = RunLedger(ledger_path, "etl")
+    run_id = ledger.resume()
+    assert run_id is not None
+    assert {"stream staging tables", "songs", "songplays"} <= ledger.done_steps()
+    assert "users" not in ledger.done_steps()
+
+    # the resumed run neither streams the staging tables nor inserts them again
+    monkeypatch.undo()
+    streamed = []
+    monkeypatch.setattr(
+        etl, "stream_staging_tables", lambda *args: streamed.append(args)
+    )
+    etl.main(config_path=config_paths["resumed"], resume=True)
+
+    assert streamed == []
+    assert star_rows(resumed) == star_rows(once)
+    with pytest.raises(ValueError):
+        etl.main(config_path=config_paths["resumed"], resume=True)
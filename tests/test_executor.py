@@ -0,0 +1,241 @@
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+import etl  # noqa: E402
+import executor  # noqa: E402
+from executor import (  # noqa: E402
+    Step,
+    critical_path,
+    declared_steps,
+    run_dag,
+    timeline,
+)
+from sql_queries import copy_table_queries, insert_strategies  # noqa: E402
+
+
+class FakePool:
+    """
+    Description: This class is responsible for standing in for the
+    connection pool, running each statement with a function instead of a
+    database and recording the statements executed at the same time.
+    """
+
+    def __init__(self, run=None):
+        self.run = run or (lambda query: time.sleep(0.05))
+        self.executed = []
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def getconn(self):
+        return FakeConnection(self)
+
+    def putconn(self, conn):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, vars=None):
+        pool = self.pool
+        with pool._lock:
+            pool.executed.append(query)
+            pool.running += 1
+            pool.max_running = max(pool.max_running, pool.running)
+        try:
+            pool.run(query)
+        finally:
+            with pool._lock:
+                pool.running -= 1
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """
+    Description: This fixture is responsible for recording the retry
+    delays of the steps instead of waiting them.
+
+    Arguments:
+        monkeypatch: the pytest monkeypatch fixture.
+
+    Returns:
+        list: The delays.
+    """
+    delays = []
+    sleep = time.sleep
+
+    def record(seconds):
+        if seconds >= 1.0:
+            delays.append(seconds)
+        else:
+            sleep(seconds)
+
+    monkeypatch.setattr(executor.time, "sleep", record)
+    return delays
+
+
+def test_run_dag_starts_steps_once_their_dependencies_are_done():
+    steps = [
+        Step("a", "a", []),
+        Step("b", "b", []),
+        Step("c", "c", ["a", "b"]),
+        Step("d", "d", ["c", "not scheduled"]),
+    ]
+    pool = FakePool()
+
+    report = run_dag(pool, steps, max_workers=2)
+
+    timings = report["timings"]
+    for step in steps:
+        for dep in step.depends_on:
+            if dep in timings:
+                assert timings[dep][1] <= timings[step.name][0], step.name
+    # the independent steps ran at the same time
+    assert pool.max_running == 2
+    assert report["critical_path"][0][1:] == ["c", "d"]
+    assert report["failed"] == {} and report["skipped"] == []
+
+
+def test_run_dag_retries_failed_steps_with_backoff(sleeps):
+    failures = {"b": 2}
+
+    def run(query):
+        if failures.get(query):
+            failures[query] -= 1
+            raise RuntimeError("transient")
+
+    pool = FakePool(run)
+    steps = [Step("a", "a", []), Step("b", "b", ["a"]), Step("c", "c", ["b"])]
+
+    report = run_dag(pool, steps, max_workers=2, retries=2)
+
+    assert pool.executed == ["a", "b", "b", "b", "c"]
+    assert sleeps == [2.0, 4.0]
+    assert sorted(report["timings"]) == ["a", "b", "c"]
+
+
+def test_run_dag_raises_when_retries_are_exhausted(sleeps):
+    def run(query):
+        if query == "b":
+            raise RuntimeError("permanent")
+
+    pool = FakePool(run)
+    steps = [Step("a", "a", []), Step("b", "b", ["a"]), Step("c", "c", ["b"])]
+
+    with pytest.raises(RuntimeError):
+        run_dag(pool, steps, max_workers=2, retries=1)
+    assert "c" not in pool.executed
+
+
+def test_run_dag_keeps_going_without_the_dependent_steps(sleeps):
+    def run(query):
+        if query == "b":
+            raise RuntimeError("permanent")
+
+    pool = FakePool(run)
+    steps = [
+        Step("a", "a", []),
+        Step("b", "b", []),
+        Step("c", "c", ["b"]),
+        Step("d", "d", ["c"]),
+        Step("e", "e", ["a"]),
+    ]
+
+    report = run_dag(pool, steps, max_workers=2, keep_going=True)
+
+    assert sorted(report["timings"]) == ["a", "e"]
+    assert report["failed"] == {"b": "permanent"}
+    assert report["skipped"] == ["c", "d"]
+
+
+def test_run_dag_rejects_cyclic_dependencies():
+    steps = [Step("a", "a", ["b"]), Step("b", "b", ["a"])]
+
+    with pytest.raises(ValueError):
+        run_dag(FakePool(), steps, max_workers=2)
+
+
+def test_critical_path_is_the_longest_dependent_chain():
+    steps = [
+        Step("a", "", []),
+        Step("b", "", []),
+        Step("c", "", ["a", "b"]),
+        Step("d", "", ["a"]),
+    ]
+    timings = {"a": (0.0, 1.0), "b": (0.0, 3.0), "c": (3.0, 4.0), "d": (1.0, 3.5)}
+
+    path, duration = critical_path(steps, timings)
+
+    # b -> c takes 4 seconds, a -> d 3.5
+    assert path == ["b", "c"]
+    assert duration == pytest.approx(4.0)
+    assert critical_path([], {}) == ([], 0.0)
+
+
+def test_declared_steps_depend_on_the_writers_of_their_reads():
+    named_queries = [("load", "l"), ("fold", "f"), ("report", "r"), ("extra", "e")]
+    tables = {
+        "load": ([], ["staged"]),
+        # reading and writing the same table does not depend on itself
+        "fold": (["staged", "folded", "streamed"], ["folded"]),
+        "report": (["folded", "staged"], []),
+        "extra": (["folded"], ["folded"]),
+    }
+
+    steps = declared_steps(named_queries, tables)
+
+    # tables no step writes (streamed) are loaded already
+    assert [(step.name, step.query, step.depends_on) for step in steps] == [
+        ("load", "l", []),
+        ("fold", "f", ["extra", "load"]),
+        ("report", "r", ["extra", "fold", "load"]),
+        ("extra", "e", ["fold"]),
+    ]
+
+
+def test_parallel_steps_wait_just_for_the_tables_they_read():
+    steps = etl.parallel_steps(copy_table_queries, insert_strategies["merge"])
+
+    assert {step.name: step.depends_on for step in steps} == {
+        "COPY staging_events": [],
+        "COPY staging_songs": [],
+        "staging_events_keyed": ["COPY staging_events"],
+        "staging_songs_keyed": ["COPY staging_songs"],
+        "songs": ["COPY staging_songs"],
+        "songplays": ["staging_events_keyed", "staging_songs_keyed"],
+        "users": ["COPY staging_events"],
+        "artists": ["COPY staging_songs"],
+        "times": ["songplays"],
+    }
+
+    # streamed staging tables are loaded before the DAG runs
+    streamed = etl.parallel_steps([], insert_strategies["merge"])
+    assert {step.name: step.depends_on for step in streamed}["songs"] == []
+
+
+def test_timeline_draws_the_steps_in_start_order():
+    timings = {"late": (2.0, 4.0), "first": (0.0, 2.0), "quick": (0.0, 0.0)}
+
+    chart = timeline(timings, path=["first", "late"], width=8)
+
+    assert chart.split("\n") == [
+        "  quick |#       |    0.00s -    0.00s",
+        "* first |####    |    0.00s -    2.00s",
+        "* late  |    ####|    2.00s -    4.00s",
+    ]
+    assert timeline({}) == ""
@@ -0,0 +1,68 @@
+import io
+
+import pytest
+
+from loader import copy_lines, copy_records, parse_records
+
+
+def test_parse_records_streams_lines_and_rejects_invalid_ones():
+    long_value = "x" * (3 << 20)
+    objects = [
+        ("a.json", io.BytesIO(b'{"ts": 1}\n\n  \n{"ts": 2}\r\nnot json\n[1, 2]\n')),
+        # longer than the reused buffer, with no trailing line break
+        ("b.json", io.BytesIO(b'{"ts": 3}\n{"song": "%s"}' % long_value.encode())),
+    ]
+    rejected = {}
+
+    records = list(parse_records(objects, rejected))
+
+    assert records == [{"ts": 1}, {"ts": 2}, {"ts": 3}, {"song": long_value}]
+    assert rejected == {"a.json": 2}
+
+
+def test_copy_lines_escapes_the_text_format():
+    records = [
+        {"song": "tab\there", "artist": "line\nbreak\r", "title": "back\\slash"},
+        {"song": "plain", "artist": "\\N", "title": ""},
+    ]
+
+    lines = list(copy_lines(records, ["song", "artist", "title"], set()))
+
+    assert lines == [
+        "tab\\there\tline\\nbreak\\r\tback\\\\slash\n",
+        # a text '\N' is not NULL, an empty text is not NULL either
+        "plain\t\\\\N\t\n",
+    ]
+
+
+def test_copy_lines_maps_nulls_and_other_values():
+    records = [
+        {"ts": None, "length": "", "song": None, "level": True},
+        {"ts": 1541105830796, "length": 12.5, "level": False},
+    ]
+    fields = ["ts", "length", "song", "level"]
+
+    lines = list(copy_lines(records, fields, {"ts", "length"}))
+
+    # missing fields and NULL values are '\N', as empty numeric strings
+    assert lines == [
+        "\\N\t\\N\t\\N\ttrue\n",
+        "1541105830796\t12.5\t\\N\tfalse\n",
+    ]
+
+
+def test_copy_records_round_trips_escaped_values(postgres_db):
+    psycopg2 = pytest.importorskip("psycopg2")
+
+    conn = psycopg2.connect(**postgres_db())
+    cur = conn.cursor()
+    cur.execute("CREATE TABLE copied (song VARCHAR, length NUMERIC)")
+    values = ["tab\there", "line\nbreak", "cr\rhere", "back\\slash", "\\N", "", None]
+    records = [{"song": value, "length": ""} for value in values]
+
+    rows = copy_records(cur, "copied", ["song", "length"], {"length"}, records, 3)
+    cur.execute("SELECT song, length FROM copied")
+
+    assert rows == len(values)
+    assert cur.fetchall() == [(value, None) for value in values]
+    conn.close()
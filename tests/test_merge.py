@@ -0,0 +1,231 @@
+import json
+import os
+import shutil
+
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import create_tables  # noqa: E402
+import etl  # noqa: E402
+
+# songplay_id is an identity, so songplays are compared by their values
+songplay_columns = (
+    "start_time, user_id, level, song_id, artist_id, session_id, location, "
+    "user_agent, match_key"
+)
+
+
+def load(make_config, db, strategy, data_dir, runs=1, **options):
+    """
+    Description: This function is responsible for creating the tables of
+    a database and running the serial ETL over the local dataset.
+
+    Arguments:
+        make_config: the make_config fixture.
+        db (dict, required): The 'DB' section values.
+        strategy (str, required): Insert strategy ('merge' or 'except').
+        data_dir (str, required): Local dataset directory.
+        runs (int, optional): Number of ETL runs.
+        options: Other 'ETL' section values.
+
+    Returns:
+        str: The configuration file path.
+    """
+    config_path = make_config(
+        {
+            "DB": db,
+            "ETL": {
+                "target": "postgres",
+                "loader": "stream",
+                "local_data": data_dir,
+                "strategy": strategy,
+                **options,
+            },
+        },
+        name="%s.cfg" % strategy,
+    )
+    create_tables.main(config_path=config_path)
+    for _ in range(runs):
+        etl.main(config_path=config_path)
+
+    return config_path
+
+
+# rollup rows and the same counts computed from songplays
+rollup_queries = {
+    "rollup_hourly_plays": (
+        "SELECT start_hour, level, plays FROM rollup_hourly_plays",
+        "SELECT DATE_TRUNC('hour', start_time), level, COUNT(*) FROM songplays "
+        "GROUP BY 1, 2",
+    ),
+    "rollup_daily_song_plays": (
+        "SELECT start_day, song_id, plays FROM rollup_daily_song_plays",
+        "SELECT DATE_TRUNC('day', start_time), song_id, COUNT(*) FROM songplays "
+        "WHERE song_id IS NOT NULL GROUP BY 1, 2",
+    ),
+}
+
+
+def hold_back(data_dir, held_dir, paths):
+    """
+    Description: This function is responsible for moving some files of
+    the local dataset out of it, so a later run finds them as new files.
+
+    Arguments:
+        data_dir (str, required): Local dataset directory.
+        held_dir (str, required): Directory the files are moved to.
+        paths (list, required): File paths, relative to data_dir.
+
+    Returns:
+        function: Called to move the files back to the dataset.
+    """
+    for path in paths:
+        os.makedirs(os.path.dirname(os.path.join(held_dir, path)), exist_ok=True)
+        shutil.move(os.path.join(data_dir, path), os.path.join(held_dir, path))
+
+    def restore():
+        for path in paths:
+            shutil.move(os.path.join(held_dir, path), os.path.join(data_dir, path))
+
+    return restore
+
+
+def dataset_files(data_dir, folder):
+    return sorted(
+        os.path.relpath(os.path.join(root, name), data_dir)
+        for root, _, names in os.walk(os.path.join(data_dir, folder))
+        for name in names
+    )
+
+
+def table_rows(db, query):
+    conn = psycopg2.connect(**db)
+    cur = conn.cursor()
+    cur.execute(query)
+    rows = sorted(cur.fetchall(), key=repr)
+    conn.close()
+    return rows
+
+
+def test_merge_matches_except_on_a_load(make_config, postgres_db, data_dir):
+    merge_db, except_db = postgres_db("merge"), postgres_db("except")
+    load(make_config, merge_db, "merge", data_dir)
+    load(make_config, except_db, "except", data_dir)
+
+    for query in [
+        "SELECT %s FROM songplays" % songplay_columns,
+        "SELECT * FROM songs",
+        "SELECT * FROM artists",
+        "SELECT * FROM times",
+    ]:
+        merged = table_rows(merge_db, query)
+        assert merged, query
+        assert merged == table_rows(except_db, query), query
+
+    # EXCEPT keeps a row for each level of a user, merge just the last one
+    merged_users = table_rows(merge_db, "SELECT * FROM users")
+    except_users = table_rows(except_db, "SELECT * FROM users")
+    user_ids = [row[0] for row in merged_users]
+    assert len(user_ids) == len(set(user_ids))
+    assert set(user_ids) == {row[0] for row in except_users}
+    assert set(merged_users) <= set(except_users)
+
+
+def test_merge_reload_is_idempotent(make_config, postgres_db, data_dir):
+    once, twice = postgres_db("once"), postgres_db("twice")
+    load(make_config, once, "merge", data_dir)
+    load(make_config, twice, "merge", data_dir, runs=2)
+
+    for table in ["songplays", "songs", "artists", "users", "times"]:
+        columns = songplay_columns if table == "songplays" else "*"
+        query = "SELECT %s FROM %s" % (columns, table)
+        assert table_rows(once, query) == table_rows(twice, query), table
+
+
+def test_merge_keeps_the_last_level(make_config, postgres_db, data_dir):
+    db = postgres_db()
+    config_path = load(make_config, db, "merge", data_dir)
+
+    user_id, level = table_rows(db, "SELECT user_id, level FROM users LIMIT 1")[0]
+    new_level = "free" if level == "paid" else "paid"
+
+    # a later event of the user, with the other level
+    with open(os.path.join(data_dir, "log_data", "upgrade.json"), "w") as log_file:
+        event = {
+            "artist": None,
+            "auth": "Logged In",
+            "firstName": "Late",
+            "gender": "F",
+            "itemInSession": 0,
+            "lastName": "Upgrade",
+            "length": None,
+            "level": new_level,
+            "location": "Nowhere",
+            "method": "PUT",
+            "page": "Upgrade",
+            "registration": 1540000000000,
+            "sessionId": 1,
+            "song": None,
+            "status": 200,
+            "ts": 1600000000000,
+            "userAgent": "test",
+            "userId": str(user_id),
+        }
+        log_file.write(json.dumps(event) + "\n")
+    etl.main(config_path=config_path)
+
+    assert table_rows(
+        db, "SELECT level FROM users WHERE user_id = %d" % user_id
+    ) == [(new_level,)]
+
+
+def test_rollups_fold_the_songplays_of_each_run(
+    make_config, postgres_db, data_dir, tmp_path
+):
+    db = postgres_db()
+    last_day = dataset_files(data_dir, "log_data")[-1:]
+    restore = hold_back(data_dir, str(tmp_path / "held"), last_day)
+    config_path = load(make_config, db, "merge", data_dir)
+
+    first_rows = {}
+    for table, (rollup, counted) in rollup_queries.items():
+        first_rows[table] = table_rows(db, rollup)
+        assert first_rows[table], table
+        assert first_rows[table] == table_rows(db, counted), table
+
+    # the next run folds just its songplays into the rolled up rows
+    restore()
+    etl.main(config_path=config_path)
+    for table, (rollup, counted) in rollup_queries.items():
+        rows = table_rows(db, rollup)
+        assert len(rows) > len(first_rows[table]), table
+        assert rows == table_rows(db, counted), table
+
+    assert table_rows(db, "SELECT COUNT(*) FROM songplays_delta") == [(0,)]
+
+
+def test_backfill_resolves_songs_loaded_later(
+    make_config, postgres_db, data_dir, tmp_path
+):
+    once, late = postgres_db("once"), postgres_db("late")
+    load(make_config, once, "merge", data_dir)
+
+    # half of the songs arrive in the run after their plays
+    song_files = dataset_files(data_dir, "song_data")
+    restore = hold_back(data_dir, str(tmp_path / "held"), song_files[::2])
+    config_path = load(make_config, late, "merge", data_dir)
+    unmatched = "SELECT COUNT(*) FROM songplays WHERE song_id IS NULL"
+    assert table_rows(late, unmatched) > table_rows(once, unmatched)
+
+    # resolved by the next run, which a further run does not change
+    restore()
+    for _ in range(2):
+        etl.main(config_path=config_path)
+
+        for table in ["songplays", "songs", "rollup_daily_song_plays"]:
+            columns = songplay_columns if table == "songplays" else "*"
+            query = "SELECT %s FROM %s" % (columns, table)
+            assert table_rows(once, query) == table_rows(late, query), table
+        for table, (rollup, counted) in rollup_queries.items():
+            assert table_rows(late, rollup) == table_rows(late, counted), table
@@ -0,0 +1,125 @@
+import configparser
+import gzip
+import os
+
+from loader import table_columns
+from prestage import prestage_delete, prestage_tables, pyarrow, write_parts
+from splitter import Splitter
+from sql_queries import staging_songs_fields, staging_songs_table_create
+from synthetic import write_dataset
+
+
+def upload_dataset(s3_client, bucket, data_dir):
+    """
+    Description: This function is responsible for uploading a local
+    dataset to a new bucket, keeping its folders as key prefixes.
+
+    Arguments:
+        s3_client: boto3 s3 client.
+        bucket (str, required): Bucket name.
+        data_dir (str, required): Local dataset directory.
+
+    Returns:
+        None
+    """
+    s3_client.create_bucket(
+        Bucket=bucket, CreateBucketConfiguration={"LocationConstraint": "us-west-2"}
+    )
+    for root, _, files in os.walk(data_dir):
+        for filename in files:
+            path = os.path.join(root, filename)
+            key = os.path.relpath(path, data_dir).replace(os.sep, "/")
+            s3_client.upload_file(path, bucket, key)
+
+
+def keys(s3_client, bucket, prefix=""):
+    pages = s3_client.get_paginator("list_objects_v2").paginate(
+        Bucket=bucket, Prefix=prefix
+    )
+    return [obj["Key"] for page in pages for obj in page.get("Contents", [])]
+
+
+def test_prestaged_files_are_deleted_once_loaded(aws, make_config, tmp_path):
+    import boto3
+
+    from storage import S3Storage
+
+    data_dir = str(tmp_path / "data")
+    write_dataset(data_dir, num_events=200, days=1, seed=3)
+
+    s3_client = boto3.client("s3")
+    upload_dataset(s3_client, "sparkify-data", data_dir)
+    s3_client.put_object(
+        Bucket="sparkify-data", Key="staging/other/keep.gz", Body=b"x"
+    )
+
+    config = configparser.ConfigParser()
+    config.read(
+        make_config(
+            {
+                "S3": {
+                    "log_data": "s3://sparkify-data/log_data",
+                    "song_data": "s3://sparkify-data/song_data",
+                    "staging_prefix": "s3://sparkify-data/staging",
+                }
+            }
+        )
+    )
+    storage = S3Storage(s3_client, workers=1)
+
+    queries, run_uri = prestage_tables(config, storage, slices=2)
+
+    assert run_uri.startswith("s3://sparkify-data/staging/")
+    assert all(run_uri in query for query in queries)
+    run_prefix = run_uri.replace("s3://sparkify-data/", "")
+    staged = keys(s3_client, "sparkify-data", run_prefix)
+    assert len(staged) >= 4
+
+    assert prestage_delete(storage, run_uri) == len(staged)
+    assert keys(s3_client, "sparkify-data", run_prefix) == []
+    # files of other runs are kept
+    assert keys(s3_client, "sparkify-data", "staging/") == ["staging/other/keep.gz"]
+    assert keys(s3_client, "sparkify-data", "log_data/")
+
+
+def test_write_parts_skips_values_out_of_the_column_types(tmp_path):
+    song = {
+        "artist_id": "AR1",
+        "artist_latitude": "45.5",
+        "artist_longitude": -120.25,
+        "duration": 200.5,
+        "num_songs": 1,
+        "song_id": "SO1",
+        "title": "Song",
+        "year": "2000",
+    }
+    records = [
+        song,
+        # NUMERIC(8,6) and NUMERIC(9,6) hold less than 100 and 1000
+        {**song, "artist_latitude": 123.4},
+        {**song, "artist_longitude": "-1000"},
+        {**song, "artist_latitude": "NaN"},
+        # SMALLINT, with no decimals
+        {**song, "year": 1999.5},
+        {**song, "num_songs": 40000},
+        # out of the precision once rounded to the scale
+        {**song, "artist_latitude": "-99.9999996"},
+        {**song, "year": "2001.0", "artist_latitude": "-99.9999994"},
+    ]
+
+    paths, written, skipped = write_parts(
+        records,
+        table_columns(staging_songs_table_create),
+        staging_songs_fields,
+        str(tmp_path),
+        Splitter(1),
+    )
+
+    assert (written, skipped) == (2, 6)
+    if pyarrow is None:
+        with gzip.open(paths[0], "rt") as part:
+            rows = [line.rstrip("\n").split("\t") for line in part]
+        assert [(row[1], row[9]) for row in rows] == [
+            ("45.500000", "2000"),
+            ("-99.999999", "2001"),
+        ]
@@ -0,0 +1,93 @@
+import json
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from profiler import QueryProfiler  # noqa: E402
+
+
+class FakeCursor:
+    """
+    Description: This class is responsible for standing in for a cursor
+    of a PostgreSQL database, which has no Redshift statistics.
+    """
+
+    rowcount = 10
+
+    @property
+    def connection(self):
+        return self
+
+    def cursor(self):
+        return self
+
+    def execute(self, query, vars=None):
+        pass
+
+    def fetchone(self):
+        return ("PostgreSQL 16.4",)
+
+    def close(self):
+        pass
+
+
+def write_run(report_file, process, run_id, wall_times):
+    for step, wall_time in wall_times.items():
+        record = {
+            "run_id": run_id,
+            "process": process,
+            "step": step,
+            "wall_time": wall_time,
+        }
+        report_file.write(json.dumps(record) + "\n")
+
+
+def test_write_report_flags_regressions_against_the_previous_run(tmp_path):
+    report_path = str(tmp_path / "report.jsonl")
+    with open(report_path, "w") as report_file:
+        write_run(report_file, "etl", "older", {"INSERT INTO songs": 100.0})
+        write_run(
+            report_file,
+            "etl",
+            "previous",
+            {
+                "INSERT INTO songs": 10.0,
+                "INSERT INTO users": 10.0,
+                "INSERT INTO artists": 0.2,
+            },
+        )
+        # runs of other processes are not baselines
+        write_run(report_file, "benchmark", "other", {"INSERT INTO times": 1.0})
+
+    profiler = QueryProfiler("etl", report_path, threshold=0.5, min_seconds=1.0)
+    cursor = FakeCursor()
+    # slower than the threshold, within it, too short to flag and new
+    profiler.record(cursor, "INSERT INTO songs SELECT 1", 20.0)
+    profiler.record(cursor, "INSERT INTO users SELECT 1", 14.0)
+    profiler.record(cursor, "INSERT INTO artists SELECT 1", 0.9)
+    profiler.record(cursor, "INSERT INTO times SELECT 1", 30.0)
+
+    records = profiler.write_report()
+
+    assert [
+        (record["step"], record["previous_wall_time"], record["regression"])
+        for record in records
+    ] == [
+        ("INSERT INTO songs", 10.0, True),
+        ("INSERT INTO users", 10.0, False),
+        ("INSERT INTO artists", 0.2, False),
+        ("INSERT INTO times", None, False),
+    ]
+    assert records[0]["rows"] == 10
+
+    # the run is appended, and is the baseline of the next one
+    with open(report_path) as report_file:
+        lines = [json.loads(line) for line in report_file]
+    assert [line["run_id"] for line in lines[-4:]] == [profiler.run_id] * 4
+    assert QueryProfiler("etl", report_path)._previous_run() == {
+        "INSERT INTO songs": 20.0,
+        "INSERT INTO users": 14.0,
+        "INSERT INTO artists": 0.9,
+        "INSERT INTO times": 30.0,
+    }
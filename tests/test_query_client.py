@@ -0,0 +1,95 @@
+import pytest
+
+psycopg2 = pytest.importorskip("psycopg2")
+
+import create_tables  # noqa: E402
+from query_client import QueryClient, normalize_query  # noqa: E402
+
+
+def test_normalize_query_drops_comments_spacing_and_case():
+    assert normalize_query("SELECT *\n  FROM songs -- all of them\n;") == (
+        "select * from songs"
+    )
+    assert normalize_query("select /* all */ * from SONGS;") == "select * from songs"
+
+
+def test_normalize_query_keeps_literals():
+    assert normalize_query("SELECT 'a--b' FROM songs") != normalize_query(
+        "SELECT 'a--c' FROM songs"
+    )
+    assert normalize_query("SELECT 'A /* b */' FROM songs") == (
+        "select 'A /* b */' from songs"
+    )
+    assert normalize_query('SELECT "x--y" FROM songs') == 'select "x--y" from songs'
+    assert normalize_query("SELECT a - b, c / d FROM songs") == (
+        "select a - b, c / d from songs"
+    )
+
+
+def test_query_rejects_writes(make_config, tmp_path):
+    client = QueryClient(make_config({"CACHE": {"dir": str(tmp_path / "cache")}}))
+
+    with pytest.raises(ValueError):
+        client.query("DELETE FROM songs -- SELECT")
+    assert client.metrics["misses"] == 0
+
+
+def test_query_caches_reads(make_config, postgres_db, tmp_path):
+    config_path = make_config(
+        {
+            "DB": postgres_db(),
+            "ETL": {"target": "postgres"},
+            "CACHE": {"dir": str(tmp_path / "cache")},
+        }
+    )
+    create_tables.main(config_path=config_path)
+
+    client = QueryClient(config_path)
+    try:
+        first = client.query("SELECT COUNT(*) as plays FROM songplays")
+        second = client.query("select count(*) as plays\nfrom songplays;")
+        assert first == second == (["plays"], [(0,)])
+        assert client.metrics["hits"] == 1
+    finally:
+        client.close()
+
+
+def test_query_leaves_tables_unchanged_on_writes(make_config, postgres_db, tmp_path):
+    db = postgres_db()
+    config_path = make_config(
+        {
+            "DB": db,
+            "ETL": {"target": "postgres"},
+            "CACHE": {"dir": str(tmp_path / "cache")},
+        }
+    )
+    create_tables.main(config_path=config_path)
+
+    conn = psycopg2.connect(**db)
+    conn.autocommit = True
+    conn.cursor().execute(
+        "INSERT INTO artists VALUES ('A1', 'One', NULL, NULL, NULL), "
+        "('A2', 'Two', NULL, NULL, NULL)"
+    )
+
+    client = QueryClient(config_path)
+    try:
+        # writes passing for reads, with and without a result set
+        for query in [
+            "WITH x AS (SELECT 1) DELETE FROM artists",
+            "WITH x AS (DELETE FROM artists RETURNING *) SELECT * FROM x",
+            "SELECT * INTO artists_copy FROM artists",
+        ]:
+            with pytest.raises(ValueError):
+                client.query(query)
+
+        assert client.query("SELECT COUNT(*) FROM artists")[1] == [(2,)]
+    finally:
+        client.close()
+
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM artists")
+    assert cur.fetchone() == (2,)
+    cur.execute("SELECT to_regclass('artists_copy')")
+    assert cur.fetchone() == (None,)
+    conn.close()
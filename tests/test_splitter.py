@@ -0,0 +1,56 @@
+import configparser
+import random
+
+import pytest
+
+pytest.importorskip("psycopg2")
+
+from splitter import (  # noqa: E402
+    Splitter,
+    chunk_count,
+    node_slices,
+    skew,
+    slice_bytes,
+)
+
+
+def dwh_config(node_type, num_nodes):
+    config = configparser.ConfigParser()
+    config["DWH"] = {"node_type": node_type, "num_nodes": str(num_nodes)}
+    return config
+
+
+@pytest.mark.parametrize(
+    "input_bytes, chunks",
+    [(0, 4), (1, 4), (4 * 64, 4), (5 * 64, 8), (9 * 64 - 1, 12)],
+)
+def test_chunk_count_is_a_multiple_of_the_slices(input_bytes, chunks):
+    assert chunk_count(input_bytes, 64, 4) == chunks
+
+
+def test_splitter_evens_out_rows_of_varied_sizes():
+    rng = random.Random(3)
+    sizes = [rng.choice([10, 100, 1000]) for _ in range(5000)]
+    splitter = Splitter(8)
+
+    chunks = [splitter.assign(size) for size in sizes]
+
+    assert sum(splitter.chunk_bytes) == sum(sizes)
+    assert set(chunks) == set(range(8))
+    # no chunk is more than a row larger than another
+    assert max(splitter.chunk_bytes) - min(splitter.chunk_bytes) <= max(sizes)
+    assert splitter.report(4) == slice_bytes(splitter.chunk_bytes, 4)
+
+
+def test_slice_bytes_and_skew():
+    assert slice_bytes([10, 20, 30, 40], 2) == [40, 60]
+    assert skew([40, 60]) == pytest.approx(1.2)
+    assert skew([0, 0]) == 1.0
+
+
+def test_node_slices_of_the_configured_cluster():
+    assert node_slices(dwh_config("dc2.large", 4)) == 8
+    assert node_slices(dwh_config("ra3.4xlarge", 2)) == 8
+
+    with pytest.raises(ValueError, match="dc2.huge"):
+        node_slices(dwh_config("dc2.huge", 4))
@@ -0,0 +1,182 @@
+import io
+import os
+
+import pytest
+
+from storage import ObjectCache, S3Storage
+
+
+class FailingBody(io.BytesIO):
+    """
+    Description: This class is responsible for standing in for a body
+    whose download fails after some bytes.
+    """
+
+    def read(self, size=-1):
+        if self.tell():
+            raise ConnectionError("connection reset")
+        return super().read(4)
+
+
+def put(cache, etag, size, used_at):
+    path = cache.put(etag, io.BytesIO(b"x" * size))
+    os.utime(path, (used_at, used_at))
+    return path
+
+
+def test_object_cache_hits_and_misses(tmp_path):
+    cache = ObjectCache(str(tmp_path))
+
+    assert cache.get("abcdef") is None
+    path = cache.put("abcdef", io.BytesIO(b"content"))
+    assert cache.get("abcdef") == path
+    with open(path, "rb") as cache_file:
+        assert cache_file.read() == b"content"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_object_cache_evicts_the_least_recently_used(tmp_path):
+    cache = ObjectCache(str(tmp_path), max_bytes=250)
+
+    put(cache, "aa01", 100, 1000)
+    put(cache, "bb02", 100, 2000)
+    # a hit makes the first object the most recently used
+    assert cache.get("aa01") is not None
+    put(cache, "cc03", 100, 3000)
+
+    assert cache.evictions == 1
+    assert cache.get("bb02") is None
+    assert cache.get("aa01") is not None and cache.get("cc03") is not None
+
+    # the size of a cache directory in use is counted when opened
+    reopened = ObjectCache(str(tmp_path), max_bytes=250)
+    put(reopened, "dd04", 100, 4000)
+    assert reopened.evictions == 1
+
+
+def test_object_cache_evicts_without_scanning(monkeypatch, tmp_path):
+    cache = ObjectCache(str(tmp_path), max_bytes=1000)
+
+    def entries():
+        raise AssertionError("the cache directory was scanned")
+
+    monkeypatch.setattr(cache, "_entries", entries)
+    for number in range(100):
+        cache.put("%04d" % number, io.BytesIO(b"x" * 100))
+
+    assert cache.evictions == 90
+    assert cache.get("0089") is None and cache.get("0099") is not None
+
+
+def test_object_cache_keeps_pinned_objects(tmp_path):
+    cache = ObjectCache(str(tmp_path), max_bytes=250)
+
+    pinned = cache.put("aa01", io.BytesIO(b"x" * 100), pin=True)
+    for etag in ["bb02", "cc03", "dd04"]:
+        cache.put(etag, io.BytesIO(b"x" * 100))
+
+    # the least recently used object is pinned, the next ones are evicted
+    assert os.path.exists(pinned)
+    assert cache.get("bb02") is None
+
+    cache.release(pinned)
+    cache.put("ee05", io.BytesIO(b"x" * 100))
+    assert not os.path.exists(pinned)
+
+
+def test_object_cache_removes_partial_downloads(tmp_path):
+    cache = ObjectCache(str(tmp_path))
+
+    with pytest.raises(ConnectionError):
+        cache.put("abcdef", FailingBody(b"partial content"))
+
+    assert cache.get("abcdef") is None
+    assert [
+        name for _, _, names in os.walk(str(tmp_path)) for name in names
+    ] == []
+
+
+def test_storage_fetches_once_through_the_cache(aws, tmp_path):
+    import boto3
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket="sparkify-data",
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    for key in ["song_data/A/a.json", "song_data/B/b.json", "song_data/C/c.json"]:
+        s3_client.put_object(Bucket="sparkify-data", Key=key, Body=key.encode() * 20)
+
+    storage = S3Storage(
+        s3_client, cache_dir=str(tmp_path), workers=1, cache_max_bytes=1 << 20
+    )
+    objects = storage.list_objects("s3://sparkify-data/song_data")
+
+    for _ in range(2):
+        fetched = list(storage.fetch("sparkify-data", objects))
+        for obj, path in fetched:
+            with open(path, "rb") as cache_file:
+                assert cache_file.read() == obj["key"].encode() * 20
+
+    assert (storage.cache.hits, storage.cache.misses) == (3, 3)
+
+
+def test_storage_reads_objects_fetched_ahead_of_evictions(aws, tmp_path):
+    import boto3
+
+    from loader import s3_objects
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket="sparkify-data",
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    for number in range(40):
+        key = "song_data/%02d.json" % number
+        body = key.encode().ljust(100, b"x")
+        s3_client.put_object(Bucket="sparkify-data", Key=key, Body=body)
+
+    # a cache of two objects, while sixteen are fetched ahead
+    storage = S3Storage(
+        s3_client, cache_dir=str(tmp_path), workers=4, cache_max_bytes=200
+    )
+    read = [
+        len(object_file.read())
+        for _, object_file in s3_objects(storage, "s3://sparkify-data/song_data")
+    ]
+
+    assert read == [100] * 40
+    assert storage.cache.evictions > 0
+    assert not storage.cache._pinned
+
+
+def test_storage_streams_the_bodies_without_a_cache(aws):
+    import boto3
+
+    from loader import parse_records, s3_objects
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket="sparkify-data",
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    for number in range(30):
+        body = b'{"ts": %d}\n' % number * 100
+        s3_client.put_object(
+            Bucket="sparkify-data", Key="log_data/%02d.json" % number, Body=body
+        )
+
+    storage = S3Storage(s3_client, workers=4)
+    streams = []
+
+    def objects():
+        for name, stream in s3_objects(storage, "s3://sparkify-data/log_data"):
+            streams.append(stream)
+            yield name, stream
+
+    records = list(parse_records(objects(), {}))
+
+    assert len(records) == 3000 and records[-1] == {"ts": 29}
+    # bodies, never read as a whole, closed once parsed
+    assert not any(isinstance(stream, (bytes, io.BytesIO)) for stream in streams)
+    assert all(stream._raw_stream.closed for stream in streams)
@@ -0,0 +1,66 @@
+import filecmp
+import json
+import os
+
+from synthetic import SongCatalog, _zipf_rank, write_dataset
+
+
+def read_records(data_dir, folder):
+    records = []
+    for root, _, names in sorted(os.walk(os.path.join(data_dir, folder))):
+        for name in sorted(names):
+            with open(os.path.join(root, name)) as json_file:
+                records += [json.loads(line) for line in json_file]
+    return records
+
+
+def test_write_dataset_is_the_same_for_a_seed(tmp_path):
+    first, second = str(tmp_path / "first"), str(tmp_path / "second")
+    write_dataset(first, num_events=500, days=2, songs_per_file=7, seed=5)
+    write_dataset(second, num_events=500, days=2, songs_per_file=7, seed=5)
+
+    compared = filecmp.dircmp(first, second)
+    assert compared.diff_files == [] and compared.left_only == []
+    assert read_records(first, "log_data") == read_records(second, "log_data")
+
+
+def test_played_songs_are_the_written_ones(tmp_path):
+    data_dir = str(tmp_path / "data")
+    written = write_dataset(data_dir, num_events=2000, days=3, seed=2)
+
+    songs = read_records(data_dir, "song_data")
+    events = read_records(data_dir, "log_data")
+    assert (len(songs), len(events)) == (written["songs"], written["events"])
+    assert len({song["song_id"] for song in songs}) == len(songs)
+
+    keys = {(song["title"], song["duration"], song["artist_name"]) for song in songs}
+    plays = [event for event in events if event["page"] == "NextSong"]
+    assert plays
+    assert all((play["song"], play["length"], play["artist"]) in keys for play in plays)
+    # the same artist has the same fields in each of its songs
+    artists = {song["artist_name"]: song["artist_id"] for song in songs}
+    assert len(set(artists.values())) == len(artists)
+
+
+def test_song_catalog_derives_songs_from_their_index():
+    songs = SongCatalog(seed=1, num_songs=10 ** 9, num_artists=10 ** 8, artist_skew=1.0)
+
+    song = songs[123456789]
+    assert song == songs[123456789]
+    assert song["title"] == "Song 123456789"
+    assert songs.played(123456789) == (
+        song["artist_name"],
+        song["title"],
+        song["duration"],
+    )
+
+
+def test_zipf_rank_skews_towards_the_first_items():
+    uniforms = [number / 1000 for number in range(1000)]
+
+    uniform_ranks = [_zipf_rank(u, 10, 0.0) for u in uniforms]
+    assert [uniform_ranks.count(rank) for rank in range(10)] == [100] * 10
+
+    skewed = [_zipf_rank(u, 10, 1.5) for u in uniforms]
+    counts = [skewed.count(rank) for rank in range(10)]
+    assert counts == sorted(counts, reverse=True) and counts[0] > 3 * counts[9]
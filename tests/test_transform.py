@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("pandas")
+pytest.importorskip("psycopg2")
+
+import etl  # noqa: E402
+from test_merge import load, table_rows  # noqa: E402
+from transform import TimeTransform, start_times, time_frame  # noqa: E402
+
+
+def test_time_transform_derives_each_start_time_once():
+    transform = TimeTransform()
+
+    first = transform.batch(np.array([1000.0, 1000.0, 2000.0]))
+    second = transform.batch(np.array([2000.0, 3000.0, 1000.0, 3000.0]))
+
+    # start times in epoch milliseconds
+    assert first["start_time"].astype("int64").tolist() == [1000, 2000]
+    assert second["start_time"].astype("int64").tolist() == [3000]
+    assert len(transform.batch(np.array([1000.0, 3000.0]))) == 0
+
+
+def test_time_frame_matches_extract():
+    # a Sunday, in the ISO week 52 of 2018
+    frame = time_frame(start_times([1546128000123.0]))
+
+    columns = ["hour", "day", "week", "month", "year", "weekday"]
+    assert frame.iloc[0][columns].tolist() == [0, 30, 52, 12, 2018, 0]
+
+
+def test_local_transform_matches_the_sql_times(make_config, postgres_db, data_dir):
+    sql_db, local_db = postgres_db("sql"), postgres_db("local")
+    load(make_config, sql_db, "merge", data_dir)
+    load(make_config, local_db, "merge", data_dir, local_transform="true")
+
+    query = "SELECT * FROM times"
+    assert table_rows(sql_db, query)
+    assert table_rows(local_db, query) == table_rows(sql_db, query)
+
+
+def test_local_transform_is_rejected_on_redshift(make_config):
+    config_path = make_config(
+        {"ETL": {"target": "redshift", "local_transform": "true"}}
+    )
+
+    with pytest.raises(ValueError):
+        etl.main(config_path=config_path)
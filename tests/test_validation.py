@@ -0,0 +1,303 @@
+import configparser
+import gzip
+import io
+import json
+import os
+
+import pandas as pd
+import pytest
+
+from sql_queries import (
+    staging_events_fields,
+    staging_events_table_create,
+    staging_songs_fields,
+    staging_songs_table_create,
+)
+from validation import RecordValidator, check_frame, column_checks, validate_sources
+
+song = {
+    "artist_id": "AR1",
+    "artist_latitude": 10.5,
+    "artist_location": "Here",
+    "artist_longitude": 20.5,
+    "artist_name": "One",
+    "duration": 200.5,
+    "num_songs": 1,
+    "song_id": "SO1",
+    "title": "Song",
+    "year": 2000,
+}
+
+
+def event(ts=1541105830796, **fields):
+    return {"ts": ts, "userId": "1", "page": "NextSong", **fields}
+
+
+def put_lines(s3_client, bucket, key, records):
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=key,
+        Body="".join(json.dumps(record) + "\n" for record in records).encode(),
+    )
+
+
+def read_config(path):
+    config = configparser.ConfigParser()
+    config.read(path)
+    return config
+
+
+def songs_frame(*changes):
+    """
+    Description: This function is responsible for building a frame of
+    staging_songs records, each one the valid song with some changes.
+
+    Arguments:
+        changes (dict): Changed fields of each record.
+
+    Returns:
+        DataFrame: The records, with the staging_songs columns.
+    """
+    return pd.DataFrame.from_records(
+        [{**song, **change} for change in changes], columns=staging_songs_fields
+    )
+
+
+def failed(failures):
+    return [sorted(failures.columns[row]) for row in failures.to_numpy()]
+
+
+def test_check_frame_flags_types_ranges_and_null_keys():
+    frame = songs_frame(
+        {},
+        {"artist_latitude": 95.0},
+        {"artist_longitude": "east"},
+        {"num_songs": 40000},
+        {"song_id": None},
+        {"artist_id": ""},
+        {"title": {"nested": True}},
+    )
+    failures = check_frame(
+        frame, column_checks(staging_songs_table_create), ["song_id", "artist_id"]
+    )
+
+    assert failed(failures) == [
+        [],
+        ["artist_latitude:range"],
+        ["artist_longitude:type"],
+        ["num_songs:range"],
+        ["song_id:null"],
+        ["artist_id:null"],
+        ["title:type"],
+    ]
+
+
+def test_check_frame_counts_the_bytes_of_text():
+    # VARCHAR(18) holds 18 bytes, 9 two byte characters
+    frame = songs_frame(
+        {"song_id": "é" * 9}, {"song_id": "é" * 10}, {"song_id": "x" * 19}
+    )
+    failures = check_frame(frame, column_checks(staging_songs_table_create), [])
+
+    assert failed(failures) == [[], ["song_id:length"], ["song_id:length"]]
+
+
+def test_filter_quarantines_the_rejected_records(tmp_path):
+    quarantine_path = str(tmp_path / "quarantine.jsonl")
+    validator = RecordValidator(quarantine_path, batch_rows=2)
+    records = [event(), event(ts=None), event(ts=1), event(userId="x")]
+
+    accepted = list(
+        validator.filter(
+            "staging_events",
+            staging_events_fields,
+            staging_events_table_create,
+            records,
+        )
+    )
+
+    assert accepted == [records[0]]
+    with open(quarantine_path) as quarantine:
+        lines = [json.loads(line) for line in quarantine]
+    assert [(line["reasons"], line["record"]) for line in lines] == [
+        (["ts:null"], records[1]),
+        (["ts:range"], records[2]),
+        (["userId:type"], records[3]),
+    ]
+    assert validator.stats["staging_events"] == {
+        "rows": 4,
+        "checked": 4,
+        "rejected": 3,
+        "reasons": {"ts:null": 1, "ts:range": 1, "userId:type": 1},
+    }
+
+
+def test_stream_loader_leaves_the_rejected_records_out(
+    make_config, postgres_db, tmp_path
+):
+    psycopg2 = pytest.importorskip("psycopg2")
+    from loader import stream_staging_tables
+
+    data_dir = tmp_path / "data"
+    for folder, records in [
+        ("log_data", [event(), event(ts=None), event()]),
+        ("song_data", [song, {**song, "artist_latitude": -95}]),
+    ]:
+        os.makedirs(str(data_dir / folder))
+        with open(str(data_dir / folder / "part.json"), "w") as json_file:
+            json_file.writelines(json.dumps(record) + "\n" for record in records)
+
+    db = postgres_db()
+    config = read_config(
+        make_config(
+            {
+                "DB": db,
+                "ETL": {
+                    "target": "postgres",
+                    "loader": "stream",
+                    "local_data": str(data_dir),
+                    "validate": "true",
+                    "quarantine": str(tmp_path / "quarantine.jsonl"),
+                },
+            }
+        )
+    )
+
+    conn = psycopg2.connect(**db)
+    cur = conn.cursor()
+    cur.execute(staging_events_table_create)
+    cur.execute(staging_songs_table_create)
+    loaded = stream_staging_tables(conn, config)
+
+    assert loaded == {"staging_events": 2, "staging_songs": 1}
+    cur.execute("SELECT COUNT(*) FROM staging_events WHERE ts IS NULL")
+    assert cur.fetchone() == (0,)
+    conn.close()
+
+    with open(str(tmp_path / "quarantine.jsonl")) as quarantine:
+        assert [json.loads(line)["table"] for line in quarantine] == [
+            "staging_events",
+            "staging_songs",
+        ]
+
+
+def staged_rows(s3_client, query):
+    """
+    Description: This function is responsible for counting the rows of
+    the files a prestaged COPY statement loads.
+
+    Arguments:
+        s3_client: boto3 s3 client.
+        query (str, required): COPY statement of prestaged files.
+
+    Returns:
+        int: Number of rows.
+    """
+    from prestage import pyarrow
+
+    bucket, prefix = query.split("'")[1].replace("s3://", "").split("/", 1)
+    rows = 0
+    for obj in s3_client.list_objects_v2(Bucket=bucket, Prefix=prefix)["Contents"]:
+        body = s3_client.get_object(Bucket=bucket, Key=obj["Key"])["Body"].read()
+        if pyarrow is not None:
+            rows += pyarrow.parquet.read_table(io.BytesIO(body)).num_rows
+        else:
+            rows += len(gzip.decompress(body).splitlines())
+
+    return rows
+
+
+def test_prestage_leaves_the_rejected_records_out(aws, make_config, tmp_path):
+    import boto3
+
+    from prestage import prestage_tables
+    from storage import S3Storage
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket="sparkify",
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    put_lines(s3_client, "sparkify", "log_data/a.json", [event(), event(ts=None)])
+    put_lines(
+        s3_client,
+        "sparkify",
+        "song_data/s.json",
+        [song, {**song, "song_id": None}, {**song, "song_id": "SO2"}],
+    )
+    config = read_config(
+        make_config(
+            {
+                "S3": {
+                    "log_data": "s3://sparkify/log_data",
+                    "song_data": "s3://sparkify/song_data",
+                    "staging_prefix": "s3://sparkify/staging",
+                },
+                "ETL": {
+                    "validate": "true",
+                    "quarantine": str(tmp_path / "quarantine.jsonl"),
+                },
+            }
+        )
+    )
+
+    queries, _ = prestage_tables(config, S3Storage(s3_client, workers=1), slices=2)
+
+    assert [staged_rows(s3_client, query) for query in queries] == [1, 2]
+
+
+def test_validate_sources_reads_just_the_given_objects(aws, make_config, tmp_path):
+    import boto3
+
+    from storage import S3Storage
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket="sparkify",
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    put_lines(s3_client, "sparkify", "log_data/new.json", [event()])
+    put_lines(s3_client, "sparkify", "log_data/old.json", [event(ts=None)] * 3)
+    put_lines(s3_client, "sparkify", "song_data/s.json", [song])
+
+    config = read_config(
+        make_config(
+            {
+                "S3": {
+                    "log_data": "s3://sparkify/log_data",
+                    "song_data": "s3://sparkify/song_data",
+                }
+            }
+        )
+    )
+    storage = S3Storage(s3_client, workers=1)
+    listed = []
+    list_objects = storage.list_objects
+    storage.list_objects = lambda uri: listed.append(uri) or list_objects(uri)
+
+    new = [obj for obj in list_objects("s3://sparkify/log_data") if "new" in obj["key"]]
+    validator = RecordValidator(str(tmp_path / "quarantine.jsonl"))
+    stats = validate_sources(
+        validator, config, storage, {"s3://sparkify/log_data": new}
+    )
+
+    # the log_data objects were given, song_data is listed as a whole
+    assert listed == ["s3://sparkify/song_data"]
+    events = stats["staging_events"]
+    assert (events["rows"], events["rejected"]) == (1, 0)
+    assert stats["staging_songs"]["rows"] == 1
+
+    # with a sample rate, the records of the sampled files are all checked
+    for number in range(20):
+        put_lines(s3_client, "sparkify", "log_data/%02d.json" % number, [event()] * 5)
+    validator = RecordValidator(str(tmp_path / "sampled.jsonl"), sample=0.5, seed=1)
+    events = validate_sources(validator, config, storage)["staging_events"]
+    assert events["rows"] == events["checked"] > 0
+
+
+def test_sample_objects_samples_at_the_rate():
+    objects = [{"key": "%02d.json" % number} for number in range(10)]
+
+    assert len(RecordValidator("q.jsonl", sample=0.3).sample_objects(objects)) == 3
+    assert len(RecordValidator("q.jsonl", sample=0.01).sample_objects(objects)) == 1
+    assert RecordValidator("q.jsonl").sample_objects(objects) == objects
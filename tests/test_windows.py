@@ -0,0 +1,89 @@
+import json
+from datetime import date
+
+import pytest
+
+from sql_queries import (
+    merge_table_queries,
+    songplay_table_insert,
+    songplay_table_merge,
+    time_table_merge,
+    windowed,
+)
+from windows import split_windows, window_manifests
+
+
+def test_split_windows_covers_the_range():
+    assert split_windows(date(2018, 11, 1), date(2018, 11, 7), days=3) == [
+        (date(2018, 11, 1), date(2018, 11, 3)),
+        (date(2018, 11, 4), date(2018, 11, 6)),
+        (date(2018, 11, 7), date(2018, 11, 7)),
+    ]
+    assert split_windows(date(2018, 11, 1), date(2018, 11, 1)) == [
+        (date(2018, 11, 1), date(2018, 11, 1))
+    ]
+
+
+@pytest.mark.parametrize("days", [0, -1])
+def test_split_windows_rejects_empty_windows(days):
+    with pytest.raises(ValueError):
+        split_windows(date(2018, 11, 1), date(2018, 11, 7), days=days)
+
+
+def test_split_windows_rejects_reversed_ranges():
+    with pytest.raises(ValueError):
+        split_windows(date(2018, 11, 7), date(2018, 11, 1))
+
+
+def test_window_manifests_deal_objects_by_day(aws):
+    import boto3
+
+    from storage import S3Storage
+
+    s3_client = boto3.client("s3")
+    s3_client.create_bucket(
+        Bucket="sparkify",
+        CreateBucketConfiguration={"LocationConstraint": "us-west-2"},
+    )
+    for day in [1, 2, 5]:
+        s3_client.put_object(
+            Bucket="sparkify",
+            Key="log_data/2018/11/2018-11-%02d-events.json" % day,
+            Body=b'{"ts": 1}\n',
+        )
+
+    windows = split_windows(date(2018, 11, 1), date(2018, 11, 6), days=2)
+    manifests = window_manifests(
+        S3Storage(s3_client, workers=2),
+        "s3://sparkify/log_data",
+        windows,
+        "s3://sparkify/manifests",
+    )
+
+    # the window of days 3 and 4 has no objects
+    assert [window for window, _, _ in manifests] == [windows[0], windows[2]]
+    body = s3_client.get_object(
+        Bucket="sparkify", Key=manifests[0][1].replace("s3://sparkify/", "")
+    )["Body"].read()
+    entries = sorted(entry["url"] for entry in json.loads(body)["entries"])
+    assert entries == [
+        "s3://sparkify/%s" % obj["key"] for obj in manifests[0][2]
+    ] == [
+        "s3://sparkify/log_data/2018/11/2018-11-01-events.json",
+        "s3://sparkify/log_data/2018/11/2018-11-02-events.json",
+    ]
+
+    assert window_manifests(None, "s3://sparkify/log_data", [], "") == []
+
+
+@pytest.mark.parametrize("query", [songplay_table_insert, songplay_table_merge])
+def test_windowed_songplays_read_the_window_events(query):
+    query = windowed(query)
+    assert "window_events_keyed" in query
+    assert "staging_events" not in query
+
+
+def test_merged_times_do_not_read_the_staged_events():
+    # merged once all windows are done, out of their sessions
+    assert "staging_events" not in time_table_merge
+    assert time_table_merge in merge_table_queries
@@ -0,0 +1,172 @@
+import io
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+from sql_queries import staging_ts_select, times_local_create, times_local_insert
+
+# columns of the times dimension, in the table order
+time_columns = ["start_time", "hour", "day", "week", "month", "year", "weekday"]
+
+
+def start_times(ts):
+    """
+    Description: This function is responsible for converting epoch
+    milliseconds into timestamps at once, as TIMESTAMP 'epoch' +
+    ts / 1000 * interval '1 second' does row by row.
+
+    Arguments:
+        ts (array, required): Epoch milliseconds.
+
+    Returns:
+        ndarray: datetime64[ms] start times.
+    """
+    milliseconds = np.asarray(ts, dtype="float64").round().astype("int64")
+    return milliseconds.astype("datetime64[ms]")
+
+
+def time_frame(start_time):
+    """
+    Description: This function is responsible for deriving the times
+    dimension columns of start times at once, with the semantics of
+    extract() on the database: ISO week and weekday from 0 (Sunday).
+
+    Arguments:
+        start_time (ndarray, required): datetime64 start times.
+
+    Returns:
+        DataFrame: The times rows, in the table columns order.
+    """
+    index = pd.DatetimeIndex(start_time)
+
+    return pd.DataFrame(
+        {
+            "start_time": index,
+            "hour": index.hour,
+            "day": index.day,
+            "week": index.isocalendar().week.to_numpy(),
+            "month": index.month,
+            "year": index.year,
+            "weekday": (index.dayofweek + 1) % 7,
+        },
+        columns=time_columns,
+    )
+
+
+def copy_buffer(frame):
+    """
+    Description: This function is responsible for writing rows in the
+    PostgreSQL COPY text format.
+
+    Arguments:
+        frame (DataFrame, required): Rows without NULL values.
+
+    Returns:
+        StringIO: The COPY ready buffer.
+    """
+    buffer = io.StringIO()
+    frame.to_csv(
+        buffer,
+        sep="\t",
+        header=False,
+        index=False,
+        date_format="%Y-%m-%d %H:%M:%S.%f",
+    )
+    buffer.seek(0)
+
+    return buffer
+
+
+class TimeTransform:
+    """
+    Description: This class is responsible for deriving the times rows of
+    batches of ts, each start time just once: start times are deduplicated
+    within a batch and against the ones of the previous batches, kept in
+    an array compared at once with np.isin.
+    """
+
+    def __init__(self):
+        """
+        Description: This function is responsible for starting
+        with no start time seen.
+
+        Arguments:
+            None
+
+        Returns:
+            None
+        """
+        self._seen = np.empty(0, dtype="int64")
+
+    def batch(self, ts):
+        """
+        Description: This function is responsible for deriving the times
+        rows of the start times of a batch not seen before.
+
+        Arguments:
+            ts (array, required): Epoch milliseconds.
+
+        Returns:
+            DataFrame: The new times rows.
+        """
+        milliseconds = pd.unique(start_times(ts).astype("int64"))
+
+        fresh = milliseconds[~np.isin(milliseconds, self._seen, assume_unique=True)]
+        self._seen = np.concatenate([self._seen, fresh])
+
+        return time_frame(fresh.astype("datetime64[ms]"))
+
+
+def load_times(cur, conn, target="times", batch_rows=100000):
+    """
+    Description: This function is responsible for loading the times
+    dimension from the staged events, deriving its columns out of the
+    database in columnar batches, pushing the new start times to a
+    temporary table through COPY FROM STDIN and inserting the ones the
+    target table does not hold yet. The ts are read through a server
+    side cursor, so just a batch of them is held in memory at once.
+
+    Arguments:
+        cur: the cursor object (psycopg2 cursor supporting copy_expert).
+        conn: connection to the database.
+        target (str, optional): Target table, with the times columns.
+        batch_rows (int, optional): ts read and derived at once.
+
+    Returns:
+        int: Number of inserted rows.
+    """
+    start = time.perf_counter()
+    transform = TimeTransform()
+
+    cur.execute(times_local_create)
+    read_cur = conn.cursor(name="staging_ts")
+    read_cur.execute(staging_ts_select)
+
+    staged = 0
+    while True:
+        rows = read_cur.fetchmany(batch_rows)
+        if not rows:
+            break
+
+        ts = np.fromiter((float(row[0]) for row in rows), dtype="float64")
+        frame = transform.batch(ts)
+        if len(frame):
+            cur.copy_expert(
+                "COPY times_local (%s) FROM STDIN" % ", ".join(time_columns),
+                copy_buffer(frame),
+            )
+            staged += len(frame)
+
+    read_cur.close()
+    cur.execute(times_local_insert.format(target))
+    inserted = cur.rowcount
+    conn.commit()
+
+    logging.info(
+        "Transform: %d distinct start times derived, %d inserted into %s in %.2fs."
+        % (staged, inserted, target, time.perf_counter() - start)
+    )
+
+    return inserted
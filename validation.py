@@ -0,0 +1,365 @@
+import json
+import logging
+import random
+import time
+
+import numpy as np
+import pandas as pd
+
+from loader import parse_records, s3_objects, staging_sources, table_columns
+
+# bounds of the integer types
+_integer_bounds = {
+    "SMALLINT": (-(2**15), 2**15 - 1),
+    "INTEGER": (-(2**31), 2**31 - 1),
+    "BIGINT": (-(2**63), 2**63 - 1),
+}
+_decimal_types = {"NUMERIC", "DECIMAL"}
+_float_types = {"REAL", "DOUBLE"}
+_text_types = {"VARCHAR", "CHAR"}
+
+# bytes of a VARCHAR declared without length
+_default_varchar = 256
+
+# columns that can not be NULL and domain bounds of some columns
+key_columns = {
+    "staging_events": ["ts"],
+    "staging_songs": ["song_id", "artist_id"],
+}
+value_bounds = {
+    # epoch milliseconds, from 2000-01-01 to the end of 2100
+    "ts": (946684800000, 4133980800000),
+    "artist_latitude": (-90, 90),
+    "artist_longitude": (-180, 180),
+}
+
+
+def column_checks(create_query):
+    """
+    Description: This function is responsible for deriving the checks of
+    each column of a staging table definition: its type and, for numeric
+    columns, the bounds of the type (or of the precision and scale), for
+    text columns, the maximum number of bytes.
+
+    Arguments:
+        create_query (str, required): CREATE TABLE statement.
+
+    Returns:
+        list: (column name, kind ('number' or 'text'), bounds or None,
+        maximum bytes or None) tuples, in the table order.
+    """
+    checks = []
+    for name, sql_type, precision, scale in table_columns(create_query):
+        bounds = value_bounds.get(name)
+        if sql_type in _integer_bounds:
+            checks.append((name, "number", bounds or _integer_bounds[sql_type], None))
+        elif sql_type in _decimal_types:
+            limit = 10 ** ((precision or 18) - (scale or 0))
+            checks.append((name, "number", bounds or (-limit, limit), None))
+        elif sql_type in _float_types:
+            checks.append((name, "number", bounds, None))
+        elif sql_type in _text_types:
+            checks.append((name, "text", None, precision or _default_varchar))
+
+    return checks
+
+
+def _is_nested(value):
+    """
+    Description: This function is responsible for telling whether a JSON
+    value is an object or an array, which can not be loaded to a column.
+
+    Arguments:
+        value: the JSON value.
+
+    Returns:
+        bool: True for objects and arrays.
+    """
+    return isinstance(value, (dict, list))
+
+
+def check_frame(frame, checks, keys):
+    """
+    Description: This function is responsible for checking a batch of
+    records at once, column by column: values not matching the column
+    type, out of bounds, longer than the column and NULL keys.
+
+    Arguments:
+        frame (DataFrame, required): Records, with a column per check.
+        checks (list, required): Column checks, as returned by column_checks.
+        keys (list, required): Columns that can not be NULL.
+
+    Returns:
+        DataFrame: A boolean column per failed check (e.g. 'ts:range'),
+        True for the rows failing it.
+    """
+    failures = {}
+    for name, kind, bounds, max_bytes in checks:
+        values = frame[name]
+        present = values.notna() & (values != "")
+
+        if kind == "number":
+            numbers = pd.to_numeric(values.where(present), errors="coerce")
+            failures[name + ":type"] = present & numbers.isna()
+            if bounds is not None:
+                low, high = bounds
+                failures[name + ":range"] = (numbers < low) | (numbers > high)
+        else:
+            # .str.len() also measures objects and arrays, so just text is
+            # measured (NaN for NULL values and values that are not text)
+            is_text = values.map(type, na_action="ignore") == str
+            try:
+                lengths = values.where(is_text).str.len()
+            except AttributeError:
+                lengths = pd.Series(np.nan, index=values.index)
+
+            # just the few values that are not text are inspected one by one
+            not_text = present & ~is_text
+            failures[name + ":type"] = not_text & values.where(not_text).map(
+                _is_nested, na_action="ignore"
+            ).fillna(False).astype(bool)
+
+            # a character takes up to 4 bytes, just longer values are encoded
+            long = (lengths > max_bytes // 4).fillna(False).astype(bool)
+            too_long = pd.Series(False, index=values.index)
+            if long.any():
+                too_long[long] = (
+                    values[long].str.encode("utf-8").str.len() > max_bytes
+                ).to_numpy()
+            failures[name + ":length"] = too_long
+
+    for name in keys:
+        values = frame[name]
+        failures[name + ":null"] = values.isna() | (values == "")
+
+    return pd.DataFrame(failures, index=frame.index).fillna(False).astype(bool)
+
+
+class RecordValidator:
+    """
+    Description: This class is responsible for checking the records of the
+    staging tables before they are loaded, in batches checked at once with
+    pandas. Rejected records are written with the failed checks to a JSON
+    lines quarantine file. Just a sample of the records is checked when
+    the sample rate is below 1.
+    """
+
+    def __init__(self, quarantine_path, sample=1.0, batch_rows=50000, seed=None):
+        """
+        Description: This function is responsible for setting the
+        quarantine file, the sample rate and the batch size.
+
+        Arguments:
+            quarantine_path (str, required): JSON lines quarantine file path.
+            sample (float, optional): Rate of the records checked.
+            batch_rows (int, optional): Records checked at once.
+            seed (int, optional): Seed of the sampling.
+
+        Returns:
+            None
+        """
+        self.quarantine_path = quarantine_path
+        self.sample = sample
+        self.batch_rows = batch_rows
+        self.stats = {}
+
+        self._random = random.Random(seed)
+
+    def sample_objects(self, objects):
+        """
+        Description: This function is responsible for sampling the objects
+        of a source at the sample rate, at least one, for checks reading
+        whole files.
+
+        Arguments:
+            objects (list, required): Objects listed by the storage.
+
+        Returns:
+            list: The sampled objects.
+        """
+        if self.sample >= 1.0 or not objects:
+            return objects
+
+        count = max(1, int(len(objects) * self.sample))
+        return self._random.sample(objects, count)
+
+    def _check_batch(
+        self, table, batch, fields, columns, checks, keys, quarantine, sample
+    ):
+        """
+        Description: This function is responsible for checking a batch of
+        records, quarantining the rejected ones.
+
+        Arguments:
+            table (str, required): Staging table.
+            batch (list, required): JSON records.
+            fields (list, required): JSON fields, in the columns order.
+            columns (list, required): Column names of the table.
+            checks (list, required): Column checks of the table.
+            keys (list, required): Columns that can not be NULL.
+            quarantine: the open quarantine file.
+            sample (float, required): Rate of the records checked.
+
+        Returns:
+            list: The accepted records.
+        """
+        stats = self.stats[table]
+        stats["rows"] += len(batch)
+
+        if sample < 1.0:
+            checked = [self._random.random() < sample for _ in batch]
+            sampled = [record for record, check in zip(batch, checked) if check]
+        else:
+            checked, sampled = [True] * len(batch), batch
+        stats["checked"] += len(sampled)
+        if not sampled:
+            return batch
+
+        # the fields are loaded to the columns in the jsonpaths order
+        frame = pd.DataFrame.from_records(sampled, columns=fields)
+        frame.columns = columns[: len(fields)]
+        failures = check_frame(frame, checks, keys)
+        rejected = failures.any(axis=1).to_numpy()
+
+        for position in np.flatnonzero(rejected):
+            reasons = list(failures.columns[failures.iloc[position].to_numpy()])
+            for reason in reasons:
+                stats["reasons"][reason] = stats["reasons"].get(reason, 0) + 1
+            quarantine.write(
+                json.dumps(
+                    {"table": table, "reasons": reasons, "record": sampled[position]}
+                )
+                + "\n"
+            )
+        stats["rejected"] += int(rejected.sum())
+
+        accepted = iter(~rejected)
+        return [
+            record
+            for record, check in zip(batch, checked)
+            if not check or next(accepted)
+        ]
+
+    def filter(self, table, fields, create_query, records, sample=None):
+        """
+        Description: This function is responsible for checking the records
+        of a staging table in batches, yielding just the accepted ones.
+
+        Arguments:
+            table (str, required): Staging table.
+            fields (list, required): JSON fields, in the columns order.
+            create_query (str, required): CREATE TABLE statement of the table.
+            records (iterable, required): JSON records.
+            sample (float, optional): Rate of the records checked (default:
+            the sample rate of the validator, 1 for already sampled files).
+
+        Returns:
+            generator: The accepted records.
+        """
+        sample = self.sample if sample is None else sample
+        columns = [name for name, _, _, _ in table_columns(create_query)]
+        checks = [
+            check for check in column_checks(create_query)
+            if columns.index(check[0]) < len(fields)
+        ]
+        keys = key_columns.get(table, [])
+        self.stats[table] = {"rows": 0, "checked": 0, "rejected": 0, "reasons": {}}
+
+        elapsed = 0.0
+        with open(self.quarantine_path, "a") as quarantine:
+            batch = []
+            for record in records:
+                batch.append(record)
+                if len(batch) < self.batch_rows:
+                    continue
+
+                start = time.perf_counter()
+                accepted = self._check_batch(
+                    table, batch, fields, columns, checks, keys, quarantine, sample
+                )
+                elapsed += time.perf_counter() - start
+                batch = []
+                yield from accepted
+
+            if batch:
+                start = time.perf_counter()
+                accepted = self._check_batch(
+                    table, batch, fields, columns, checks, keys, quarantine, sample
+                )
+                elapsed += time.perf_counter() - start
+                yield from accepted
+
+        stats = self.stats[table]
+        logging.info(
+            "Validation: %d of %d checked rows of %s rejected (%.0f rows/s)."
+            % (
+                stats["rejected"],
+                stats["checked"],
+                table,
+                stats["checked"] / elapsed if elapsed else 0.0,
+            )
+        )
+        for reason, count in sorted(stats["reasons"].items()):
+            logging.warning(
+                "Validation: %d rows of %s failed %s." % (count, table, reason)
+            )
+
+
+def validate_sources(validator, config, storage, objects=None):
+    """
+    Description: This function is responsible for checking the JSON files
+    the COPY statements are going to load, before they run: the objects
+    given for a source (e.g. the new files of an incremental manifest) or,
+    for the sources not given, every file under the '[S3]' log_data and
+    song_data uris. As COPY loads the files as they are, the rejected
+    records are just quarantined and reported. With a sample rate below 1,
+    just a sample of the objects is read.
+
+    Arguments:
+        validator (RecordValidator, required): Validator of the records.
+        config: the loaded configurations.
+        storage (S3Storage, required): S3 access layer.
+        objects (dict, optional): Objects to be loaded by source uri.
+
+    Returns:
+        dict: The validation statistics by staging table.
+    """
+    sources = {
+        "staging_events": config["S3"]["LOG_DATA"],
+        "staging_songs": config["S3"]["SONG_DATA"],
+    }
+    objects = objects or {}
+
+    for table, _, fields, create_query in staging_sources:
+        uri = sources[table]
+        source_objects = objects.get(uri)
+        if source_objects is None:
+            source_objects = storage.list_objects(uri)
+        # the files are sampled, so every record of them is checked
+        source_objects = validator.sample_objects(source_objects)
+
+        rejected = {}
+        records = parse_records(s3_objects(storage, uri, source_objects), rejected)
+        for _ in validator.filter(table, fields, create_query, records, sample=1.0):
+            pass
+
+    return validator.stats
+
+
+def validator_from_config(config):
+    """
+    Description: This function is responsible for creating a record
+    validator from the 'ETL' configurations.
+
+    Arguments:
+        config: the loaded configurations.
+
+    Returns:
+        RecordValidator: The validator, or None when validation is off.
+    """
+    if not config["ETL"].getboolean("VALIDATE"):
+        return None
+
+    return RecordValidator(
+        config["ETL"]["QUARANTINE"], sample=float(config["ETL"]["VALIDATE_SAMPLE"])
+    )
@@ -0,0 +1,153 @@
+import logging
+import re
+import uuid
+from datetime import date, timedelta
+
+from manifest import build_manifest, upload_manifest
+from storage import parse_s3_uri
+
+# log_data/YYYY/MM/YYYY-MM-DD-events.json
+_partition = re.compile(r"(\d{4})/(\d{2})/(?:[^/]*?(\d{4})-(\d{2})-(\d{2}))?")
+
+
+def partition_date(key):
+    """
+    Description: This function is responsible for reading the date of a
+    log_data key from its partition (YYYY/MM) and its file name
+    (YYYY-MM-DD-events.json). Files not named by day are dated on the
+    first day of the month.
+
+    Arguments:
+        key (str, required): Object key.
+
+    Returns:
+        date: The partition date, or None when the key is not partitioned.
+    """
+    match = _partition.search(key)
+    if match is None:
+        return None
+
+    year, month, day_year, day_month, day = match.groups()
+    if day is not None:
+        return date(int(day_year), int(day_month), int(day))
+
+    return date(int(year), int(month), 1)
+
+
+def split_windows(start, end, days=1):
+    """
+    Description: This function is responsible for splitting a date
+    range into windows of some days.
+
+    Arguments:
+        start (date, required): First day of the range.
+        end (date, required): Last day of the range (included).
+        days (int, optional): Days of each window (at least 1).
+
+    Returns:
+        list: (first day, last day) tuples of the windows.
+    """
+    if days < 1:
+        raise ValueError("Windows must have at least 1 day, not %d." % days)
+    if start > end:
+        raise ValueError("The range starts (%s) after it ends (%s)." % (start, end))
+
+    windows = []
+    while start <= end:
+        last = min(end, start + timedelta(days=days - 1))
+        windows.append((start, last))
+        start = last + timedelta(days=1)
+
+    return windows
+
+
+def month_uris(uri, start, end):
+    """
+    Description: This function is responsible for listing the
+    month partitions (uri/YYYY/MM) of a date range.
+
+    Arguments:
+        uri (str, required): S3 uri of the partitioned data.
+        start (date, required): First day of the range.
+        end (date, required): Last day of the range (included).
+
+    Returns:
+        list: The month partition uris.
+    """
+    uris = []
+    month = date(start.year, start.month, 1)
+    while month <= end:
+        uris.append("%s/%04d/%02d/" % (uri.rstrip("/"), month.year, month.month))
+        month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+
+    return uris
+
+
+def window_name(window):
+    """
+    Description: This function is responsible for naming a window.
+
+    Arguments:
+        window (tuple, required): (first day, last day) of the window.
+
+    Returns:
+        str: The window name (e.g. 'window 2018-11-01..2018-11-07').
+    """
+    first, last = window
+    if first == last:
+        return "window %s" % first.isoformat()
+
+    return "window %s..%s" % (first.isoformat(), last.isoformat())
+
+
+def window_manifests(storage, uri, windows, manifest_prefix):
+    """
+    Description: This function is responsible for listing just the month
+    partitions of the windows, dealing the objects to the windows by their
+    date and uploading a COPY manifest for each window with objects.
+
+    Arguments:
+        storage (S3Storage, required): S3 access layer.
+        uri (str, required): S3 uri of the partitioned data (log_data).
+        windows (list, required): (first day, last day) tuples.
+        manifest_prefix (str, required): S3 uri where manifests are stored.
+
+    Returns:
+        list: (window, manifest uri, objects of the window) tuples, in the
+        windows order.
+    """
+    if not windows:
+        return []
+
+    start, end = windows[0][0], windows[-1][1]
+    dated = [
+        (partition_date(obj["key"]), obj)
+        for month_uri in month_uris(uri, start, end)
+        for obj in storage.list_objects(month_uri)
+    ]
+
+    bucket, _ = parse_s3_uri(uri)
+    run_id = uuid.uuid4().hex[:13]
+
+    manifests = []
+    for window in windows:
+        first, last = window
+        window_objects = [
+            obj for day, obj in dated if day is not None and first <= day <= last
+        ]
+        if not window_objects:
+            logging.info("%s: no objects, skipped." % window_name(window))
+            continue
+
+        manifest_uri = "%s/%s/%s.manifest" % (
+            manifest_prefix.rstrip("/"),
+            run_id,
+            first.isoformat(),
+        )
+        upload_manifest(
+            storage.s3_client, manifest_uri, build_manifest(bucket, window_objects)
+        )
+        logging.info("%s: %d objects." % (window_name(window), len(window_objects)))
+        manifests.append((window, manifest_uri, window_objects))
+
+    return manifests